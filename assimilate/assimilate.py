@@ -18,8 +18,10 @@
 
 # Imports {{{1
 import errno
+import json
 import os
 import sys
+from contextlib import contextmanager
 import arrow
 from inform import (
     Color,
@@ -41,12 +43,14 @@ from inform import (
     join,
     log,
     narrate,
+    os_error,
     plural,
     render,
     warn,
 )
 from ntlog import NTlog
 from .collection import Collection, split_lines
+from .connections import add_ssh_options, share_connections
 from .configs import (
     ASSIMILATE_SETTINGS,
     BORG_SETTINGS,
@@ -56,6 +60,7 @@ from .configs import (
     read_settings,
     report_setting_error
 )
+from .events import EventLog, redact
 from .hooks import Hooks
 from .patterns import (
     check_excludes,
@@ -65,18 +70,21 @@ from .patterns import (
     check_roots,
 )
 from .preferences import (
+    ARCHIVES_FILE,
     BORG,
     CONFIG_DIR,
     DATA_DIR,
     DATE_FILE,
     DEFAULT_ENCRYPTION,
     DEFAULT_TIME_FORMAT,
+    EVENT_LOG_FILE,
     INITIAL_CACHE_CONFIG_FILE_CONTENTS,
     INITIAL_HOME_CONFIG_FILE_CONTENTS,
     INITIAL_ROOT_CONFIG_FILE_CONTENTS,
     INITIAL_SHARED_SETTINGS_FILE_CONTENTS,
     LOCK_FILE,
     LOG_FILE,
+    MOUNT_CACHE_DIR,
     PROGRAM_NAME,
     SHARED_SETTINGS_FILE,
 )
@@ -84,7 +92,7 @@ from . import overdue
     # unused here, but needed so that overdue extensions to settings file are
     # added before the files are read
 from .utilities import (
-    getfullhostname, gethostname, getusername, output,
+    getfullhostname, gethostname, getusername, output, update_latest,
     Cmd, Run, cd, cwd, render_command, set_shlib_prefs, to_path,
 )
 import nestedtext as nt
@@ -92,6 +100,10 @@ import re
 
 # Globals {{{1
 borg_commands_with_dryrun = "compact create delete extract prune upgrade recreate undelete".split()
+borg_commands_that_change_archives = "compact create delete prune recreate rename repo-create repo-delete tag undelete".split()
+borg_commands_with_history = "check compact create prune".split()
+commands_that_reuse_mounts = "compare".split()
+    # other commands that require exclusivity unmount the archives they leave
 now_pattern = r'{{(now|utcnow)(:[^}]*)?}}'
 now_matcher = re.compile(now_pattern)
 
@@ -265,8 +277,14 @@ class Assimilate:
         self.check()
         if self.encoding:
             set_shlib_prefs(encoding=self.encoding)
+        self.events = EventLog()
+            # the event log is opened on entry, events before then are discarded
         self.hooks = Hooks(self, dry_run='dry-run' in assimilate_opts)
         self.borg_ran = False
+        self.status_store = None
+        self.exit_status = None
+            # set by the caller once the command has run, it is recorded in the
+            # event log
 
         # set time format
         self.time_format = self.value('time_format', DEFAULT_TIME_FORMAT)
@@ -391,6 +409,7 @@ class Assimilate:
             msg = msg.decode('ascii', errors='replace')
         except AttributeError:
             pass
+        self.record_event("error", message=msg)
         try:
             if self.notify and not Color.isTTY():
                 to_run = ["mail", "-s", f"{PROGRAM_NAME} failed on {username}@{hostname}"]
@@ -625,18 +644,6 @@ class Assimilate:
                     raise Error("passphrase not specified.")
                 borg_opts.append(f"--encryption={encryption}")
 
-        if (
-            cmd in ["create"]
-            and not assimilate_opts.get("dry-run")
-            and not ("--list" in borg_opts or "--progress" in borg_opts)
-        ):
-            # By default we ask for stats to go in the log file.  However if
-            # opts contains --list, then the stats will be displayed to user
-            # rather than going to logfile, in this case, do not request stats
-            # automatically, require user to do it manually.
-            if '--stats' not in borg_opts:
-                borg_opts.append("--stats")
-
         # add the borg command line options appropriate to this command {{{3
         for name, attrs in BORG_SETTINGS.items():
             if strip_archive_matcher and name == "match_archives":
@@ -736,6 +743,8 @@ class Assimilate:
         show_borg_output=None,
         use_working_dir=False,
         show_progress=False,
+        process_stdout=False,
+        publish_progress=False,
     ):
         assimilate_opts = assimilate_opts or {}
 
@@ -746,12 +755,24 @@ class Assimilate:
         self.publish_passcode()
         if "BORG_PASSPHRASE" in os.environ:
             os.environ["BORG_DISPLAY_PASSPHRASE"] = "no"
-        if self.ssh_command:
-            os.environ["BORG_RSH"] = self.ssh_command
+        ssh_command = self.ssh_command
+        if self.share_ssh_connections:
+            ssh_command = add_ssh_options(
+                ssh_command or os.environ.get("BORG_RSH", "ssh")
+            )
+        if ssh_command:
+            os.environ["BORG_RSH"] = ssh_command
         environ = {k: v for k, v in os.environ.items() if k.startswith("BORG_")}
         if "BORG_PASSPHRASE" in environ:
             environ["BORG_PASSPHRASE"] = "❬redacted❭"
         executable = to_path(self.value("borg_executable", BORG))
+        monitor_progress = (
+            borg_opts and "--progress" in borg_opts
+            and not show_progress and not process_stdout
+        )
+        if monitor_progress and "--log-json" not in borg_opts:
+            # borg reports its progress in JSON, which is rendered by assimilate
+            borg_opts = borg_opts + ["--log-json"]
         borg_opts = self.borg_options(
             cmd, borg_opts, assimilate_opts, strip_archive_matcher
         )
@@ -766,12 +787,20 @@ class Assimilate:
                     "Is ssh-agent running?",
                 )
 
+        # the list of archives is about to change
+        if (
+            cmd in borg_commands_that_change_archives
+            and not assimilate_opts.get("dry-run")
+        ):
+            self.invalidate_archive_cache()
+
         # run the command
         with cd(self.working_dir if use_working_dir else "."):
             narrate("running in:", cwd())
+            json_output = "--json" in command or "--json-lines" in command
             if show_borg_output is False:
                 narrating = False
-            elif "--json" in command or "--json-lines" in command:
+            elif json_output and show_borg_output is None:
                 narrating = False
             else:
                 narrating = (
@@ -782,11 +811,22 @@ class Assimilate:
                     or assimilate_opts.get("verbose")
                     or assimilate_opts.get("narrate")
                 )
+            if monitor_progress:
+                # the monitor outputs borg's messages if they would be shown
+                from .progress import ProgressMonitor
+                show_progress = ProgressMonitor(
+                    cmd,
+                    expected_size = self.get_expected_size() if cmd == "create" else None,
+                    echo = bool(narrating),
+                    publish = self.hooks.report_progress if publish_progress else None,
+                )
+                narrating = False
             if narrating:
-                modes = "soeW1"
+                # json output is captured so that it can be processed
+                modes = "sOeW1" if json_output else "soeW1"
             else:
                 modes = "sOEW1"
-            if show_progress:
+            if show_progress or process_stdout:
                 modes = modes.replace('W', 'w')
             narrate(
                 "running:\n{}".format(
@@ -795,13 +835,63 @@ class Assimilate:
             )
             starts_at = arrow.now()
             log("starts at: {!s}".format(starts_at))
+            processing_error = None
+            borg_error = None
+            stderr_lines = []
             try:
                 borg = Cmd(command, modes=modes, env=os.environ, log=False)
                 borg.run(stdin="")
-                if show_progress:
+                if process_stdout:
+                    # consume stdout as it is produced rather than waiting
+                    # for borg to terminate and then holding all of it;
+                    # stderr, if captured, is drained in a thread so that borg
+                    # cannot block writing to it while stdout is being consumed
+                    drain = None
+                    if borg.process.stderr is not None:
+                        import threading
+                        drain = threading.Thread(
+                            target = lambda: stderr_lines.extend(
+                                line.decode(errors="replace")
+                                for line in borg.process.stderr
+                            ),
+                            daemon = True,
+                        )
+                        drain.start()
+                    processed = False
+                    try:
+                        borg.from_process_stdout = process_stdout(borg.process.stdout)
+                        processed = True
+                    except Error as e:
+                        # the problem is in processing the output, not in borg
+                        processing_error = e
+                    finally:
+                        if not processed:
+                            # whatever went wrong, borg must not be left
+                            # running with nobody reading its output
+                            borg.kill()
+                        if drain:
+                            drain.join()
+                            borg.stderr = "".join(stderr_lines)
+                    if processed:
+                        borg.wait()
+                        if drain:
+                            # wait() replaces stderr with what remained unread
+                            borg.stderr = "".join(stderr_lines)
+                elif show_progress:
                     borg.from_show_progress = show_progress(borg.process.stderr)
                     borg.wait()
+                    if monitor_progress and not show_progress.echo:
+                        borg.stderr = "\n".join(show_progress.messages)
             except Error as e:
+                if monitor_progress and not e.stderr and show_progress.messages:
+                    # the monitor consumed the messages that describe the error
+                    stderr = "\n".join(show_progress.messages)
+                    e.kwargs.update(msg=stderr, stderr=stderr)
+                elif stderr_lines and not e.stderr:
+                    # the drain consumed the messages that describe the error
+                    stderr = "".join(stderr_lines).rstrip()
+                    e.kwargs.update(msg=stderr, stderr=stderr)
+                borg_error = e
                 self.report_borg_error(e, cmd)
             except KeyboardInterrupt:
                 borg.kill()
@@ -815,11 +905,37 @@ class Assimilate:
                 ends_at = arrow.now()
                 log("ends at: {!s}".format(ends_at))
                 log("elapsed: {!s}".format(ends_at - starts_at))
+                self.record_borg_event(
+                    cmd, command, starts_at, ends_at,
+                    borg_error.status if borg_error else borg.status,
+                )
+
+                # record failures in the history, successes are recorded by
+                # the command once it has processed the output of borg
+                if (
+                    borg_error
+                    and cmd in borg_commands_with_history
+                    and not assimilate_opts.get("dry-run")
+                ):
+                    self.add_run(
+                        cmd, starts_at, ends_at, borg_error.status, False
+                    )
+        borg.starts_at = starts_at
+        borg.ends_at = ends_at
+        if processing_error:
+            if borg.stderr:
+                narrate("Borg stderr:")
+                narrate(indent(borg.stderr.rstrip()))
+            raise processing_error
         narrate("Borg exit status:", borg.status)
         if borg.status == 1 and borg.stderr:
             warnings = borg.stderr.partition(72*'-')[0]
             warn('warning emitted by Borg:', codicil=warnings)
-        empty = f"❬{'not captured' if narrating or show_progress else 'empty'}❭"
+            self.record_event("warning", command=cmd, message=warnings)
+        not_captured = (
+            (narrating and not json_output) or show_progress or process_stdout
+        )
+        empty = f"❬{'not captured' if not_captured else 'empty'}❭"
         if borg.stdout:
             narrate("Borg stdout:")
             narrate(indent(borg.stdout.rstrip()))
@@ -852,6 +968,9 @@ class Assimilate:
             + [a.replace('@repo', repository) for a in args]
         )
 
+        # arbitrary borg commands may change the list of archives
+        self.invalidate_archive_cache()
+
         # run the command
         narrate(
             "running:\n{}".format(
@@ -874,6 +993,10 @@ class Assimilate:
             ends_at = arrow.now()
             log("ends at: {!s}".format(ends_at))
             log("elapsed: {!s}".format(ends_at - starts_at))
+            self.record_borg_event(
+                args[0] if args else None, command, starts_at, ends_at,
+                borg.status
+            )
         if borg.status == 1:
             warn('warning emitted by Borg, see logfile for details.')
         if borg.status:
@@ -881,6 +1004,171 @@ class Assimilate:
 
         return borg
 
+    # concurrent_borg() {{{2
+    @contextmanager
+    def concurrent_borg(self):
+        """Allow Borg to be run from several threads within the block
+
+        Normally the passcode is published before each invocation of Borg and
+        removed after it, which would remove it from under the others.  Instead
+        it is published once and removed when the block ends.  The
+        run_before_borg commands are also run before the block.
+        """
+        self.run_user_commands('run_before_borg')
+        self.publish_passcode()
+        var = self.borg_passcode_env_var_set_by_assimilate
+        self.borg_passcode_env_var_set_by_assimilate = None
+        try:
+            yield
+        finally:
+            if var:
+                narrate(f"Unsetting {var}.")
+                os.environ.pop(var, None)
+
+    # record_event() {{{2
+    def record_event(self, event, **fields):
+        """Add an event to the event log, if it is enabled"""
+        self.events.emit(event, **fields)
+
+    # record_borg_event() {{{2
+    def record_borg_event(self, cmd, command, starts_at, ends_at, status):
+        self.record_event(
+            "borg",
+            command = cmd,
+            argv = redact(command),
+            started = starts_at,
+            ended = ends_at,
+            elapsed = (ends_at - starts_at).total_seconds(),
+            status = status,
+            dry_run = 'dry-run' in self.assimilate_opts,
+        )
+
+    # read_archive_cache() {{{2
+    def read_archive_cache(self):
+        """Return the cached list of archives, or None if not available
+
+        The archives are returned in a dictionary along with the time the
+        repository was last modified when they were listed.
+        """
+        try:
+            cache = json.loads(self.archives_file.read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log("ignoring archive cache:", e, culprit=self.archives_file)
+            return None
+        if cache.get("key") != self.archive_cache_key():
+            narrate("archive cache is for different repository or matcher.")
+            return None
+        if "archives" not in cache:
+            return None
+        return dict(
+            archives = cache["archives"],
+            last_modified = cache.get("last_modified"),
+        )
+
+    # write_archive_cache() {{{2
+    def write_archive_cache(self, archives, last_modified):
+        """Save the list of archives for use by later commands"""
+        cache = dict(
+            key = self.archive_cache_key(),
+            last_modified = last_modified,
+            archives = archives,
+        )
+        # write to a temporary file and rename so readers never see a partial file
+        tmp_path = self.archives_file.with_name(self.archives_file.name + '.tmp')
+        try:
+            tmp_path.write_text(json.dumps(cache))
+            tmp_path.replace(self.archives_file)
+        except OSError as e:
+            log("cannot write archive cache:", e, culprit=self.archives_file)
+
+    # invalidate_archive_cache() {{{2
+    def invalidate_archive_cache(self):
+        """Discard the cached list of archives"""
+        try:
+            self.archives_file.unlink()
+            narrate("archive cache invalidated.")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # a stale cache must not survive, so this is fatal
+            raise Error(os_error(e))
+
+    # archive_cache_key() {{{2
+    def archive_cache_key(self):
+        # the list of archives depends on the repository and archive matcher
+        return [str(self.repository)] + self.values("match_archives")
+
+    # get_status_store() {{{2
+    def get_status_store(self):
+        if not self.status_store:
+            # imported here as it is only needed by some commands
+            from .status import StatusStore
+            self.status_store = StatusStore(self.data_dir)
+        return self.status_store
+
+    # add_run() {{{2
+    def add_run(self, command, started, ended, status, succeeded, **kwargs):
+        """Record a run of a command in the history"""
+        try:
+            self.get_status_store().add_run(
+                self.config_name, command, started, ended, status, succeeded,
+                **kwargs
+            )
+        except Error as e:
+            warn("cannot record run:", e)
+
+    # update_latest() {{{2
+    def update_latest(self, command, borg=None, repo_size=None, stats=None):
+        """Record a successful run of a command
+
+        borg is the object returned by run_borg, which gives the start and end
+        times and the exit status.  repo_size is in bytes and stats is the
+        BorgStats object that holds the statistics reported by Borg.  The date
+        file is also updated.
+        """
+        if 'dry-run' in self.assimilate_opts:
+            return
+        now = arrow.now()
+        self.add_run(
+            command,
+            getattr(borg, 'starts_at', now),
+            getattr(borg, 'ends_at', now),
+            getattr(borg, 'status', 0),
+            True,
+            repo_size = repo_size,
+            stats = stats.as_dict() if stats else None,
+        )
+        update_latest(
+            command, self.date_file, self.assimilate_opts,
+            repo_size = repo_size,
+            stats = stats.render() if stats else None,
+        )
+        if stats:
+            self.record_event("stats", command=command, stats=stats.as_dict())
+
+    # get_expected_size() {{{2
+    def get_expected_size(self):
+        """Return the size of the files in the last archive created, if known"""
+        try:
+            runs = self.get_status_store().get_runs(
+                self.config_name, "create", limit=10
+            )
+        except Error as e:
+            narrate(e)
+            return None
+        for run in runs:
+            if run['succeeded'] and run['stats'] and run['stats'].original_size:
+                return run['stats'].original_size
+
+    # get_latest() {{{2
+    def get_latest(self):
+        """Return the time of the last successful run of each command"""
+        return self.get_status_store().get_latest(
+            self.config_name, self.date_file
+        )
+
     # report_borg_error() {{{2
     def report_borg_error(self, e, cmd):
         narrate('Borg terminates with exit status:', e.status)
@@ -982,6 +1270,9 @@ class Assimilate:
             # data dir does not exist, create it
             data_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
         self.date_file = data_dir / self.resolve('DATE_FILE', DATE_FILE)
+        if self.share_ssh_connections:
+            share_connections()
+        self.archives_file = data_dir / self.resolve('ARCHIVES_FILE', ARCHIVES_FILE)
         self.data_dir = data_dir
 
         # perform locking
@@ -1018,6 +1309,16 @@ class Assimilate:
             )
             nt.dump(contents, lockfile)
 
+            # unmount any archives that compare left mounted for reuse, as
+            # they hold a lock on the repository
+            mounts_dir = data_dir / MOUNT_CACHE_DIR / self.config_name
+            if (
+                self.settings.get('cmd_name') not in commands_that_reuse_mounts
+                and mounts_dir.is_dir() and any(mounts_dir.iterdir())
+            ):
+                from .mounts import release_mounts
+                release_mounts(self.get_status_store(), self.config_name)
+
         # open logfile
         # do this after checking lock so we do not overwrite logfile
         # of assimilate process that is currently running
@@ -1042,6 +1343,24 @@ class Assimilate:
             ntlog = NTlog(temp_log_file=self.logfile, **kwargs)
             get_informer().set_logfile(ntlog)
 
+        # open event log
+        if log_command and self.event_log:
+            self.events = EventLog(
+                data_dir / self.resolve('EVENT_LOG_FILE', EVENT_LOG_FILE),
+                config = self.config_name,
+                command = self.settings.get('cmd_name'),
+            )
+            self.started = arrow.now()
+            self.record_event(
+                "start",
+                cmdline = redact(sys.argv),
+                run_name = self.run_name,
+                user = username,
+                host = fullhostname,
+                pid = os.getpid(),
+                dry_run = 'dry-run' in self.assimilate_opts,
+            )
+
         log("working directory:", self.working_dir)
         return self
 
@@ -1055,7 +1374,32 @@ class Assimilate:
         if self.requires_exclusivity:
             self.lockfile.unlink()
 
+        # close the history
+        if self.status_store:
+            self.status_store.close()
+
         # run the run_after_borg commands
         if self.borg_ran:
             self.run_user_commands('run_after_borg')
 
+        # close the event log
+        if self.events:
+            ended = arrow.now()
+            if exc_type is KeyboardInterrupt:
+                status, error = 2, "Killed by user."
+            elif isinstance(exc_val, OSError):
+                status, error = 2, os_error(exc_val)
+            elif exc_val is not None:
+                status, error = 2, str(exc_val)
+            else:
+                status, error = self.exit_status, None
+            self.record_event(
+                "end",
+                started = self.started,
+                ended = ended,
+                elapsed = (ended - self.started).total_seconds(),
+                status = status,
+                error = error,
+            )
+            self.events.close()
+
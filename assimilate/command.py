@@ -21,11 +21,16 @@
 import json
 import nestedtext as nt
 import os
+import posixpath
 import sys
 from textwrap import dedent, fill
 import arrow
+from array import array
+from bisect import bisect_left, bisect_right
 from contextlib import contextmanager
+from datetime import datetime
 import re
+from string import Formatter
 from inform import (
     Color,
     Error,
@@ -47,18 +52,24 @@ from inform import (
     warn,
 )
 from time import sleep
-from .assimilate import borg_commands_with_dryrun
+from .assimilate import (
+    Assimilate, ConfigQueue, borg_commands_with_dryrun, borg_commands_with_history
+)
 from .configs import (
     ASSIMILATE_SETTINGS, BORG_SETTINGS, READ_ONLY_SETTINGS,
-    get_available_configs
+    get_available_configs, read_settings
 )
 from .overdue import overdue, OVERDUE_USAGE
-from .preferences import DEFAULT_COMMAND, PROGRAM_NAME
+from .preferences import (
+    BORG, DATA_DIR, DATE_FILE, DEFAULT_COMMAND, DEFAULT_LIST_SORT_MEMORY,
+    DEFAULT_VERSIONS_JOBS, INDEX_FILE, PROGRAM_NAME, VERSIONS_FILE
+)
+from .stats import ARCHIVE_STATISTICS, COMPACT_MESSAGES, BorgStats
 from .utilities import (
-    gethostname, output, pager, process_cmdline, read_latest, to_date,
-    to_days, to_seconds, two_columns, update_latest, when,
+    gethostname, output, pager, process_cmdline, to_arrow, to_date,
+    to_days, to_seconds, two_columns, when,
     Quantity, QuantiPhyError, UnknownConversion,
-    Cmd, Run, cwd, lsd, mkdir, rm, split_cmd, to_path
+    Cmd, Run, cd, cwd, lsd, mkdir, rm, split_cmd, to_path
 )
 
 
@@ -67,6 +78,24 @@ hostname = gethostname()
 prune_intervals = """
     within last minutely hourly daily weekly monthly 3monthly 13weekly yearly
 """.split()
+LIST_OUTPUT_BATCH = 1000
+    # number of lines the list command accumulates before writing them
+SIZE_CACHE_LIMIT = 100_000
+    # number of distinct sizes the list command holds for reuse
+LIST_FORMATS = dict(
+    # the formats predefined by the list command
+    name = "{path}",
+    short = "{path}{Type}",
+    date = "{mtime} {path}{Type}",
+    size = "{size:8} {path}{Type}",
+    si = "{Size:7.2b} {path}{Type}",
+    owner = "{user:8} {path}{Type}",
+    group = "{group:8} {path}{Type}",
+    long = '{mode:10} {user:6} {group:6} {size:8} {mtime} {path}{extra}',
+)
+DIFF_SUMMARY_MAX_DIRS = 10_000
+    # number of directories the diff command summarizes before it combines
+    # the deepest into their parents
 
 # Utilities {{{1
 # title() {{{2
@@ -76,24 +105,149 @@ def title(text):
 
 # get_available_archives() {{{2
 def get_available_archives(settings):
+    # use the cached archives if they are still current
+    # the cache is discarded by commands that change the archives, but others,
+    # perhaps on other hosts, may have changed the repository, so confirm that
+    # neither the latest archive nor the time the repository was last modified
+    # has changed; this costs a Borg invocation, but not the full list
+    cache = settings.read_archive_cache()
+    if cache is not None:
+        latest, last_modified = get_repository_state(settings)
+        latest_id = latest["id"] if latest else None
+        archives = cache["archives"]
+        cached_id = archives[-1]["id"] if archives else None
+        if latest_id == cached_id and last_modified == cache["last_modified"]:
+            narrate("using cached archives.")
+            return archives
+        narrate("archive cache is out of date.")
+
     # run borg
     borg = settings.run_borg(cmd="repo-list", args=["--json"])
     try:
         data = json.loads(borg.stdout)
-        return data["archives"]
+        archives = data["archives"]
     except json.decoder.JSONDecodeError as e:  # pragma: no cover
         raise Error("Could not decode output of Borg list command.", codicil=e)
+    last_modified = data.get("repository", {}).get("last_modified")
+    settings.write_archive_cache(archives, last_modified)
+    return archives
 
 
-# get_latest_archive() {{{2
-def get_latest_archive(settings):
+# get_repository_state() {{{2
+def get_repository_state(settings):
+    # returns the latest archive and the time the repository was last modified
     borg = settings.run_borg(cmd="repo-list", args=["--json", "--last=1"])
     try:
         data = json.loads(borg.stdout)
-        if data["archives"]:
-            return data["archives"][-1]
     except json.decoder.JSONDecodeError as e:  # pragma: no cover
         raise Error("Could not decode output of Borg list command.", codicil=e)
+    latest = data["archives"][-1] if data["archives"] else None
+    return latest, data.get("repository", {}).get("last_modified")
+
+
+# get_latest_archive() {{{2
+def get_latest_archive(settings):
+    latest, last_modified = get_repository_state(settings)
+    return latest
+
+# ArchiveIndex class {{{2
+class ArchiveIndex:
+    # Archives ordered by creation time, with the times held as integer
+    # microseconds since the epoch so that archives can be found by bisection.
+    # Archive times given without a time zone are taken to be local.
+
+    def __init__(self, archives):
+        times = [self.to_epoch(archive["time"]) for archive in archives]
+        order = sorted(range(len(archives)), key=times.__getitem__)
+        self.archives = [archives[i] for i in order]
+        self.times = array('q', (times[i] for i in order))
+
+    @staticmethod
+    def to_epoch(timestamp):
+        try:
+            seconds = datetime.fromisoformat(timestamp).timestamp()
+        except ValueError:
+            seconds = arrow.get(timestamp, tzinfo='local').timestamp()
+        return round(seconds * 1_000_000)
+
+    def __len__(self):
+        return len(self.archives)
+
+    def first_not_older(self, target):
+        # index of the oldest archive that is not older than target, returns
+        # number of archives if all are older
+        return bisect_left(self.times, round(target.timestamp() * 1_000_000))
+
+    def by_index(self, index):
+        # index counts back from most recent archive, which has index 0;
+        # negative indices count forward from the oldest archive
+        return self.archives[-1 - index]
+
+    def select(self, options):
+        # the run of archives chosen by the age and count options, returned as
+        # the index of its first archive and the index that follows its last;
+        # as with Borg, the count is applied to what the age leaves
+        start, stop = self.select_by_age(options)
+        opt, count = count_option(options)
+        if opt == "--first":
+            stop = min(stop, start + count)
+        elif opt == "--last":
+            start = max(start, stop - count)
+        return start, stop
+
+    def select_by_age(self, options):
+        # the run of archives chosen by the age options, as with select()
+        opt, value = age_option(options)
+        start, stop = 0, len(self)
+        if not opt or not self.times:
+            return start, stop
+        if opt == "--older":
+            stop = self.first_not_older(to_date(value))
+        elif opt == "--newer":
+            start = self.first_not_older(to_date(value))
+        elif opt == "--oldest":
+            span = round(to_seconds(value) * 1_000_000)
+            stop = bisect_right(self.times, self.times[0] + span)
+        else:
+            span = round(to_seconds(value) * 1_000_000)
+            start = bisect_left(self.times, self.times[-1] - span)
+        return start, stop
+
+
+# age_option() {{{2
+def age_option(options):
+    # the age option given, and its value
+    given = [
+        opt for opt in ('--older', '--oldest', '--newer', '--newest')
+        if options.get(opt)
+    ]
+    if len(given) > 1:
+        raise Error(f"incompatible options: {', '.join(given)}.")
+    if given:
+        return given[0], options[given[0]]
+    return None, None
+
+
+# count_option() {{{2
+def count_option(options):
+    # the count option given, and its value
+    given = []
+    for opt in ('--first', '--last'):
+        value = options.get(opt)
+        if value:
+            try:
+                count = int(value)
+            except ValueError:
+                count = 0
+            if count <= 0:
+                raise Error(f'expected positive integer, found ‘{value}’.', culprit=opt)
+            given.append((opt, count))
+    if len(given) > 1:
+        raise Error(f"incompatible options: {', '.join(o for o, c in given)}.")
+    if given:
+        return given[0]
+    return None, None
+
 
 # find_archive() {{{2
 def find_archive(settings, options):
@@ -116,46 +270,42 @@ def find_archive(settings, options):
     if time_thresh:
         target = to_date(time_thresh)
 
+        archives = ArchiveIndex(get_available_archives(settings))
+        if not archives:
+            raise Error(
+                "no archives available."
+            )
+
         # find oldest archive that is younger than specified target
-        older_archive = None
-        for newer_archive in get_available_archives(settings):
-            newer_time = arrow.get(newer_archive["time"], tzinfo='local')
-            if newer_time >= target:
-                # we have crossed the time threshold
-                if first_after:
-                    return desc_and_id(newer_archive)
-                elif older_archive:
-                    return desc_and_id(older_archive)
-                else:
-                    warn(
-                        f'archive older than {time_thresh} ({target.humanize()}) was not found.',
-                        codicil='Using oldest available.'
-                    )
-                    return desc_and_id(newer_archive)
-            older_archive = newer_archive
-        if older_archive:
-            if first_after:
-                warn(
-                    f'archive younger than {time_thresh} ({target.humanize()}) was not found.',
-                    codicil='Using youngest that is older than given date or age.'
-                )
-            return desc_and_id(older_archive)
-        raise Error(
-            "no archives available."
+        i = archives.first_not_older(target)
+        if first_after:
+            if i < len(archives):
+                return desc_and_id(archives.archives[i])
+            warn(
+                f'archive younger than {time_thresh} ({target.humanize()}) was not found.',
+                codicil='Using youngest that is older than given date or age.'
+            )
+            return desc_and_id(archives.archives[-1])
+        if i > 0:
+            return desc_and_id(archives.archives[i-1])
+        warn(
+            f'archive older than {time_thresh} ({target.humanize()}) was not found.',
+            codicil='Using oldest available.'
         )
+        return desc_and_id(archives.archives[0])
 
     if identifier:
         # assume identifier is an index and return id of corresponding archive
         try:
             index = int(identifier)
-            archives = get_available_archives(settings)
+        except ValueError:
+            index = None
+        if index is not None:
+            archives = ArchiveIndex(get_available_archives(settings))
             try:
-                archive = list(reversed(archives))[index]
-                return desc_and_id(archive)
+                return desc_and_id(archives.by_index(index))
             except IndexError:
                 raise Error("index out of range.")
-        except ValueError:
-            pass
 
         # not an index, return it and let borg figure it out
         return identifier, None
@@ -174,39 +324,22 @@ def archive_filter_options(settings, given_options, default):
         archive, description = find_archive(settings, given_options)
         return [f"--match-archives={archive}"]
 
+    # the age and count filters are left for Borg to apply; resolving them
+    # with an ArchiveIndex would first require the list of archives
     processed_options = []
-    age_opts = ('--older', '--oldest', '--newer', '--newest')
-    seen = []
-    for opt in age_opts:
-        value = given_options.get(opt)
-        if value:
-            seen.append(opt)
-            if opt in ('--older', '--newer'):
-                target = to_date(value)
-                seconds = (arrow.now() - target).total_seconds()
-            else:
-                seconds = to_seconds(value)
-            days = round(seconds/60/60/24)
-            processed_options.append(f"{opt}={days}d")
-            # processed_options.append(f"{opt}={round(seconds)}S")
-    if len(seen) > 1:
-        raise Error(f"incompatible options: {', '.join(seen)}.")
-
-    cardinality_opts = ('--first', '--last')
-    seen = []
-    for opt in cardinality_opts:
-        value = given_options.get(opt)
-        if value:
-            try:
-                v = int(value)
-            except ValueError:
-                v = 0
-            if v <= 0:
-                raise Error(f'expected positive integer, found ‘{value}’.', culprit=opt)
-            seen.append(opt)
-            processed_options.append(f"{opt}={value}")
-    if len(seen) > 1:
-        raise Error(f"incompatible options: {', '.join(seen)}.")
+    opt, value = age_option(given_options)
+    if opt:
+        if opt in ('--older', '--newer'):
+            target = to_date(value)
+            seconds = (arrow.now() - target).total_seconds()
+        else:
+            seconds = to_seconds(value)
+        days = round(seconds/60/60/24)
+        processed_options.append(f"{opt}={days}d")
+        # processed_options.append(f"{opt}={round(seconds)}S")
+    opt, count = count_option(given_options)
+    if opt:
+        processed_options.append(f"{opt}={given_options[opt]}")
 
     if given_options.get('--deleted'):
         processed_options.append('--deleted')
@@ -257,6 +390,71 @@ def archive_desc(archive, settings):
         date = f" {date.format(settings.time_format)} ({date.humanize()})"
     return f"{id} {name}{date}"
 
+# archive_span {{{2
+def archive_span(archives):
+    # describe a run of archives by the names of the first and last
+    first, last = archives[0]['archive'], archives[-1]['archive']
+    if len(archives) == 1:
+        return first
+    if len(archives) == 2:
+        return f"{first}, {last}"
+    return f"{first} … {last} ({len(archives)} archives)"
+
+# get_file_index() {{{2
+def get_file_index(settings):
+    # imported here as the index is only needed by some commands
+    from .index import FileIndex
+    return FileIndex(settings.data_dir / settings.resolve('INDEX_FILE', INDEX_FILE))
+
+# index_archive() {{{2
+def index_archive(index, archive, settings, options):
+    # list the files of an archive and add them to the index; archive is the
+    # description of the archive given by Borg
+    from .index import INDEX_FORMAT
+    narrate(f"indexing {archive.get('name') or archive.get('archive')}.")
+    borg = settings.run_borg(
+        cmd = "list",
+        borg_opts = ['--json-lines', f'--format={INDEX_FORMAT}'],
+        args = [f"aid:{archive['id']}"],
+        assimilate_opts = options,
+        process_stdout = lambda lines: index.add_archive(archive, lines),
+    )
+    return borg.from_process_stdout
+
+# update_file_index() {{{2
+def update_file_index(settings, options, new_archive=None, add_missing=False):
+    # Removes archives that are no longer available from the index.  If
+    # new_archive is given it is added, and if add_missing is true all of
+    # the available archives not already in the index are added.
+    index = get_file_index(settings)
+    try:
+        if new_archive:
+            index_archive(index, new_archive, settings, options)
+            if not add_missing:
+                return
+        if not index and not add_missing:
+            return
+        archives = get_available_archives(settings)
+        available = {a['id'] for a in archives}
+        indexed = index.get_archive_ids()
+        index.remove_archives(indexed - available)
+        if add_missing:
+            for archive in archives:
+                if archive['id'] not in indexed:
+                    index_archive(index, archive, settings, options)
+    finally:
+        index.close()
+
+# maintain_file_index() {{{2
+def maintain_file_index(settings, options, new_archive=None):
+    # keep the index current after the archives change, if requested
+    if not settings.file_index or 'dry-run' in options:
+        return
+    try:
+        update_file_index(settings, options, new_archive)
+    except Error as e:
+        warn("could not update file index.", codicil=str(e))
+
 # get_archive_paths() {{{2
 def get_archive_paths(paths, settings):
     # Need to construct a path to the file that is compatible with those
@@ -317,6 +515,296 @@ def make_quiet():
         informer.quiet = prev_quiet
 
 
+# CachedFormat class {{{2
+class CachedFormat:
+    # wraps a value that is expensive to format and that is used repeatedly,
+    # remembering the formatted forms
+    __slots__ = ('value', 'formatted')
+
+    def __init__(self, value):
+        self.value = value
+        self.formatted = {}
+
+    def __format__(self, spec):
+        try:
+            return self.formatted[spec]
+        except KeyError:
+            text = self.formatted[spec] = format(self.value, spec)
+            return text
+
+    def __str__(self):
+        return format(self, '')
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+
+# SizeCache class {{{2
+class SizeCache(dict):
+    # sizes, as quantities in bytes that remember how they were formatted, keyed
+    # by the number of bytes; the number of sizes held is limited
+    def __missing__(self, size):
+        quantity = CachedFormat(Quantity(size, "B"))
+        if len(self) < SIZE_CACHE_LIMIT:
+            self[size] = quantity
+        return quantity
+
+
+# DirectoryChurn class {{{2
+class DirectoryChurn:
+    """Accumulates the differences between two archives by directory
+
+    root (str):
+        The directory that contains the paths that are to be summarized.
+    depth (int):
+        The changes in directories more than this many levels below root are
+        attributed to their ancestor at this depth.
+    max_dirs (int):
+        The maximum number of directories held.  If exceeded, depth is reduced
+        and the deepest directories are combined into their parents, so memory
+        use is bounded regardless of the size of the diff.
+
+    For each directory the size of the files added and removed is accumulated,
+    along with the number of bytes added to and removed from the files that
+    were modified, and the number of files that changed.
+    """
+    ADDED, REMOVED, MODIFIED, FILES = range(4)
+
+    def __init__(self, root, depth, max_dirs=DIFF_SUMMARY_MAX_DIRS):
+        self.root = root.rstrip('/')
+        self.depth = depth
+        self.max_dirs = max_dirs
+        self.dirs = {}
+        self.reduced = False
+
+    # add() {{{3
+    def add(self, diff):
+        added = removed = modified = 0
+        for change in diff['changes']:
+            kind = change.get('type')
+            if kind == 'added':
+                added += change.get('size', 0)
+            elif kind == 'removed':
+                removed += change.get('size', 0)
+            elif kind == 'modified':
+                modified += change.get('added', 0) + change.get('removed', 0)
+        directory = self.truncate(posixpath.dirname(diff['path']))
+        counts = self.dirs.get(directory)
+        if counts is None:
+            counts = self.dirs[directory] = [0, 0, 0, 0]
+            if len(self.dirs) > self.max_dirs:
+                self.combine()
+                counts = self.dirs[self.truncate(directory)]
+        counts[self.ADDED] += added
+        counts[self.REMOVED] += removed
+        counts[self.MODIFIED] += modified
+        counts[self.FILES] += 1
+
+    # truncate() {{{3
+    def truncate(self, directory):
+        # return the ancestor of directory that is depth levels below root
+        if self.root:
+            relative = directory[len(self.root)+1:]
+        else:
+            relative = directory
+        parts = relative.split('/', self.depth)
+        if len(parts) <= self.depth:
+            return directory
+        return posixpath.join(self.root, *parts[:self.depth])
+
+    # combine() {{{3
+    def combine(self):
+        # reduce the depth until the number of directories is acceptable
+        while len(self.dirs) > self.max_dirs and self.depth > 0:
+            self.depth -= 1
+            self.reduced = True
+            dirs = {}
+            for directory, counts in self.dirs.items():
+                directory = self.truncate(directory)
+                combined = dirs.setdefault(directory, [0, 0, 0, 0])
+                for i, count in enumerate(counts):
+                    combined[i] += count
+            self.dirs = dirs
+
+    # render() {{{3
+    def render(self):
+        """Return the summary as lines of text, one per directory"""
+        totals = [0, 0, 0, 0]
+        lines = [
+            f"{'added':>9} {'removed':>9} {'modified':>9} {'files':>8}  directory"
+        ]
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            def row(counts, directory):
+                sizes = [
+                    str(Quantity(c, 'B')) if c else '-' for c in counts[:3]
+                ]
+                return (
+                    f"{sizes[0]:>9} {sizes[1]:>9} {sizes[2]:>9} "
+                    f"{counts[self.FILES]:>8}  {directory}"
+                )
+            for directory in sorted(self.dirs):
+                counts = self.dirs[directory]
+                for i, count in enumerate(counts):
+                    totals[i] += count
+                lines.append(row(counts, directory or '.'))
+            lines.append(row(totals, 'total'))
+        return lines
+
+
+# get_field_names() {{{2
+def get_field_names(template):
+    # returns the names of the fields referenced in a format template,
+    # including those nested in format specifications
+    names = set()
+    for literal, name, spec, conversion in Formatter().parse(template):
+        if name is not None:
+            names.add(re.split(r'[.\[]', name, maxsplit=1)[0])
+        if spec and '{' in spec:
+            names |= get_field_names(spec)
+    return names
+
+
+# compile_list_format() {{{2
+LIST_TYPES = {
+    # mode: (Type, introduction to the target given in extra)
+    '-': ('', ''),
+    'd': ('/', ''),             # directory
+    'l': ('@', ' —> '),         # symbolic link
+    'h': ('', ' links to '),    # hard link
+    'p': ('|', ''),             # pipe
+}
+LIST_TIMES = dict(
+    # derived field: (Borg field, humanize)
+    mTime=('mtime', False), mAgo=('mtime', True),
+    cTime=('ctime', False), cAgo=('ctime', True),
+    aTime=('atime', False), aAgo=('atime', True),
+)
+LIST_SIZES = dict(Size='size', cSize='csize', dSize='dsize', dcSize='dcsize')
+    # derived field: Borg field
+
+def get_list_type(values):
+    # returns the values of the Type and extra fields for an entry
+    kind = values['mode'][0]
+    try:
+        type, link = LIST_TYPES[kind]
+    except KeyError:
+        log('UNKNOWN TYPE:', kind, values['path'])
+        return '', ''
+    return type, (link + values['target'] if link else '')
+
+def compile_list_format(template, healthy_color=None, broken_color=None):
+    """Compile list format template into a renderer
+
+    Returns a function that takes the values for an entry from Borg's
+    JSON-lines listing and returns the formatted line.  The template is
+    examined once and converted to the source of a function that computes
+    only the derived fields the template references and then formats the line
+    with an f-string.  Templates that use attributes, indices or nested
+    fields are formatted with format_map() instead.  If the entry reports
+    its health, the line is passed to healthy_color or broken_color, if
+    given.
+    """
+    try:
+        parsed = list(Formatter().parse(template))
+        fields = get_field_names(template)
+    except ValueError as e:
+        raise Error(
+            full_stop(e),
+            'Likely due to a bad format specification in list_formats:',
+            codicil=template
+        )
+    namespace = dict(
+        template = template,
+        get_list_type = get_list_type,
+        to_arrow = to_arrow,
+        truth = truth,
+        healthy_color = healthy_color,
+        broken_color = broken_color,
+    )
+
+    # compute the derived fields as local variables
+    # a derived field is only computed if Borg gave the field it is derived
+    # from, otherwise it is looked up so that the missing field is reported
+    code = []
+    derived = []
+    if fields & {'Type', 'extra'}:
+        code.append("Type, extra = get_list_type(values)")
+        derived += ['Type', 'extra']
+    for name, (raw, humanize) in LIST_TIMES.items():
+        if name in fields:
+            value = f"to_arrow(values[{raw!r}])"
+            if humanize:
+                value += ".humanize()"
+            code.append(
+                f"{name} = {value} if {raw!r} in values else values[{name!r}]"
+            )
+            derived.append(name)
+    for name, raw in LIST_SIZES.items():
+        if name in fields:
+            # formatting quantities is slow, but sizes repeat often, so reuse
+            namespace[f"{name}_cache"] = SizeCache()
+            code.append(
+                f"{name} = {name}_cache[values[{raw!r}]] "
+                f"if {raw!r} in values else values[{name!r}]"
+            )
+            derived.append(name)
+    if 'healthy' in fields:
+        code.append("healthy = truth(values['healthy'], formatter='healthy/broken')")
+        derived.append('healthy')
+
+    # build an f-string from the template
+    pieces = []
+    for i, (literal, name, spec, conversion) in enumerate(parsed):
+        pieces.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is None:
+            continue
+        if (
+            not name.isidentifier()
+            or conversion not in (None, 'r', 's', 'a')
+            or (spec and '{' in spec)
+        ):
+            # let format_map() handle or report what the f-string cannot
+            pieces = None
+            break
+        if name in derived:
+            field = name
+        else:
+            field = f"f{i}"
+            code.append(f"{field} = values[{name!r}]")
+        if conversion:
+            field += f"!{conversion}"
+        if spec:
+            if spec.isprintable() and not set(spec) & set('\\\'"'):
+                field += f":{spec}"
+            else:
+                namespace[f"s{i}"] = spec
+                field += f":{{s{i}}}"
+        pieces.append('{' + field + '}')
+    if pieces is None:
+        derived = ", ".join(f"{name!r}: {name}" for name in derived)
+        line = f"template.format_map({{**values, {derived}}})"
+    else:
+        line = "f" + repr("".join(pieces))
+
+    # color the line according to the health of the entry
+    if healthy_color and broken_color:
+        code += [
+            f"line = {line}",
+            "if 'healthy' in values:",
+            "    return (healthy_color if values['healthy'] else broken_color)(line)",
+            "return line",
+        ]
+    else:
+        code.append(f"return {line}")
+
+    source = "def render(values):\n" + "".join(f"    {l}\n" for l in code)
+    exec(source, namespace)
+    return namespace['render']
+
+
 # Command base class {{{1
 class Command:
     REQUIRES_EXCLUSIVITY = True
@@ -589,6 +1077,7 @@ class CheckCommand(Command):
             -E, --include-external      check all archives in repository, not just
                                         those associated with chosen configuration
             -r, --repair                attempt to repair any inconsistencies found
+            -p, --progress              show progress as the repository is checked
             -v, --verify-data           perform a full integrity verification (slow)
             --archives-only             perform only archive checks
             --repository-only           perform only repository checks
@@ -642,6 +1131,8 @@ class CheckCommand(Command):
         if cmdline["--repair"]:
             args.append("--repair")
             os.environ['BORG_CHECK_I_KNOW_WHAT_I_AM_DOING'] = 'YES'
+        if cmdline["--progress"] or settings.show_progress:
+            borg_opts.append("--progress")
 
         # run borg
         borg = settings.run_borg(
@@ -666,7 +1157,7 @@ class CheckCommand(Command):
         if borg.stderr:
             if "problems found" in borg.stderr or "errors found" in borg.stderr:
                 return
-        update_latest('check', settings.date_file, options)
+        settings.update_latest('check', borg)
 
 
 # CompactCommand command {{{1
@@ -703,31 +1194,39 @@ class CompactCommand(Command):
             borg_opts.append("--verbose")
                 # need --verbose or --stats does not output anything
 
+        # borg writes its log messages and progress as lines of JSON
+        borg_opts.append("--log-json")
+
         def show_progress(stream):
-            repo_size = None
-            stats = []
+            stats = BorgStats()
             informant = display if Color.isTTY() else None
             with ProgressBar(666, width=-1, informant=informant) as progress:
                 initialize = True
                 for line in stream:
-                    match = re.search(rb'\((\d+)/(\d+)\)', line)
-                    if match:
-                        if initialize:
-                            progress.override_limits(float(match[2]), 0, False)
-                            initialize = False
-                        progress.draw(float(match[1]))
-
-                    if line.startswith(b'Source data size'):
-                        stats.append(line.decode('utf8'))
-                    if line.startswith(b'Repository size'):
-                        stats.append(line.decode('utf8'))
-                        matched = re.search(rb' (\d+ \wB) ', line)
-                        if matched:
-                            repo_size = Quantity(matched[1].decode('utf8'))
-                    if line.startswith(b'Compaction saved'):
-                        stats.append(line.decode('utf8'))
-
-            return dict(repo_size=repo_size, stats=stats)
+                    try:
+                        msg = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if msg.get('type') == 'progress_percent':
+                        current, total = msg.get('current'), msg.get('total')
+                    elif msg.get('type') == 'log_message':
+                        message = msg.get('message', '')
+                        if stats.from_compact_message(message):
+                            continue
+                        # archives are reported as they are analyzed: (n/N)
+                        match = re.search(r'\((\d+)/(\d+)\)$', message)
+                        if not match:
+                            continue
+                        current, total = match[1], match[2]
+                    else:
+                        continue
+                    if current is None or not total:
+                        continue
+                    if initialize:
+                        progress.override_limits(float(total), 0, False)
+                        initialize = False
+                    progress.draw(float(current))
+            return stats
 
         # run borg
         borg = settings.run_borg(
@@ -737,15 +1236,17 @@ class CompactCommand(Command):
             show_borg_output = False,
             show_progress = show_progress
         )
+        stats = borg.from_show_progress
 
         # output stats
         if show_stats:
-            for each in borg.from_show_progress['stats']:
-                display(each.strip())
+            for name, value in stats.render(COMPACT_MESSAGES).items():
+                display(f"{name}: {value}")
 
         # update date file
-        repo_size = borg.from_show_progress['repo_size']
-        update_latest('compact', settings.date_file, options, repo_size=repo_size)
+        settings.update_latest(
+            'compact', borg, repo_size=stats.repo_size, stats=stats
+        )
 
         return borg.status
 
@@ -763,6 +1264,7 @@ class CompareCommand(Command):
             -a, --archive <archive>     name of the archive to compare against
             -A, --after <date_or_age>   use first archive younger than given
             -B, --before <date_or_age>  use first archive older than given
+            -f, --fast                  compare metadata, do not mount the archive
             -i, --interactive           perform an interactive comparison
 
         Reports and allows you to manage the differences between your local
@@ -771,6 +1273,17 @@ class CompareCommand(Command):
 
             $ assimilate compare
 
+        The ––fast option compares the types, sizes and modification times of
+        your files to those recorded in the archive rather than their contents,
+        so the archive need not be mounted.  When only the modification times
+        differ, the contents of those files are compared using their hashes.
+        The files that differ are listed.  If ––interactive is also given, only
+        the files that were modified are extracted from the archive, and each
+        is opened in the interactive file comparison tool:
+
+            $ assimilate compare ––fast
+            $ assimilate compare ––fast ––interactive
+
         The ––interactive option allows you to manage those differences.
         Specifically, it will open an interactive file comparison tool that
         allows you to compare the contents of your files and copy differences
@@ -799,7 +1312,8 @@ class CompareCommand(Command):
 
         This command requires that the following settings be specified in your
         settings file: manage_diffs_cmd, report_diffs_cmd, and
-        default_mount_point.
+        default_mount_point.  With ––fast, default_mount_point is not needed,
+        nor is a diff command unless ––interactive is given.
 
         The command operates by mounting the desired archive, performing the
         comparison, and then unmounting the directory.  Problems sometimes occur
@@ -821,34 +1335,34 @@ class CompareCommand(Command):
     def run(cls, command, args, settings, options):
         # read command line
         cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
-        mount_point = settings.as_path("default_mount_point")
-        if not mount_point:
-            raise Error("must specify default_mount_point setting to use this command.")
         path = cmdline['<path>']
         if not path:
             path = '.'
+        if cmdline['--fast']:
+            return cls.run_fast(path, cmdline, settings, options)
+        ttl = settings.mount_cache_ttl
+        if ttl:
+            try:
+                ttl = float(to_seconds(ttl, default_units='m'))
+            except QuantiPhyError as e:
+                raise Error(e, culprit='mount_cache_ttl')
+        mount_point = settings.as_path("default_mount_point")
+        if not mount_point and not ttl:
+            raise Error("must specify default_mount_point setting to use this command.")
 
         # get the desired archive
-        if cmdline["--archive"]:
+        if cmdline["--archive"] and not ttl:
             archive = cmdline["--archive"]
         else:
+            # mounts are reused by archive, so resolve indexes to archive ids
             archive, description = find_archive(settings, cmdline)
             if description:
                 display(f'archive: {description}')
 
         # get diff tool
-        if cmdline['--interactive']:
-            differ = settings.manage_diffs_cmd
-            if not differ:
-                narrate("manage_diffs_cmd not set, trying report_diffs_cmd.")
-                differ = settings.report_diffs_cmd
-        else:
-            differ = settings.report_diffs_cmd
-            if not differ:
-                narrate("report_diffs_cmd not set, trying manage_diffs_cmd.")
-                differ = settings.manage_diffs_cmd
-        if not differ:
-            raise Error("no diff command available.")
+        differ = cls.get_differ(settings, cmdline['--interactive'])
+        if ttl:
+            return cls.run_cached(archive, differ, path, ttl, settings, options)
 
         # create mount point
         if mount_point.exists():
@@ -871,45 +1385,10 @@ class CompareCommand(Command):
             )
 
             # resolve the path relative to working directory
-            archive_path = to_path(path).resolve().relative_to(settings.working_dir)
-            candidate_paths = list(lsd(mount_point, select='*'))
-                # the name used by borg for the archive is difficult to predict
-                # but there should just be one, so use it
-            if len(candidate_paths) == 1:
-                archive_path = to_path(candidate_paths[0], archive_path)
-            else:
-                if candidate_paths:
-                    codicil = join(
-                        "The following archives were found:",
-                        *[str(p) for p in candidate_paths],
-                        sep='\n    '
-                    )
-                else:
-                    codicil = None
-                raise Error(
-                    f"{plural(candidate_paths)://Too many/ No} archives available.",
-                    culprit=mount_point, codicil=codicil
-                )
+            archive_path = cls.get_mounted_path(mount_point, path, settings)
 
             # run diff tool
-            if is_str(differ):
-                cmd = differ.format(
-                    archive_path = str(archive_path),
-                    local_path = str(path)
-                )
-                if cmd == differ:
-                    cmd = split_cmd(differ) + [archive_path, path]
-            else:
-                cmd = differ + [archive_path, path]
-            try:
-                diff = Cmd(cmd, modes='soEW1')
-                diff.run()
-            except Error as e:
-                codicil = e.stdout if e.stdout and not e.stderr else None
-                e.report(codicil=codicil)
-            except KeyboardInterrupt:
-                log('user killed compare command.')
-                diff.kill()
+            diff = cls.run_differ(differ, archive_path, path)
 
         finally:
             # run borg to un-mount
@@ -924,6 +1403,188 @@ class CompareCommand(Command):
 
         return diff.status
 
+    @classmethod
+    def run_cached(cls, archive, differ, path, ttl, settings, options):
+        # The archive is left mounted so that it can be reused by later
+        # comparisons, and is unmounted by the reaper once it has been idle
+        # for ttl seconds.
+        from .mounts import get_mount_point, start_reaper, unmount
+        store = settings.get_status_store()
+        config = settings.config_name
+        mount_point = get_mount_point(config, archive)
+        mounts = store.get_mounts(config=config, archive=archive)
+        if mounts and os.path.ismount(mount_point):
+            narrate("reusing mounted archive:", mount_point)
+        else:
+            for mount in mounts:
+                unmount(mount, store)  # no longer mounted, forget it
+            try:
+                mkdir(mount_point)
+            except OSError as e:
+                raise Error(os_error(e))
+            try:
+                settings.run_borg(
+                    cmd = "mount",
+                    borg_opts = [f"--match-archives={archive}"],
+                    args = [mount_point],
+                    assimilate_opts = options,
+                )
+            except Error:
+                mount_point.rmdir()
+                raise
+            store.add_mount(
+                config, archive, mount_point, settings.lockfile,
+                settings.value("borg_executable", BORG), ttl
+            )
+
+        try:
+            archive_path = cls.get_mounted_path(mount_point, path, settings)
+            diff = cls.run_differ(differ, archive_path, path)
+        finally:
+            # the idle time is measured from the end of the comparison
+            store.touch_mount(mount_point)
+            start_reaper()
+        return diff.status
+
+    @staticmethod
+    def get_mounted_path(mount_point, path, settings):
+        archive_path = to_path(path).resolve().relative_to(settings.working_dir)
+        candidate_paths = list(lsd(mount_point, select='*'))
+            # the name used by borg for the archive is difficult to predict
+            # but there should just be one, so use it
+        if len(candidate_paths) == 1:
+            return to_path(candidate_paths[0], archive_path)
+        if candidate_paths:
+            codicil = join(
+                "The following archives were found:",
+                *[str(p) for p in candidate_paths],
+                sep='\n    '
+            )
+        else:
+            codicil = None
+        raise Error(
+            f"{plural(candidate_paths)://Too many/ No} archives available.",
+            culprit=mount_point, codicil=codicil
+        )
+
+    @staticmethod
+    def get_differ(settings, interactive):
+        if interactive:
+            differ = settings.manage_diffs_cmd
+            if not differ:
+                narrate("manage_diffs_cmd not set, trying report_diffs_cmd.")
+                differ = settings.report_diffs_cmd
+        else:
+            differ = settings.report_diffs_cmd
+            if not differ:
+                narrate("report_diffs_cmd not set, trying manage_diffs_cmd.")
+                differ = settings.manage_diffs_cmd
+        if not differ:
+            raise Error("no diff command available.")
+        return differ
+
+    @staticmethod
+    def run_differ(differ, archive_path, path):
+        if is_str(differ):
+            cmd = differ.format(
+                archive_path = str(archive_path),
+                local_path = str(path)
+            )
+            if cmd == differ:
+                cmd = split_cmd(differ) + [archive_path, path]
+        else:
+            cmd = differ + [archive_path, path]
+        try:
+            diff = Cmd(cmd, modes='soEW1')
+            diff.run()
+        except Error as e:
+            codicil = e.stdout if e.stdout and not e.stderr else None
+            e.report(codicil=codicil)
+        except KeyboardInterrupt:
+            log('user killed compare command.')
+            diff.kill()
+        return diff
+
+    @classmethod
+    def run_fast(cls, path, cmdline, settings, options):
+        # Compares the metadata recorded in the archive to that of the local
+        # files, so the archive is not mounted.  Borg is asked for the hashes
+        # of only those files whose modification times differ, and only the
+        # files found to be modified are extracted.
+        from .compare import (
+            ARCHIVE_FORMAT, HASH_FORMAT, Comparison, batches
+        )
+        if cmdline['--interactive']:
+            differ = cls.get_differ(settings, True)
+        archive, description = find_archive(settings, cmdline)
+        if description:
+            display(f'archive: {description}')
+        comparison = Comparison(path, get_archive_path(path, settings))
+
+        # read the metadata of the archived files
+        settings.run_borg(
+            cmd = "list",
+            borg_opts = ['--json-lines', f'--format={ARCHIVE_FORMAT}'],
+            args = [archive, comparison.archive_root],
+            assimilate_opts = options,
+            process_stdout = comparison.read_archive,
+        )
+        comparison.compare()
+
+        # compare the contents of files whose sizes match but times do not
+        if comparison.suspects:
+            narrate(
+                f"comparing contents of {plural(comparison.suspects):# file/s}."
+            )
+            paths = [comparison.archive_path(p) for p in comparison.suspects]
+            for batch in batches(paths):
+                settings.run_borg(
+                    cmd = "list",
+                    borg_opts = ['--json-lines', f'--format={HASH_FORMAT}'],
+                    args = [archive] + batch,
+                    assimilate_opts = options,
+                    process_stdout = comparison.read_hashes,
+                )
+            comparison.confirm()
+
+        # report the differences
+        differences = sorted(comparison.differences, key=lambda d: d[1])
+        lines = [
+            f"{kind:<14} {comparison.local_path(rel)}"
+            for kind, rel in differences
+        ]
+        if lines:
+            output("\n".join(lines))
+        narrate(
+            f"{plural(differences):# difference/s} found in",
+            f"{plural(comparison.num_files):# file/s}."
+        )
+        if not cmdline['--interactive']:
+            return 1 if differences else 0
+
+        # fetch the modified files and compare their contents
+        modified = [rel for kind, rel in differences if kind == "modified"]
+        if not modified:
+            return 1 if differences else 0
+        import tempfile
+        status = 0
+        with tempfile.TemporaryDirectory(prefix="assimilate-") as fetched:
+            with cd(fetched):
+                for batch in batches(modified):
+                    settings.run_borg(
+                        cmd = "extract",
+                        args = [archive] + [comparison.archive_path(p) for p in batch],
+                        assimilate_opts = options,
+                    )
+            for rel in modified:
+                diff = cls.run_differ(
+                    differ,
+                    to_path(fetched, comparison.archive_path(rel)),
+                    comparison.local_path(rel)
+                )
+                status = max(status, diff.status)
+        return status
+
 
 # ConfigsCommand command {{{1
 class ConfigsCommand(Command):
@@ -976,6 +1637,8 @@ class CreateCommand(Command):
 
         Options:
             -f, --fast        skip pruning and checking for a faster backup on a slow network
+            -j, --jobs <N>    back up as many as N configs of a composite config
+                              concurrently
             -l, --list        list the files and directories as they are processed
             -p, --progress    shows Borg progress
             -s, --stats       show Borg statistics
@@ -987,11 +1650,126 @@ class CreateCommand(Command):
 
         To see the files listed as they are backed up, use the Assimilate -v option.
         This can help you debug slow create operations.
+
+        When backing up a composite config, the sub-configs are normally backed
+        up one after the other.  Use ––jobs to back up several at once, which is
+        helpful when they use different repositories.  Each sub-config is backed
+        up in its own process and its output is shown once it completes.
         """
     ).strip()
     REQUIRES_EXCLUSIVITY = True
     COMPOSITE_CONFIGS = "all"
     LOG_COMMAND = True
+    WORKER_ENV_VAR = "ASSIMILATE_CREATE_WORKER"
+        # set in the environment of the processes that back up the sub-configs
+        # of a composite config concurrently
+
+    @classmethod
+    def run_early(cls, command, args, settings, options):
+        # read command line
+        cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
+        jobs = cmdline["--jobs"]
+        if not jobs or cls.WORKER_ENV_VAR in os.environ:
+            return None
+        try:
+            jobs = int(jobs)
+        except ValueError:
+            jobs = 0
+        if jobs <= 0:
+            raise Error(
+                f'expected positive integer, found ‘{cmdline["--jobs"]}’.',
+                culprit="--jobs"
+            )
+
+        # determine the configs to back up
+        shared_settings = read_settings('shared')
+        queue = ConfigQueue(cls)
+        queue.initialize(options.get("config"), shared_settings)
+        configs = queue.configs
+        if jobs == 1 or len(configs) == 1:
+            # nothing to do concurrently, run the configs in the normal way
+            return None
+
+        def get_settings(config):
+            # settings are only needed to run the first and last scripts
+            opts = dict(options, config=config)
+            opts["no-log"] = True
+            return Assimilate(config, opts, shared_settings=shared_settings)
+
+        # build the command line for the workers
+        # the workers run a single config, drop --jobs so they do not recurse
+        global_opts = [
+            opt for opt in "dry-run narrate quiet verbose no-log relocated".split()
+            if options.get(opt)
+        ]
+        if get_informer().mute:
+            global_opts.append("mute")
+        if options.get("name"):
+            global_opts.append(f"name={options['name']}")
+        create_opts = [
+            k if v is True else f"{k}={v}"
+            for k, v in cmdline.items()
+            if v and k.startswith('--') and k != "--jobs"
+        ]
+        env = dict(os.environ)
+        env[cls.WORKER_ENV_VAR] = "yes"
+
+        def back_up(config):
+            worker = Cmd(
+                [sys.executable, "-m", PROGRAM_NAME, f"--config={config}"]
+                + [f"--{opt}" for opt in global_opts]
+                + [command] + create_opts,
+                modes = "sOMW*",
+                env = env,
+            )
+            worker.run()
+            return worker
+
+        # run commands specified to be run before the first backup
+        cls.run_scripts(get_settings(configs[0]), ["run_before_first_backup"], "pre")
+
+        # back up the configs
+        from concurrent.futures import ThreadPoolExecutor
+        worst_exit_status = 0
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                workers = [(c, executor.submit(back_up, c)) for c in configs]
+                for i, (config, worker) in enumerate(workers):
+                    worker = worker.result()
+                    if i:
+                        display()
+                    display("===", config, "===")
+                    if worker.stdout:
+                        output(worker.stdout.rstrip())
+                    narrate(f"{config} exit status:", worker.status)
+                    worst_exit_status = max(worst_exit_status, worker.status)
+        finally:
+            # run commands specified to be run after the last backup
+            cls.run_scripts(
+                get_settings(configs[-1]), ["run_after_last_backup"], "post"
+            )
+        return worst_exit_status
+
+    @staticmethod
+    def shows_borg_output(borg_opts, options):
+        # borg writes its statistics to stdout when --json is given, which is
+        # captured, so its other output is only shown if it is requested
+        shown = "--list --progress --verbose".split()
+        if any(opt in borg_opts for opt in shown):
+            return True
+        if options.get("verbose") or options.get("narrate"):
+            return True
+        return None
+
+    @staticmethod
+    def run_scripts(settings, script_settings, kind):
+        for setting in script_settings:
+            for i, cmd in enumerate(settings.values(setting)):
+                narrate(f"staging {setting}[{i}] {kind}-backup script")
+                try:
+                    Run(cmd, "SoEW")
+                except Error as e:
+                    e.reraise(culprit=(setting, i, cmd.split()[0]))
 
     @classmethod
     def run(cls, command, args, settings, options):
@@ -999,8 +1777,12 @@ class CreateCommand(Command):
         # read command line
         cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
         borg_opts = []
-        if cmdline["--stats"] or settings.show_stats:
-            borg_opts.append("--stats")
+        show_stats = cmdline["--stats"] or settings.show_stats
+        if not options.get("dry-run"):
+            # borg reports its statistics and the id of the new archive in
+            # JSON at no extra cost; they are recorded in the history even if
+            # not shown.  neither is available on a dry run
+            borg_opts.append("--json")
         if cmdline["--list"]:
             borg_opts.append("--list")
         if cmdline["--timestamp"]:
@@ -1023,17 +1805,14 @@ class CreateCommand(Command):
                 )
 
         # run commands specified to be run before a backup
+        # workers leave the first and last scripts to the process that started
+        # them
+        worker = cls.WORKER_ENV_VAR in os.environ
         prerequisite_settings = []
-        if settings.is_first_config():
+        if settings.is_first_config() and not worker:
             prerequisite_settings.append("run_before_first_backup")
         prerequisite_settings.append("run_before_backup")
-        for setting in prerequisite_settings:
-            for i, cmd in enumerate(settings.values(setting)):
-                narrate(f"staging {setting}[{i}] pre-backup script")
-                try:
-                    Run(cmd, "SoEW")
-                except Error as e:
-                    e.reraise(culprit=(setting, i, cmd.split()[0]))
+        cls.run_scripts(settings, prerequisite_settings, "pre")
 
         # run borg
         src_dirs = settings.src_dirs
@@ -1047,8 +1826,11 @@ class CreateCommand(Command):
                             borg_opts = borg_opts.copy(),
                             args = [settings.value('archive')] + src_dirs,
                             assimilate_opts = options,
-                            show_borg_output = "--stats" in borg_opts or None,
+                            show_borg_output = cls.shows_borg_output(
+                                borg_opts, options
+                            ),
                             use_working_dir = True,
+                            publish_progress = True,
                         )
                         break
                     except Error as e:
@@ -1062,21 +1844,33 @@ class CreateCommand(Command):
                         seconds = max(settings.value("create_retry_sleep", 0), 0)
                         narrate(f"waiting for {seconds:.0f} seconds.")
                         sleep(seconds)
-                update_latest('create', settings.date_file, options)
+                stats = None
+                if borg.stdout and "--json" in borg_opts:
+                    try:
+                        stats = BorgStats.from_create_json(borg.stdout)
+                    except Error as e:
+                        warn(e)
+                if stats and show_stats:
+                    for name, value in stats.render(ARCHIVE_STATISTICS).items():
+                        output(f"{name}: {value}")
+                settings.update_latest('create', borg, stats=stats)
                 create_status = borg.status
-                hooks.report_results(borg)
+                hooks.report_results(borg, stats)
             finally:
                 # run commands specified to be run after a backup
                 postrequisite_settings = ["run_after_backup"]
-                if settings.is_last_config():
+                if settings.is_last_config() and not worker:
                     postrequisite_settings.append("run_after_last_backup")
-                for setting in postrequisite_settings:
-                    for i, cmd in enumerate(settings.values(setting)):
-                        narrate(f"staging {setting}[{i}] post-backup script")
-                        try:
-                            Run(cmd, "SoEW")
-                        except Error as e:
-                            e.reraise(culprit=(setting, i, cmd.split()[0]))
+                cls.run_scripts(settings, postrequisite_settings, "post")
+
+        # add the new archive to the file index
+        if settings.file_index and borg.stdout and "--json" in borg_opts:
+            try:
+                archive = json.loads(borg.stdout)["archive"]
+            except (ValueError, KeyError):
+                archive = None
+            if archive and archive.get("id"):
+                maintain_file_index(settings, options, archive)
 
         if cmdline["--fast"]:
             # update the date file
@@ -1188,6 +1982,7 @@ class DeleteCommand(Command):
         if out and not ('borg compact' in borg.stderr and settings.compact_after_delete):
             output(out.rstrip())
         delete_status = borg.status
+        maintain_file_index(settings, options)
 
         if cmdline["--fast"]:
             return delete_status
@@ -1224,10 +2019,20 @@ class DiffCommand(Command):
         Options:
             -R, --recursive                     show files in sub directories
                                                 when path is specified
+            -s, --summary                       show the amount of change in
+                                                each directory rather than
+                                                listing the files
+            -d, --depth <N>                     depth of the directories shown
+                                                by --summary [default: 3]
 
         Shows the differences between two archives.  You can constrain the 
         output listing to only those files in a particular directory by 
         adding that path to the end of the command.
+
+        With --summary the total size of the files added and removed, the 
+        number of bytes added to or removed from modified files, and the 
+        number of files that changed are shown for each directory.  Changes 
+        in directories deeper than --depth are included with their ancestor.
         """
     ).strip()
     REQUIRES_EXCLUSIVITY = True
@@ -1242,6 +2047,13 @@ class DiffCommand(Command):
         archive2 = cmdline["<archive2>"]
         path = cmdline['<path>']
         recursive = cmdline['--recursive']
+        summary = cmdline['--summary']
+        try:
+            depth = int(cmdline['--depth'])
+        except ValueError:
+            depth = 0
+        if depth < 1:
+            raise Error("--depth must be a positive integer.")
 
         # resolve the path relative to working directory
         if path:
@@ -1249,26 +2061,15 @@ class DiffCommand(Command):
         else:
             path = ''
 
-        # run borg
-        borg = settings.run_borg(
-            cmd = "diff",
-            args = [archive1, archive2],
-            assimilate_opts = options,
-            borg_opts = ['--json-lines'],
-        )
-
-        # convert from JSON-lines to JSON
-        json_data = '[' + ','.join(borg.stdout.splitlines()) + ']'
-        diffs = json.loads(json_data)
-
-        for diff in diffs:
-            this_path = diff['path']
-            if path:
-                if not this_path.startswith(path):
-                    continue  # skip files not on the path
-                if not recursive:
-                    if '/' in this_path[len(path)+1:]:
-                        continue  # skip files is subdirs of specified path
+        lines = []
+        def flush():
+            # write in batches as it is much faster than printing each line
+            if lines:
+                lines.append('')
+                sys.stdout.write('\n'.join(lines))
+                lines.clear()
+
+        def show(diff):
             changes = diff['changes'][0]
             type = changes.get('type', '')
             if 'size' in changes:
@@ -1277,10 +2078,48 @@ class DiffCommand(Command):
                 size = ''
             num_spaces = max(19 - len(type) - len(size), 1)
             sep = num_spaces * ' '
-            desc = type + sep + size
-            print(desc, this_path)
+            lines.append(f"{type}{sep}{size} {diff['path']}")
+            if len(lines) >= LIST_OUTPUT_BATCH:
+                flush()
+
+        def process_diffs(stream):
+            # each difference is processed as it arrives from borg, which has
+            # already discarded those that are not on the path; returns the
+            # number of differences reported by borg, including those not shown
+            if summary:
+                churn = DirectoryChurn(path, depth)
+            found = 0
+            for line in stream:
+                diff = json.loads(line)
+                found += 1
+                if summary:
+                    churn.add(diff)
+                elif path and not recursive:
+                    if '/' in diff['path'][len(path)+1:]:
+                        continue  # skip files is subdirs of specified path
+                    show(diff)
+                else:
+                    show(diff)
+            if summary and found:
+                lines.extend(churn.render())
+                if churn.reduced:
+                    lines.append(
+                        f"directories more than {churn.depth} levels deep are "
+                        "included with their ancestors."
+                    )
+            flush()
+            return found
 
-        return 1 if diffs else 0
+        # run borg
+        borg = settings.run_borg(
+            cmd = "diff",
+            args = [archive1, archive2] + ([path] if path else []),
+            assimilate_opts = options,
+            borg_opts = ['--json-lines'],
+            process_stdout = process_diffs,
+        )
+
+        return 1 if borg.from_process_stdout else 0
 
 
 # DueCommand command {{{1
@@ -1349,12 +2188,47 @@ class DueCommand(Command):
     OLDEST_DATE = {}    # type: dict[str, str]
     OLDEST_CONFIG = {}  # type: dict[str, str]
 
+    @classmethod
+    def run_early(cls, command, args, settings, options):
+        # Due is often run every few seconds by status bar programs, so unless
+        # mail is to be sent, the configs are processed here without building
+        # Assimilate objects; only the settings and date files are read.
+        cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
+        if cmdline["--email"]:
+            return None  # roots are needed, so use the normal path
+
+        from .status import StatusStore
+        shared_settings = read_settings('shared')
+        queue = ConfigQueue(cls)
+        queue.initialize(options.get('config'), shared_settings)
+        status_store = StatusStore(DATA_DIR)
+        exit_status = 0
+        for config in queue.configs:
+            settings = read_settings(config, shared_settings=shared_settings)
+            date_file = to_path(DATA_DIR, DATE_FILE.format(config_name=config))
+            latest = status_store.get_latest(config, date_file)
+            has_prune_settings = any(
+                settings.get("keep_" + s) for s in prune_intervals
+            )
+            status = cls.report_due(cmdline, config, latest, has_prune_settings)
+            exit_status = max(exit_status, status or 0)
+        status_store.close()
+        cls.run_late(command, args, None, options)
+        return exit_status
+
     @classmethod
     def run(cls, command, args, settings, options):
         # read command line
         cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
+        prune_settings = [("keep_" + s) for s in prune_intervals]
+        return cls.report_due(
+            cmdline, settings.config_name, settings.get_latest(),
+            any(settings.value(s) for s in prune_settings), settings.get_roots
+        )
+
+    @classmethod
+    def report_due(cls, cmdline, config, latest, has_prune_settings, get_roots=None):
         email = cmdline["--email"]
-        config = settings.config_name
         since_backup_thresh = cmdline.get("--since-backup")
         since_squeeze_thresh = cmdline.get("--since-squeeze")
         since_check_thresh = cmdline.get("--since-check")
@@ -1397,7 +2271,7 @@ class DueCommand(Command):
             cls.MESSAGES[config][action] = msg
             cls.MESSAGES['source'] = {}
             cls.MESSAGES['source']['host'] = hostname
-            cls.MESSAGES['source']['roots'] = settings.get_roots()
+            cls.MESSAGES['source']['roots'] = get_roots()
 
         def save_message(cmd):
             if not cmd:
@@ -1411,7 +2285,6 @@ class DueCommand(Command):
         deliver_message = email_message if email else save_message
 
         # Get date of last backup, and squeeze
-        latest = read_latest(settings.date_file)
         last_run = dict(
             backup = latest.get('create last run'),
             prune = latest.get('prune last run'),
@@ -1429,8 +2302,7 @@ class DueCommand(Command):
             squeeze_cmd = 'compact'
 
         # disable squeeze check if there are no prune settings
-        prune_settings = [("keep_" + s) for s in prune_intervals]
-        if not any(settings.value(s) for s in prune_settings):
+        if not has_prune_settings:
             last_run['squeeze'] = None
 
         # Record the name of the oldest config
@@ -1565,6 +2437,8 @@ class ExtractCommand(Command):
                                         the original file
             -l, --list                  list the files and directories as
                                         they are processed
+            -p, --progress              show progress as the files are
+                                        extracted
 
         You extract a file or directory using:
 
@@ -1617,6 +2491,8 @@ class ExtractCommand(Command):
         borg_opts = []
         if cmdline["--list"]:
             borg_opts.append("--list")
+        if cmdline["--progress"] or settings.show_progress:
+            borg_opts.append("--progress")
         if not cmdline["--force"]:
             if cwd().samefile(settings.working_dir):
                 raise Error(
@@ -1656,6 +2532,127 @@ class ExtractCommand(Command):
         return borg.status
 
 
+# FindCommand command {{{1
+class FindCommand(Command):
+    NAMES = "find".split()
+    DESCRIPTION = "find files in the archives using the file index"
+    USAGE = dedent(
+        """
+        Usage:
+            assimilate find [options] <glob>
+            assimilate find --update
+
+        Options:
+            -u, --update    add the archives that are missing from the index
+                            before searching
+
+        Searches an index of the files contained in the archives and shows
+        each version of each file whose path matches the glob, along with the
+        archives that contain it.  Borg is not run, so the search is fast.
+
+        If the glob does not contain a slash it is matched against the names of
+        the files, otherwise it is matched against the trailing part of their
+        paths as given in the archives.  The glob may contain * and ? as
+        wildcards, which also match slashes, and [] to match one of a set of
+        characters.  Be sure to quote the glob so that it is not expanded by
+        the shell.
+
+            $ assimilate find '*.conf'
+            $ assimilate find 'etc/ssh/*'
+
+        The index is kept in the data directory and is updated after each
+        create, prune, and delete if the file_index setting is true.  Use
+        ––update to add the archives that were created before then.  This
+        lists each archive that is missing from the index, which can take some
+        time, but each archive need only be listed once.
+        """
+    ).strip()
+    REQUIRES_EXCLUSIVITY = False
+    COMPOSITE_CONFIGS = "all"
+    LOG_COMMAND = False
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        # read command line
+        cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
+        glob = cmdline["<glob>"]
+
+        if cmdline["--update"]:
+            update_file_index(settings, options, add_missing=True)
+        if not glob:
+            return 0
+
+        index = get_file_index(settings)
+        if not index:
+            raise Error(
+                "file index is empty.",
+                codicil = 'Run "assimilate find --update" to create it.'
+            )
+        try:
+            files = index.find(glob)
+        finally:
+            index.close()
+
+        # group the archives that contain the same version of each file
+        versions = {}
+        for file in files:
+            path_versions = versions.setdefault(file['path'], {})
+            key = (file['type'], file['size'], file['mtime'])
+            path_versions.setdefault(key, []).append(file)
+
+        lines = []
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            for path, path_versions in versions.items():
+                lines.append(f"{path}:")
+                for (type, size, mtime), found in path_versions.items():
+                    modified = mtime.format(settings.time_format) if mtime else ''
+                    size = '' if size is None else Quantity(size, 'B')
+                    archives = archive_span(found)
+                    lines.append(f"    {modified}  {size!s:>8}  {archives}")
+        if lines:
+            output("\n".join(lines))
+        return 0 if versions else 1
+
+
+# FlushHooksCommand command {{{1
+class FlushHooksCommand(Command):
+    NAMES = "flush-hooks".split()
+    DESCRIPTION = "resend signals the monitoring services did not receive"
+    USAGE = dedent(
+        """
+        Usage:
+            assimilate flush-hooks
+
+        When the end of a backup cannot be reported to a monitoring service, it
+        is saved and reported when the next backup is run.  This command
+        reports them immediately.  Those that still cannot be delivered are
+        saved again.
+        """
+    ).strip()
+    REQUIRES_EXCLUSIVITY = False
+    COMPOSITE_CONFIGS = "all"
+    LOG_COMMAND = True
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        # read command line
+        process_cmdline(cls.USAGE, argv=[command] + args)
+
+        hooks = settings.hooks
+        if hooks.dry_run:
+            return
+        queued = hooks.resend_undelivered()
+        if not queued:
+            narrate("no undelivered signals.")
+            return 0
+        saved = hooks.wait()
+        display(
+            f"{settings.config_name}:",
+            f"{queued - saved} of {plural(queued):# signal/s} delivered."
+        )
+        return 1 if saved else 0
+
+
 # HelpCommand {{{1
 class HelpCommand(Command):
     NAMES = "help".split()
@@ -1692,6 +2689,152 @@ class HelpCommand(Command):
         return 0
 
 
+# HistoryCommand command {{{1
+class HistoryCommand(Command):
+    NAMES = "history".split()
+    DESCRIPTION = "show past runs and how long they took"
+    USAGE = dedent(
+        """
+        Usage:
+            assimilate history [options]
+
+        Options:
+            -a, --all              show runs of all commands
+            -c, --command <cmd>    show runs of this command [default: create]
+            -n, --runs <N>         show this many runs [default: 10]
+
+        Shows the recent runs of the create, prune, compact, or check command
+        for each config, along with how long each run took and, for create,
+        the size of the files backed up, the amount of new data added to the
+        repository, the number of files, and the throughput.  Runs that take
+        much longer than is typical, or that have much lower throughput, are
+        flagged.  The exit status is 1 if the most recent run is flagged.
+        """
+    ).strip()
+    REQUIRES_EXCLUSIVITY = False
+    COMPOSITE_CONFIGS = "all"
+    LOG_COMMAND = False
+    TYPICAL_RUNS = 10
+        # number of preceding runs used to determine what is typical
+    REGRESSION_FACTOR = 2
+        # runs that are this many times slower than typical are flagged
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        # read command line
+        cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
+        if cmdline["--all"]:
+            commands = borg_commands_with_history
+            cmd = None
+        else:
+            cmd = cmdline["--command"]
+            if cmd not in borg_commands_with_history:
+                raise Error(
+                    f"history is not kept for ‘{cmd}’.",
+                    codicil = f"Choose from {conjoin(borg_commands_with_history)}.",
+                    culprit = "--command",
+                )
+            commands = [cmd]
+        try:
+            num_runs = int(cmdline["--runs"])
+        except ValueError:
+            num_runs = 0
+        if num_runs <= 0:
+            raise Error(
+                f'expected positive integer, found ‘{cmdline["--runs"]}’.',
+                culprit="--runs"
+            )
+
+        # get the runs, along with those that establish what is typical
+        runs = settings.get_status_store().get_runs(
+            settings.config_name, cmd,
+            limit = (num_runs + cls.TYPICAL_RUNS)*len(commands)
+        )
+        if not runs:
+            output("No runs recorded.")
+            return 0
+        runs.reverse()
+
+        # summarize each run and compare it to the runs that preceded it
+        previous = {}
+        for run in runs:
+            elapsed = (run['ended'] - run['started']).total_seconds()
+            stats = run['stats'] = run['stats'] or BorgStats()
+            run.update(elapsed=elapsed, rate=stats.throughput, flags=[])
+
+            prior = previous.setdefault(run['command'], [])
+            if run['succeeded']:
+                cls.check_for_regressions(run, prior)
+                last = prior[-1]['stats'] if prior else None
+                if (
+                    last
+                    and stats.unique_chunks is not None
+                    and last.unique_chunks is not None
+                ):
+                    run['chunks_added'] = stats.unique_chunks - last.unique_chunks
+                prior.append(run)
+                del prior[:-cls.TYPICAL_RUNS]
+
+        # output the history
+        history = runs[-num_runs:]
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            for run in history:
+                output(cls.render_run(run, settings, show_command=not cmd))
+        return 1 if history[-1]['flags'] else 0
+
+    @classmethod
+    def check_for_regressions(cls, run, prior):
+        # compare to the median of the preceding successful runs
+        if len(prior) < 3:
+            return  # not enough runs to know what is typical
+        from statistics import median
+        factor = cls.REGRESSION_FACTOR
+        typical_elapsed = median(r['elapsed'] for r in prior)
+        if typical_elapsed and run['elapsed'] > factor*typical_elapsed:
+            run['flags'].append(
+                f"{run['elapsed']/typical_elapsed:.1f}× typical duration"
+            )
+            return
+        # a run that backs up more data is expected to take longer, so also
+        # check whether the data was backed up more slowly than typical
+        rates = [r['rate'] for r in prior if r['rate']]
+        if run['rate'] and len(rates) >= 3:
+            typical_rate = median(rates)
+            if run['rate']*factor < typical_rate:
+                run['flags'].append(
+                    f"{typical_rate/run['rate']:.1f}× lower throughput than typical"
+                )
+
+    @staticmethod
+    def render_run(run, settings, show_command):
+        started = run['started'].format(settings.time_format)
+        fields = [started]
+        if show_command:
+            fields.append(run["command"])
+        fields.append(when(run['ended'], relative_to=run['started']))
+        if not run['succeeded']:
+            fields.append(f"failed with status {run['status']}")
+        stats = run['stats']
+        if stats.original_size is not None:
+            fields.append(f"{Quantity(stats.original_size, 'B')} backed up")
+        if stats.deduplicated_size is not None:
+            fields.append(f"{Quantity(stats.deduplicated_size, 'B')} added")
+        if stats.nfiles is not None:
+            fields.append(f"{Quantity(stats.nfiles)} files")
+        if stats.compaction_saved is not None:
+            fields.append(f"{Quantity(stats.compaction_saved, 'B')} freed")
+        if stats.repo_size is not None:
+            fields.append(f"repository is {Quantity(stats.repo_size, 'B')}")
+        if run.get('chunks_added') is not None:
+            fields.append(f"{Quantity(run['chunks_added'])} chunks")
+        if run['rate']:
+            fields.append(f"{Quantity(run['rate'], 'B/s')}")
+        line = ", ".join(fields)
+        if run['flags']:
+            line += " ⚠ " + ", ".join(run['flags'])
+        return line
+
+
 # InfoCommand command {{{1
 class InfoCommand(Command):
     NAMES = "info".split()
@@ -1737,7 +2880,7 @@ class InfoCommand(Command):
             output(f"  settings directory: {settings.config_dir}")
             output(f"             logfile: {settings.logfile}")
             try:
-                latest = read_latest(settings.date_file)
+                latest = settings.get_latest()
                 date = latest.get('create last run')
                 if date:
                     output(f"     create last run: {date}, {when(date)} ago")
@@ -1798,6 +2941,8 @@ class ListCommand(Command):
             -G, --sort-by-group         sort by group
             -K, --sort-by-key <name>    sort by key (the Borg field name)
             -r, --reverse-sort          reverse the sort order
+            -U, --unsorted              do not sort, output files as Borg
+                                        produces them
             -R, --recursive             show files in sub directories
                                         when path is specified
 
@@ -1853,6 +2998,12 @@ class ListCommand(Command):
         example, sort by size, use:
 
             assimilate list -S
+
+        When sorting, the listing is held in memory until it exceeds the
+        amount given by the list_sort_memory setting, after which it is sorted
+        in pieces that are held in temporary files and then merged.  Use
+        ––unsorted to output the files in the order Borg produces them.  In
+        this case each file is output as soon as it is received from Borg.
         """
     ).strip()
     REQUIRES_EXCLUSIVITY = True
@@ -1871,16 +3022,7 @@ class ListCommand(Command):
             path = get_archive_path(path, settings)
 
         # predefined formats
-        formats = dict(
-            name = "{path}",
-            short = "{path}{Type}",
-            date = "{mtime} {path}{Type}",
-            size = "{size:8} {path}{Type}",
-            si = "{Size:7.2b} {path}{Type}",
-            owner = "{user:8} {path}{Type}",
-            group = "{group:8} {path}{Type}",
-            long = '{mode:10} {user:6} {group:6} {size:8} {mtime} {path}{extra}',
-        )
+        formats = LIST_FORMATS.copy()
 
         # choose format
         default_format = settings.list_default_format
@@ -1937,6 +3079,9 @@ class ListCommand(Command):
                     culprit = fmt,
                     codicil = f"Choose from: {conjoin(formats)}."
                 )
+        if cmdline["--unsorted"]:
+            sort_key = None
+        reverse_sort = cmdline["--reverse-sort"]
 
         # run borg
         template = formats[fmt]
@@ -1952,83 +3097,29 @@ class ListCommand(Command):
         if path:
             args.append(str(path))
 
-        borg = settings.run_borg(cmd="list", args=args, assimilate_opts=options)
-
-        # convert from JSON-lines to JSON
-        json_data = '[' + ','.join(borg.stdout.splitlines()) + ']'
-        lines = json.loads(json_data)
-
-        # sort the output
-        if sort_key:
-            try:
-                lines = sorted(lines, key=lambda x: x[sort_key])
-            except KeyError:
-                raise Error('unknown key.', culprit=sort_key)
-        if cmdline["--reverse-sort"]:
-            lines.reverse()
-
         # generate formatted output
-        no_color = lambda x: x
-        if cmdline['--no-color']:
-            healthy_color = broken_color = no_color
+        if cmdline['--no-color'] or not Color.isTTY():
+            healthy_color = broken_color = None
         else:
-            healthy_color = Color("green", enable=Color.isTTY())
-            broken_color = Color("red", enable=Color.isTTY())
-        total_size = 0
+            healthy_color = Color("green")
+            broken_color = Color("red")
         path = str(path or '')
-        for values in lines:
-            # this loop can be quite slow. the biggest issue is arrow. parsing
-            # time is slow. also output() can be slow, so use print() instead.
+
+        def on_path(values):
             if path:
                 if not values['path'].startswith(path):
-                    continue  # skip files not on the path
+                    return False  # skip files not on the path
                 if not recursive:
                     if '/' in values['path'][len(path)+1:]:
-                        continue  # skip files is subdirs of specified path
-            if 'healthy' in values:
-                colorize = healthy_color if values['healthy'] else broken_color
-                values['healthy'] = truth(values['healthy'], formatter='healthy/broken')
-            else:
-                colorize = no_color
-            type = values['mode'][0]
-            values['Type'] = ''
-            values['extra'] = ''
-            if type == 'd':
-                values['Type'] = '/'  # directory
-            elif type == 'l':
-                values['Type'] = '@'  # directory
-                values['extra'] = ' —> ' + values['target']
-            elif type == 'h':
-                values['extra'] = ' links to ' + values['target']
-            elif type == 'p':
-                values['Type'] = '|'
-            elif type != '-':
-                log('UNKNOWN TYPE:', type, values['path'])
-            if 'mtime' in values and 'mTime' in template:
-                values['mTime'] = arrow.get(values['mtime'])
-            if 'mtime' in values and 'mAgo' in template:
-                values['mAgo'] = arrow.get(values['mtime']).humanize()
-            if 'ctime' in values and 'cTime' in template:
-                values['cTime'] = arrow.get(values['ctime'])
-            if 'ctime' in values and 'cAgo' in template:
-                values['cAgo'] = arrow.get(values['ctime']).humanize()
-            if 'atime' in values and 'aTime' in template:
-                values['aTime'] = arrow.get(values['atime'])
-            if 'atime' in values and 'aAgo' in template:
-                values['aAgo'] = arrow.get(values['atime']).humanize()
-            if 'size' in values:
-                total_size += values['size']
-                if 'Size' in template:
-                    values['Size'] = Quantity(values['size'], "B")
-            if 'csize' in values and '{cSize' in template:
-                values['cSize'] = Quantity(values['csize'], "B")
-            if 'dsize' in values and '{dSize' in template:
-                values['dSize'] = Quantity(values['dsize'], "B")
-            if 'dcsize' in values and '{dcSize' in template:
-                values['dcSize'] = Quantity(values['dcsize'], "B")
+                        return False  # skip files is subdirs of specified path
+            return True
+
+        render = compile_list_format(template, healthy_color, broken_color)
+        lines = []
+
+        def show(values):
             try:
-                # use print rather than output because it is faster
-                print(colorize(template.format(**values)))
+                lines.append(render(values))
             except ValueError as e:
                 raise Error(
                     full_stop(e),
@@ -2037,7 +3128,54 @@ class ListCommand(Command):
                 )
             except KeyError as e:
                 raise Error('Unknown key in:', culprit=e, codicil=template)
+            if len(lines) >= LIST_OUTPUT_BATCH:
+                flush()
+            return values.get('size', 0)
+
+        def flush():
+            # write in batches rather than using output() or print() on each
+            # line because it is much faster
+            if lines:
+                lines.append('')
+                sys.stdout.write('\n'.join(lines))
+                lines.clear()
+
+        def process_listing(stream):
+            # Each line is decoded and filtered as it arrives from Borg.  If
+            # the output is not to be sorted, it is also output immediately,
+            # otherwise the entries that are to be shown are passed to the
+            # sorter, which spills them to disk if they exceed the budget.
+            total_size = 0
+            if not sort_key and not reverse_sort:
+                for line in stream:
+                    values = json.loads(line)
+                    if on_path(values):
+                        total_size += show(values)
+                flush()
+                return total_size
+
+            from .sorting import ExternalSort
+            max_memory = settings.list_sort_memory or DEFAULT_LIST_SORT_MEMORY
+            with ExternalSort(
+                sort_key, reverse_sort, int(max_memory), settings.data_dir
+            ) as sorter:
+                for line in stream:
+                    values = json.loads(line)
+                    if on_path(values):
+                        sorter.add(line, values)
+                for values in sorter:
+                    total_size += show(values)
+            flush()
+            return total_size
+
+        borg = settings.run_borg(
+            cmd = "list",
+            args = args,
+            assimilate_opts = options,
+            process_stdout = process_listing,
+        )
 
+        total_size = borg.from_process_stdout
         if total_size:
             total_size = Quantity(total_size, 'B')
             print(f"Total size = {total_size:0.2b}")
@@ -2208,6 +3346,7 @@ class PruneCommand(Command):
                                     those associated with chosen configuration
             -f, --fast              skip compacting
             -l, --list              show fate of each archive
+            -p, --progress          show progress as the archives are pruned
 
         The prune command deletes archives that are no longer needed as
         determined by the prune rules.  However, the disk space is not reclaimed
@@ -2230,6 +3369,8 @@ class PruneCommand(Command):
         borg_opts = archive_filter_options(settings, cmdline, default='all')
         if cmdline["--list"]:
             borg_opts.append("--list")
+        if cmdline["--progress"] or settings.show_progress:
+            borg_opts.append("--progress")
         fast = cmdline["--fast"]
 
         # checking the settings
@@ -2255,7 +3396,10 @@ class PruneCommand(Command):
         prune_status = borg.status
 
         # update the date file
-        update_latest('prune', settings.date_file, options)
+        settings.update_latest('prune', borg)
+
+        # remove the pruned archives from the file index
+        maintain_file_index(settings, options)
 
         if fast:
             return prune_status
@@ -2605,6 +3749,8 @@ class RestoreCommand(Command):
             -B, --before <date_or_age>        use first archive older than given
             -l, --list                        list the files and directories
                                               as they are processed
+            -p, --progress                    show progress as the files are
+                                              restored
 
         The path or paths given are the paths on the local filesystem.  The
         corresponding paths in the archive are computed by assuming that the
@@ -2640,6 +3786,8 @@ class RestoreCommand(Command):
         borg_opts = []
         if cmdline["--list"]:
             borg_opts.append("--list")
+        if cmdline["--progress"] or settings.show_progress:
+            borg_opts.append("--progress")
 
         # convert given paths into the equivalent paths found in the archive
         paths = get_archive_paths(paths, settings)
@@ -2775,6 +3923,8 @@ class UmountCommand(Command):
         """
         Usage:
             assimilate umount [<mount_point>]
+
+        Any archives that compare left mounted for reuse are also unmounted.
         """
     ).strip()
     REQUIRES_EXCLUSIVITY = True
@@ -2910,3 +4060,193 @@ class VersionCommand(Command):
         from . import __version__, __released__
 
         output(f"assimilate version: {__version__}  ({__released__}) [{python}].")
+
+
+# VersionsCommand command {{{1
+class VersionsCommand(Command):
+    NAMES = "versions".split()
+    DESCRIPTION = "show the versions of a file held in the archives"
+    USAGE = dedent(
+        """
+        Usage:
+            assimilate versions [options] <path>
+
+        Options:
+            -f, --first <N>         consider first N archives that remain
+            -l, --last <N>          consider last N archives that remain
+            -n, --newer <age>       only consider archives newer than age
+            -o, --older <age>       only consider archives older than age
+            -j, --jobs <N>          query up to N archives at once
+
+        Shows how a file has changed over time.  Each archive is checked for
+        the file, and the archives that hold the same version of it are
+        grouped to give a timeline of its versions, oldest first.  Each version
+        is shown with its modification time and size and the archives that
+        hold it.
+
+        The path is given as it is on the local filesystem, and the file need
+        no longer exist.  Copies of the file are taken to be the same version
+        if their sizes and modification times are the same.  If only their
+        modification times differ, their contents are compared using hashes
+        computed by Borg.
+
+        The number at the start of each line is the index of the most recent
+        archive that holds that version, with 0 being the most recent archive.
+        Use it to restore or extract that version:
+
+            $ assimilate versions ~/.bashrc
+            $ assimilate restore ––archive 3 ~/.bashrc
+
+        By default all archives are checked, however you can limit those
+        checked using ––first, ––last, ––newer, and ––older.  See the help
+        message for the repo-list command for more detail on these options.
+
+        Borg only takes a shared lock on the repository while listing an
+        archive, so several archives are queried at once, 4 unless ––jobs is
+        given.  Use ––jobs=1 to query one archive at a time.  What is found in
+        each archive is saved in the data directory and reused, so only the
+        archives created since the file was last looked up need be queried.
+        If the file_index setting is true, archives in the file index are not
+        queried.
+        """
+    ).strip()
+    REQUIRES_EXCLUSIVITY = True
+    COMPOSITE_CONFIGS = "first"
+    LOG_COMMAND = True
+
+    @classmethod
+    def run(cls, command, args, settings, options):
+        from .versions import (
+            VERSION_FORMAT, VersionCache, group_versions, merge_versions,
+            needs_hash, read_hash, read_version
+        )
+        from .compare import HASH_FORMAT
+
+        # read command line
+        cmdline = process_cmdline(cls.USAGE, argv=[command] + args)
+        path = cmdline["<path>"]
+        jobs = cls.get_count(cmdline, "--jobs") or DEFAULT_VERSIONS_JOBS
+        if to_path(path).is_dir():
+            raise Error("is a directory.", culprit=path)
+        archive_path = str(get_archive_path(path, settings))
+
+        # select the archives
+        available = ArchiveIndex(get_available_archives(settings))
+        start, stop = available.select(cmdline)
+        archives = available.archives[start:stop]
+        if not archives:
+            raise Error("no archives available.")
+
+        def list_archive(archive, fmt, reader):
+            borg = settings.run_borg(
+                cmd = "list",
+                borg_opts = ['--json-lines', f'--format={fmt}'],
+                args = [f"aid:{archive['id']}", archive_path],
+                assimilate_opts = options,
+                process_stdout = lambda lines: reader(archive_path, lines),
+            )
+            return borg.from_process_stdout
+
+        cache = VersionCache(
+            settings.data_dir / settings.resolve('VERSIONS_FILE', VERSIONS_FILE)
+        )
+        try:
+            # find what each archive holds, querying those not yet known
+            cache.forget(a['id'] for a in available.archives)
+            found = {}
+            if settings.file_index:
+                index = get_file_index(settings)
+                try:
+                    found.update(index.lookup(archive_path))
+                finally:
+                    index.close()
+            found.update(cache.get(archive_path))
+            missing = [a for a in archives if a['id'] not in found]
+            if missing:
+                narrate(f"querying {plural(missing):# archive/s}.")
+            queries = cls.query_archives(
+                missing, jobs, settings,
+                lambda a: list_archive(a, VERSION_FORMAT, read_version)
+            )
+            for archive, metadata in queries:
+                cache.add(archive_path, archive['id'], metadata)
+                found[archive['id']] = metadata
+            versions = group_versions(archives, found)
+
+            # compare the contents of versions that differ only in their times
+            wanted = needs_hash(versions)
+            if wanted:
+                narrate(f"comparing contents of {plural(wanted):# version/s}.")
+            queries = cls.query_archives(
+                [v['archives'][-1] for v in wanted], jobs, settings,
+                lambda a: list_archive(a, HASH_FORMAT, read_hash)
+            )
+            for version, (archive, hash) in zip(wanted, queries):
+                version['metadata'] = dict(version['metadata'], hash=hash)
+                cache.add(archive_path, archive['id'], version['metadata'])
+            versions = merge_versions(versions)
+        finally:
+            cache.close()
+
+        # show the timeline
+        index_of = {
+            a['id']: len(available) - i - 1
+            for i, a in enumerate(available.archives)
+        }
+        rows = []
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            for version in versions:
+                metadata = version['metadata']
+                if metadata:
+                    index = index_of[version['archives'][-1]['id']]
+                    mtime = metadata['mtime']
+                    modified = ''
+                    if mtime is not None:
+                        modified = arrow.Arrow.fromtimestamp(mtime/1e6)
+                        modified = modified.format(settings.time_format)
+                    size = metadata['size']
+                    size = '' if size is None else Quantity(size, 'B')
+                else:
+                    index, modified, size = '', 'not present', ''
+                rows.append((index, modified, size, archive_span(version['archives'])))
+        width = max(len(r[1]) for r in rows)
+        lines = [f"{archive_path}:"] + [
+            f"    {index!s:>3}  {modified:<{width}}  {size!s:>8}  {archives}"
+            for index, modified, size, archives in rows
+        ]
+        output("\n".join(lines))
+        return 0 if any(v['metadata'] for v in versions) else 1
+
+    @staticmethod
+    def get_count(cmdline, opt):
+        value = cmdline[opt]
+        if not value:
+            return None
+        try:
+            count = int(value)
+        except ValueError:
+            count = 0
+        if count <= 0:
+            raise Error(f'expected positive integer, found ‘{value}’.', culprit=opt)
+        return count
+
+    @staticmethod
+    def query_archives(archives, jobs, settings, query):
+        # Generates each archive along with the result of query, in order.  The
+        # archives are queried concurrently as borg list only takes a shared
+        # lock on the repository.
+        if jobs == 1 or len(archives) <= 1:
+            for archive in archives:
+                yield archive, query(archive)
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        with settings.concurrent_borg():
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [(a, executor.submit(query, a)) for a in archives]
+                try:
+                    for archive, future in futures:
+                        yield archive, future.result()
+                finally:
+                    # do not start the remaining queries if one fails
+                    for archive, future in futures:
+                        future.cancel()
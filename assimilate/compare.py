@@ -0,0 +1,233 @@
+# Compare
+#
+# Compares local files to those in an archive without mounting the archive.
+# The metadata of the files in the archive is read from the output of borg list,
+# which is consumed as it is produced, and the local files are found by walking
+# the directory tree with os.scandir().  A file is taken to be unchanged if its
+# type, size and modification time all match.  If only the modification time
+# differs, the contents are compared by hashing: Borg computes the hashes of
+# just those files in the archive, and the local files are hashed in a pool of
+# processes.  Only the contents of files that are found to differ need be
+# fetched from the archive.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import hashlib
+import json
+import os
+import stat
+from datetime import datetime, timedelta, timezone
+from inform import Error, os_error, warn
+
+
+# Globals {{{1
+ARCHIVE_FORMAT = "{type}{size}{mtime}{target}{path}"
+    # the fields requested from borg list
+HASH_ALGORITHM = "sha256"
+    # must be one that both Borg and hashlib support
+HASH_FORMAT = f"{{{HASH_ALGORITHM}}}{{path}}"
+HASH_BLOCK_SIZE = 1 << 20
+HASH_POOL_THRESHOLD = 8
+    # fewer files than this are hashed without starting a pool of processes
+PATH_BATCH = 256
+    # maximum number of paths passed to a single invocation of Borg
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+# to_microseconds() {{{1
+def to_microseconds(timestamp):
+    """Convert a timestamp given by Borg to microseconds since the epoch
+
+    Borg gives times to the nearest microsecond.  Those without a time zone are
+    in local time.
+    """
+    when = datetime.fromisoformat(timestamp)
+    if when.tzinfo is None:
+        when = when.astimezone()
+    return (when - EPOCH) // MICROSECOND
+
+
+# hash_file() {{{1
+def hash_file(path):
+    """Return the hash of the contents of a file, or None if it cannot be read"""
+    digest = hashlib.new(HASH_ALGORITHM)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+# batches() {{{1
+def batches(items, size=PATH_BATCH):
+    """Split a list into lists that are no longer than size"""
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+
+# Comparison class {{{1
+class Comparison:
+    """Compares a local file or directory to its counterpart in an archive
+
+    local_root (path):
+        The local file or directory.
+    archive_root (str):
+        The path to the same file or directory as stored in the archive.
+
+    Use read_archive() to consume the output of borg list, run with
+    --json-lines and ARCHIVE_FORMAT, then call compare().  Any files whose
+    contents must be checked are given by suspects; consume the output of borg
+    list run on those files with HASH_FORMAT using read_hashes() and call
+    confirm().  The differences found are given by differences as a list of
+    (kind, path) pairs, where path is relative to local_root.
+    """
+
+    def __init__(self, local_root, archive_root):
+        self.local_root = str(local_root)
+        self.archive_root = str(archive_root).rstrip("/")
+        self.archived = {}
+        self.archive_hashes = {}
+        self.differences = []
+        self.suspects = []
+        self.num_files = 0
+
+    # archive_path() {{{2
+    def archive_path(self, rel):
+        """The path of a file in the archive given its path relative to the root"""
+        return f"{self.archive_root}/{rel}" if rel else self.archive_root
+
+    # local_path() {{{2
+    def local_path(self, rel):
+        """The path of a local file given its path relative to the root"""
+        return os.path.normpath(os.path.join(self.local_root, rel))
+
+    # relative() {{{2
+    def relative(self, path):
+        if path == self.archive_root:
+            return ""
+        if path.startswith(self.archive_root + "/"):
+            return path[len(self.archive_root)+1:]
+
+    # read_archive() {{{2
+    def read_archive(self, lines):
+        """Consume the metadata of the archived files; returns their number"""
+        for line in lines:
+            entry = json.loads(line)
+            rel = self.relative(entry["path"])
+            if rel is None:
+                continue  # a sibling that shares the prefix of the root
+            kind = entry.get("type", "")
+            if kind == "-":
+                mtime = entry.get("mtime")
+                metadata = (
+                    kind, entry.get("size"), to_microseconds(mtime) if mtime else None
+                )
+            elif kind == "l":
+                metadata = (kind, entry.get("target"))
+            else:
+                metadata = (kind,)
+            self.archived[rel] = metadata
+        return len(self.archived)
+
+    # walk() {{{2
+    def walk(self):
+        """Generate the relative path and status of each local file"""
+        try:
+            st = os.lstat(self.local_root)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            raise Error(os_error(e))
+        yield "", st
+        if not stat.S_ISDIR(st.st_mode):
+            return
+        pending = [""]
+        while pending:
+            rel = pending.pop()
+            try:
+                with os.scandir(self.local_path(rel)) as entries:
+                    for entry in entries:
+                        path = f"{rel}/{entry.name}" if rel else entry.name
+                        try:
+                            yield path, entry.stat(follow_symlinks=False)
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(path)
+                        except OSError as e:
+                            warn(os_error(e))
+            except OSError as e:
+                warn(os_error(e))
+
+    # compare() {{{2
+    def compare(self):
+        """Compare the metadata of the local files to that of the archived files"""
+        archived = self.archived
+        for rel, st in self.walk():
+            self.num_files += 1
+            kind = stat.filemode(st.st_mode)[0]
+            metadata = archived.pop(rel, None)
+            if metadata is None:
+                self.differences.append(("added", rel))
+            elif kind != metadata[0]:
+                self.differences.append(("changed type", rel))
+            elif kind == "-":
+                size, mtime = metadata[1:]
+                if size != st.st_size:
+                    self.differences.append(("modified", rel))
+                elif mtime != st.st_mtime_ns // 1000:
+                    self.suspects.append(rel)
+            elif kind == "l":
+                try:
+                    target = os.readlink(self.local_path(rel))
+                except OSError as e:
+                    warn(os_error(e))
+                    continue
+                if target != metadata[1]:
+                    self.differences.append(("changed link", rel))
+        self.differences.extend(("removed", rel) for rel in archived)
+        self.archived = {}
+        return self.differences
+
+    # read_hashes() {{{2
+    def read_hashes(self, lines):
+        """Consume the hashes of the suspect files as computed by Borg"""
+        for line in lines:
+            entry = json.loads(line)
+            rel = self.relative(entry["path"])
+            if rel is not None:
+                self.archive_hashes[rel] = entry.get(HASH_ALGORITHM)
+        return len(self.archive_hashes)
+
+    # confirm() {{{2
+    def confirm(self, jobs=None):
+        """Hash the local suspects and add those that differ to the differences"""
+        paths = [self.local_path(rel) for rel in self.suspects]
+        if len(paths) < HASH_POOL_THRESHOLD:
+            hashes = [hash_file(p) for p in paths]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                chunksize = max(1, len(paths) // (4*(jobs or os.cpu_count() or 1)))
+                hashes = list(pool.map(hash_file, paths, chunksize=chunksize))
+        for rel, local_hash in zip(self.suspects, hashes):
+            if local_hash is None or local_hash != self.archive_hashes.get(rel):
+                self.differences.append(("modified", rel))
+        self.suspects = []
+        return self.differences
@@ -18,7 +18,7 @@
 # along with this program.  If not, see http://www.gnu.org/licenses.
 
 # IMPORTS {{{1
-from .preferences import CONFIG_DIR
+from .preferences import CONFIG_DIR, DATA_DIR, SETTINGS_CACHE_FILE
 from .utilities import (
     report_voluptuous_errors, Quantity, InvalidNumber, lsf, to_path, chmod, getmod
 )
@@ -29,6 +29,8 @@ from inform import (
 from voluptuous import Schema, Invalid, MultipleInvalid, Extra
 import nestedtext as nt
 import functools
+import json
+import os
 
 
 # VALIDATORS {{{1
@@ -101,6 +103,19 @@ def as_quantity(arg):
         raise Invalid(f"expected number, found ‘{arg}’")
     return arg
 
+# as_bytes {{{2
+# raise error if value is a string that cannot be cast to a number of bytes
+# SI and binary scale factors are allowed, as are the units (ex. 1GB, 1MiB)
+def as_bytes(arg):
+    arg = as_string(arg).strip()
+    try:
+        arg = Quantity(arg, binary=True, ignore_sf=False)
+    except InvalidNumber:
+        raise Invalid(f"expected number of bytes, found ‘{arg}’")
+    if arg.units and arg.units not in ["B", "bytes", "byte"]:
+        raise Invalid(f"expected bytes, found ‘{arg.units}’")
+    return arg
+
 # as_lines {{{2
 # raise error if value is not a list of strings
 # converts a string to a list by splitting on newlines
@@ -335,6 +350,10 @@ ASSIMILATE_SETTINGS = dict(
         desc = "encryption method (see Borg documentation)",
         validator = as_name,
     ),
+    event_log = dict(
+        desc = "record the events of each command as JSON lines in the data directory",
+        validator = as_bool,
+    ),
     excludes = dict(
         desc = "list of glob strings of files or directories to skip",
         validator = as_lines,
@@ -343,6 +362,10 @@ ASSIMILATE_SETTINGS = dict(
         desc = "file that contains exclude patterns",
         validator = as_path,
     ),
+    file_index = dict(
+        desc = "keep an index of the files in the archives for the find command",
+        validator = as_bool,
+    ),
     get_repo_size = dict(
         desc = "record the amount of disk space need to hold the repository",
         validator = as_bool,
@@ -364,6 +387,14 @@ ASSIMILATE_SETTINGS = dict(
         validator = as_dict,
         do_not_expand = True,
     ),
+    list_sort_memory = dict(
+        desc = "memory the list command may use when sorting before spilling to temporary files [B]",
+        validator = as_bytes,
+    ),
+    mount_cache_ttl = dict(
+        desc = "how long archives mounted by compare remain mounted once idle [m]",
+        validator = as_string,
+    ),
     must_exist = dict(
         desc = "if set, each of these files or directories must exist or create will quit with an error",
         validator = as_paths,
@@ -449,8 +480,12 @@ ASSIMILATE_SETTINGS = dict(
         desc = "commands to run before first Borg command is run",
         validator = as_lines,
     ),
+    share_ssh_connections = dict(
+        desc = "reuse SSH connections to each host for the duration of the command",
+        validator = as_bool,
+    ),
     show_progress = dict(
-        desc = "show borg progress when running create or compact commands",
+        desc = "show borg progress when running create, check, prune, extract, or restore",
         validator = as_bool,
     ),
     show_stats = dict(
@@ -520,8 +555,10 @@ READ_ONLY_SETTINGS = set(k for k, v in ASSIMILATE_SETTINGS.items() if v["validat
 
 # add_setting() {{{3
 def add_setting(name, desc, validator):
+    global schema_validator
     assert name not in ASSIMILATE_SETTINGS
     ASSIMILATE_SETTINGS[name] = dict(desc=desc, validator=validator)
+    schema_validator = None
 
 # Borg settings {{{2
 BORG_SETTINGS = dict(
@@ -740,7 +777,12 @@ assert not (ASSIMILATE_SETTINGS.keys() & BORG_SETTINGS.keys())
 
 # SCHEMA {{{1
 # build_validator() {{{2
+schema_validator = None
 def build_validator():
+    # the schema is built once and reused unless a setting is added
+    global schema_validator
+    if schema_validator:
+        return schema_validator
     schema = {
         'include': as_path,
         Extra: as_string
@@ -755,7 +797,8 @@ def build_validator():
         for k, v in BORG_SETTINGS.items()
         if v['validator'] is not False
     })
-    return Schema(schema)
+    schema_validator = Schema(schema)
+    return schema_validator
 
 
 # CODE {{{1
@@ -791,8 +834,22 @@ def get_available_configs(keep_shared=False):
         return available_configs
     return {k:v for k, v in available_configs.items() if k != 'shared'}
 
-# report_setting_error() {{{2
+# get_keymap() {{{2
+# Keymaps are needed only to report errors, so they are not available for
+# settings files that were not read because their settings were cached.  In that
+# case the file is read when its keymap is first needed.
 keymaps = defaultdict(dict)
+def get_keymap(path):
+    keymap = keymaps[path]
+    if keymap is None:
+        keymap = keymaps[path] = {}
+        try:
+            nt.load(path, top=dict, keymap=keymap, normalize_key=normalize_key)
+        except (OSError, nt.NestedTextError):
+            pass
+    return keymap
+
+# report_setting_error() {{{2
 def report_setting_error(keys, *args, **kwargs):
     if is_str(keys):
         keys = tuple(keys.split())
@@ -804,7 +861,7 @@ def report_setting_error(keys, *args, **kwargs):
         codicil = ()
 
     for path in reversed(keymaps.keys()):
-        keymap = keymaps[path]
+        keymap = get_keymap(path)
         loc = keymap.get(keys)
         if loc:
             culprit = (path,) + keys
@@ -818,16 +875,26 @@ def report_setting_error(keys, *args, **kwargs):
 
 
 # read_config() {{{2
-def read_config(path, validate_settings):
+def read_config(path, validate_settings, chain=None, contents=None):
     # read a file and recursively process includes
+    # the files read are added to chain if given
+    # contents maps paths to the unvalidated settings they hold; files found
+    # there are not read again, and files that are read are added to it
+    if chain is not None:
+        chain.append(path)
     try:
-        keymap = keymaps[str(path)]
-        settings = nt.load(
-            path, top=dict, keymap=keymap, normalize_key=normalize_key
-        )
+        if contents is not None and str(path) in contents:
+            settings = contents[str(path)]
+        else:
+            settings = nt.load(
+                path, top=dict, keymap=keymaps[str(path)],
+                normalize_key=normalize_key
+            )
+            if contents is not None:
+                contents[str(path)] = settings
         settings = validate_settings(settings)
     except MultipleInvalid as e:  # report schema violations
-        report_voluptuous_errors(e, keymap, path)
+        report_voluptuous_errors(e, get_keymap(str(path)), path)
         terminate(2)
 
     # check file permissions
@@ -841,7 +908,9 @@ def read_config(path, validate_settings):
     include = settings.pop('include', None)
     if include:
         include = to_path(path.parent, include)
-        included_settings = read_config(include, validate_settings)
+        included_settings = read_config(
+            include, validate_settings, chain, contents
+        )
         included_settings.update(settings)
         settings = included_settings
 
@@ -858,7 +927,7 @@ def read_settings(name, config_dir=None, shared_settings=None):
 
     # read the settings file
     if name in configs:
-        new_settings = read_config(configs[name], build_validator())
+        new_settings = read_cached_config(name, configs[name])
     else:
         new_settings = {}  # this can happen for name == 'shared'
 
@@ -886,6 +955,93 @@ def read_settings(name, config_dir=None, shared_settings=None):
 
     return settings
 
+# SETTINGS CACHE {{{1
+# Parsing the settings files dominates the run time of quick commands such as
+# due, so their contents are cached as JSON in the data directory.  The cached
+# contents are validated on every run, so validators added by add_setting()
+# apply to them.  The cache is keyed by a hash of this file, which determines
+# how the settings files are parsed, and by the path, modification time, size
+# and mode of each file in the include chain.  Including the mode assures that
+# file permissions are checked after they change.  Settings files that contain
+# a passphrase are not cached so that it is not copied into the data directory.
+
+# get_file_signatures() {{{2
+def get_file_signatures(paths):
+    signatures = []
+    for path in paths:
+        stat = os.stat(path)
+        signatures.append([str(path), stat.st_mtime_ns, stat.st_size, stat.st_mode])
+    return signatures
+
+# get_source_hash() {{{2
+@functools.cache
+def get_source_hash():
+    import hashlib
+    with open(__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# read_cached_config() {{{2
+def read_cached_config(name, path):
+    cache_path = to_path(DATA_DIR, SETTINGS_CACHE_FILE.format(config_name=name))
+    validator = build_validator()
+
+    # use the cached contents if they are still current
+    try:
+        cache = json.loads(cache_path.read_text())
+        signatures = cache['signatures']
+        if (
+            cache['source'] == get_source_hash()
+            and signatures[0][0] == str(path)
+            and signatures == get_file_signatures(s[0] for s in signatures)
+        ):
+            narrate("using cached settings:", name)
+            for signature in signatures:
+                keymaps.setdefault(signature[0], None)
+            return read_config(path, validator, contents=cache['contents'])
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+        # a damaged or incompatible cache is simply replaced
+        narrate("ignoring settings cache:", e, culprit=cache_path)
+
+    # read and validate the settings files
+    chain = []
+    contents = {}
+    settings = read_config(path, validator, chain, contents)
+
+    # save the contents for next time
+    # the temporary file is unique so that concurrent runs do not collide
+    if any('passphrase' in c for c in contents.values()):
+        narrate("settings contain a passphrase, not cached:", name)
+        try:
+            cache_path.unlink()
+        except OSError:
+            pass
+    elif cache_path.parent.is_dir():
+        import tempfile
+        tmp_path = None
+        cache = dict(
+            source = get_source_hash(),
+            signatures = get_file_signatures(chain),
+            contents = contents,
+        )
+        try:
+            with tempfile.NamedTemporaryFile(
+                'w', dir=cache_path.parent, prefix=cache_path.name + '.',
+                suffix='.tmp', delete=False
+            ) as f:
+                tmp_path = f.name
+                json.dump(cache, f)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            narrate("cannot write settings cache:", e, culprit=cache_path)
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    return settings
+
 # convert_name_to_option() {{{2
 # utility function that converts setting names to borg option names
 def convert_name_to_option(name):
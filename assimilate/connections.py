@@ -0,0 +1,128 @@
+# SSH Connections
+#
+# Shares SSH connections to a host for the duration of an Assimilate command.
+# The first SSH process to connect to a host becomes the master and leaves
+# a control socket that later SSH processes use rather than establishing their
+# own connection.  The sockets belong to this process and are kept in the
+# user's runtime directory, or in a private directory in /tmp if there is none.
+# The masters are closed when the command terminates.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import os
+from inform import Error, log, narrate
+from .preferences import SSH_CONTROL_PERSIST
+from .utilities import Run, to_path
+
+# Globals {{{1
+control_prefix = f"ssh-{os.getpid()}-"
+    # control sockets are specific to this process so that they can be closed
+    # when it terminates without disturbing other assimilate processes
+max_control_path = 108 - 1 - 17 - 40
+    # a socket path must fit in the 108 bytes of sun_path, and ssh replaces %C
+    # with 40 characters and appends 17 more while creating the socket
+enabled = False
+control_dir = None
+
+
+# Utilities {{{1
+# get_control_dir() {{{2
+def get_control_dir():
+    """Directory that holds the control sockets
+
+    The user's runtime directory is used if available, otherwise a directory
+    private to the user is created in /tmp.  Both are short, unlike the data
+    directory, which can be too long to hold a socket.  Returns None if no
+    suitable directory is available.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        path = to_path(runtime_dir, "assimilate")
+    else:
+        path = to_path("/tmp", f"assimilate-{os.getuid()}")
+    try:
+        path.mkdir(mode=0o700, exist_ok=True)
+        stat = path.lstat()
+    except OSError as e:
+        narrate("cannot share SSH connections:", e)
+        return None
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        # another user could intercept the connections
+        narrate("cannot share SSH connections: not private.", culprit=path)
+        return None
+    if len(str(path / control_prefix)) > max_control_path:
+        narrate("cannot share SSH connections: path too long.", culprit=path)
+        return None
+    return path
+
+
+# share_connections() {{{2
+def share_connections():
+    """Enable connection sharing for the remainder of this process"""
+    global enabled, control_dir
+    if not enabled:
+        control_dir = get_control_dir()
+        enabled = bool(control_dir)
+
+
+# ssh_options() {{{2
+def ssh_options():
+    """SSH options needed to share connections
+
+    Returns an empty list if connection sharing is not enabled.
+    """
+    if not enabled:
+        return []
+    control_path = control_dir / (control_prefix + "%C")
+    return [
+        "-o", "ControlMaster=auto",
+        "-o", f"ControlPath={control_path!s}",
+        "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+    ]
+
+
+# add_ssh_options() {{{2
+def add_ssh_options(ssh_command):
+    """Add the options needed to share connections to an SSH command string"""
+    options = ssh_options()
+    if not options or "ControlPath=" in ssh_command:
+        return ssh_command
+    return " ".join([ssh_command] + options)
+
+
+# close_connections() {{{2
+def close_connections():
+    """Close the master connections created by this process"""
+    if not enabled:
+        return
+    for control_path in control_dir.glob(control_prefix + "*"):
+        narrate("closing shared SSH connection:", control_path.name)
+        try:
+            # a host is required but is ignored given an explicit socket
+            Run(
+                ["ssh", "-o", f"ControlPath={control_path!s}", "-O", "exit", "localhost"],
+                "sOEW*", log=False
+            )
+        except Error as e:
+            log(e)
+        try:
+            control_path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log(e)
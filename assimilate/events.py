@@ -0,0 +1,105 @@
+# Events
+#
+# A record of each invocation of Assimilate that is intended to be read by
+# programs rather than people.  Each event is written as a single line of JSON
+# to the event log in the data directory.  The log is opened in append mode and
+# each line is written with a single call to write(), so the lines from
+# concurrent invocations are not interleaved and a program that is following
+# the log never sees a partial record, except possibly at its very end while the
+# record is being written.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import json
+import os
+import re
+import uuid
+import arrow
+from inform import os_error, warn
+
+# Globals {{{1
+REDACTED = "❬redacted❭"
+SECRET_ENV_VARS = "BORG_PASSPHRASE".split()
+url_password = re.compile(r"(?<=://)([^/:@]+):([^/@]+)@")
+
+
+# redact() {{{1
+def redact(command):
+    """Return a copy of a command with any secrets it contains removed
+
+    This removes passwords embedded in URLs and the values of any environment
+    variables that hold secrets.
+    """
+    secrets = [os.environ[name] for name in SECRET_ENV_VARS if os.environ.get(name)]
+    redacted = []
+    for arg in command:
+        arg = url_password.sub(rf"\1:{REDACTED}@", str(arg))
+        for secret in secrets:
+            arg = arg.replace(secret, REDACTED)
+        redacted.append(arg)
+    return redacted
+
+
+# EventLog class {{{1
+class EventLog:
+    """Writes events as JSON lines
+
+    path (path):
+        The file to which the events are appended.  If not given, the events are
+        discarded.
+    fields:
+        Fields added to every event.  An identifier that is unique to this
+        invocation is added as *invocation*.
+
+    Each event has the fields *time*, *invocation* and *event*, which gives the
+    kind of event, along with any fields passed to emit().
+    """
+
+    def __init__(self, path=None, **fields):
+        self.fd = None
+        self.fields = dict(invocation=uuid.uuid4().hex, **fields)
+        if path:
+            try:
+                self.fd = os.open(
+                    path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600
+                )
+            except OSError as e:
+                warn("cannot open event log:", os_error(e))
+
+    # emit() {{{2
+    def emit(self, event, **fields):
+        """Append an event to the log"""
+        if self.fd is None:
+            return
+        record = dict(time=str(arrow.now()), event=event, **self.fields)
+        record.update(fields)
+        line = json.dumps(record, default=str, ensure_ascii=False) + "\n"
+        try:
+            os.write(self.fd, line.encode("utf-8"))
+        except OSError as e:
+            warn("cannot write to event log:", os_error(e))
+            self.close()
+
+    # close() {{{2
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __bool__(self):
+        return self.fd is not None
@@ -18,10 +18,26 @@
 
 
 # Imports {{{1
+import threading
+import time
+import arrow
 from inform import Error, conjoin, full_stop, is_str, log, os_error, truth, warn
 from .configs import add_setting, as_integer, as_string, as_dict, report_setting_error
+from .preferences import (
+    DEFAULT_HOOK_TIMEOUT,
+    HOOK_BUDGET,
+    HOOK_MAX_RETRY_DELAY,
+    HOOK_OUTBOX_SIZE,
+    HOOK_RETRIES,
+    HOOK_RETRY_DELAY,
+    PROGRESS_REPORT_INTERVAL,
+)
+from .progress import ProgressMonitor
+from .stats import BorgStats, STATISTICS
+from .utilities import Quantity
 from voluptuous import Any, Invalid, Schema
-import requests
+# requests is slow to import, so it is imported only when a hook fires
+# concurrent.futures is also imported only when needed
 
 # Schema {{{1
 # as_url() {{{2
@@ -42,9 +58,83 @@ as_action = Any(
 # schema {{{2
 schema = {}
 
+# Session {{{1
+# The requests to the monitoring services are sent through a single session
+# that keeps its connections open, so the connection made to a host is reused
+# by later requests to that host, whether they are from the same service, from
+# another service, or from another config of a composite config.
+session = None
+session_lock = threading.Lock()
+    # the session is shared by the worker threads of the services
+
+# get_session() {{{2
+def get_session():
+    global session
+    with session_lock:
+        if session is None:
+            import requests
+            session = requests.Session()
+        return session
+
+# close_session() {{{2
+def close_session():
+    """Close the connections to the monitoring services"""
+    global session
+    with session_lock:
+        if session is not None:
+            session.close()
+            session = None
+
+
+# send() {{{1
+def send(service, method, url, timeout=None, data=None, **kwargs):
+    """Send a request to a monitoring service"""
+    import requests
+    if is_str(data):
+        data = data.encode('utf-8')
+    try:
+        get_session().request(
+            method, url, data=data, timeout=timeout, **kwargs
+        )
+    except requests.exceptions.RequestException as e:
+        raise Error(f'{service} connection error.', codicil=full_stop(e))
+
+
+# Unavailable class {{{1
+class Unavailable(str):
+    # the value of a statistic that was not reported by Borg; it is empty
+    # regardless of the format it is given
+    def __format__(self, format_spec):
+        return ''
+
+
 # Hooks base class {{{1
 class Hooks:
+    """The monitoring services
+
+    The signals are delivered in the background, so Assimilate does not wait
+    on the services while Borg is running.  Each service has its own worker
+    thread, so the signals sent to a service arrive in the order they were
+    sent while the services are signaled concurrently.  The signal_*() methods
+    of the services return the requests that convey the signal, which are sent
+    by the worker.  A request that fails is resent after a delay that doubles
+    with each attempt until it is delivered, it has been resent HOOK_RETRIES
+    times, HOOK_BUDGET seconds have passed since the signal was sent, or a later
+    signal is waiting to be sent to the same service.  When the backup finishes,
+    Assimilate waits for the outstanding signals to be delivered or for their
+    budgets to expire.  The signals still being sent are then abandoned
+    together, allowing at most one service timeout for the requests under way
+    to complete, and only the requests their workers had not started are
+    treated as undelivered.
+
+    The requests that report the end of a backup and could not be delivered
+    are saved in the outbox, which is held in the status database, and are
+    resent before any other signals on the next run that uses the same service
+    and config, or by the flush-hooks command.
+    """
     NAME = "monitoring"
+    timeout = DEFAULT_HOOK_TIMEOUT
+        # how long to wait for the monitoring service to respond to a request
 
     @classmethod
     def provision_hooks(cls):
@@ -62,6 +152,16 @@ class Hooks:
     def __init__(self, settings, dry_run=False):
         self.active_hooks = []
         self.dry_run = dry_run
+        self.record_event = settings.record_event
+        self.get_status_store = settings.get_status_store
+        self.config_name = settings.config_name
+        self.workers = {}
+        self.deliveries = []
+        self.lock = threading.Lock()
+            # guards the abandonment of a delivery against its worker
+        self.latest = {}
+        self.signals_sent = 0
+        self.progress_reported = time.monotonic()
         for subclass in self.__class__.__subclasses__():
             c = subclass(settings)
             if c.is_active():
@@ -73,34 +173,243 @@ class Hooks:
             return monitoring.get(self.NAME, {})
         return {}
 
-    def report_results(self, borg):
+    def report_results(self, borg, stats=None):
         for hook in self.active_hooks:
             hook.borg = borg
+            hook.stats = stats
+
+    def report_progress(self, event):
+        # progress is published periodically rather than as it changes, and
+        # the completion of the backup is reported by signal_end()
+        if self.dry_run or event['finished']:
+            return
+        now = time.monotonic()
+        if now - self.progress_reported < PROGRESS_REPORT_INTERVAL:
+            return
+        self.progress_reported = now
+        for hook in self.active_hooks:
+            self.signal(hook, 'progress', event)
+
+    def signal(self, hook, name, *args):
+        # queue a signal for delivery to a monitoring service
+        from concurrent.futures import Future
+        worker = self.workers.get(hook)
+        if not worker:
+            import queue
+            worker = queue.SimpleQueue()
+            threading.Thread(
+                target=self.work, args=(worker,), name=f"hook-{hook.NAME}",
+                daemon=True
+            ).start()
+            self.workers[hook] = worker
+        self.signals_sent += 1
+        self.latest[hook] = self.signals_sent
+        delivery = dict(
+            hook = hook,
+            name = name,
+            args = args,
+            id = self.signals_sent,
+            sent = arrow.now(),
+            deadline = time.monotonic() + HOOK_BUDGET,
+            abandoned = False,
+                # set once the delivery is given up, the worker then stops
+            in_flight = None,
+                # the requests not yet known to be delivered, the first of
+                # which is being sent
+            future = Future(),
+        )
+        worker.put(delivery)
+        self.deliveries.append(delivery)
+
+    def work(self, worker):
+        # deliver the signals queued for a service in the order they were sent
+        # runs in a daemon thread, so a request still being sent when
+        # Assimilate exits does not hold up the exit
+        while True:
+            delivery = worker.get()
+            if delivery is None:
+                return
+            future = delivery['future']
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.deliver(delivery))
+            except BaseException as e:
+                future.set_exception(e)
+
+    @staticmethod
+    def compose(hook, name, args):
+        # returns the requests that convey a signal and the error that
+        # prevents the signal from being sent
+        try:
+            return getattr(hook, f"signal_{name}")(*args), None
+        except Error as e:
+            return [], e
+
+    def deliver(self, delivery):
+        # send a signal to a monitoring service, retrying if it fails
+        # runs in the worker thread, returns the number of attempts, the error
+        # if the signal could not be delivered, and the requests not delivered
+        hook = delivery['hook']
+        requests, error = self.compose(hook, delivery['name'], delivery['args'])
+        if error:
+            return 0, error, []
+        delay = HOOK_RETRY_DELAY
+        attempts = 0
+        for i, request in enumerate(requests):
+            while True:
+                with self.lock:
+                    if delivery['abandoned']:
+                        error = Error(
+                            "no response within time budget.", culprit=hook.NAME
+                        )
+                        return attempts, error, requests[i:]
+                    delivery['in_flight'] = requests[i:]
+                attempts += 1
+                try:
+                    send(hook.NAME, timeout=hook.timeout, **request)
+                    break
+                except Error as e:
+                    if (
+                        attempts > HOOK_RETRIES
+                        or time.monotonic() + delay > delivery['deadline']
+                        or self.latest[hook] != delivery['id']
+                    ):
+                        return attempts, e, requests[i:]
+                time.sleep(delay)
+                delay = min(2*delay, HOOK_MAX_RETRY_DELAY)
+        return attempts, None, []
+
+    def wait(self):
+        # wait for the queued signals to be delivered and report the outcomes
+        # returns the number of requests that were saved to the outbox
+        saved = 0
+        if self.deliveries:
+            from concurrent.futures import wait
+            deadline = max(d['deadline'] for d in self.deliveries)
+            wait(
+                [d['future'] for d in self.deliveries],
+                timeout = max(deadline - time.monotonic(), 0),
+            )
+
+            # stop the workers before they send anything more and give the
+            # requests being sent the chance to complete, so that what is
+            # saved to the outbox is not also delivered now; they are waited
+            # on together, so this takes at most the longest service timeout
+            abandoned = []
+            with self.lock:
+                for delivery in self.deliveries:
+                    future = delivery['future']
+                    if not future.done() and not future.cancel():
+                        delivery['abandoned'] = True
+                        abandoned.append(delivery)
+            if abandoned:
+                wait(
+                    [d['future'] for d in abandoned],
+                    timeout = max(d['hook'].timeout for d in abandoned),
+                )
+
+        for delivery in self.deliveries:
+            hook = delivery['hook']
+            name = delivery['name']
+            future = delivery['future']
+            if future.cancelled():
+                # never started
+                attempts = 0
+                requests, error = self.compose(hook, name, delivery['args'])
+                error = error or Error(
+                    "no response within time budget.", culprit=hook.NAME
+                )
+            elif future.done():
+                attempts, error, requests = future.result()
+            else:
+                # the fate of the request being sent is unknown; it is not
+                # saved as the service may have received it
+                attempts = None
+                error = Error(
+                    "no response within time budget.", culprit=hook.NAME
+                )
+                with self.lock:
+                    requests = (delivery['in_flight'] or [None])[1:]
+            if error:
+                warn(error)
+                saved += self.save_undelivered(delivery, requests)
+            self.record_event(
+                "hook", service=hook.NAME, signal=name, succeeded=not error,
+                attempts=attempts, error=str(error) if error else None,
+            )
+        self.deliveries = []
+        for worker in self.workers.values():
+            worker.put(None)
+        self.workers = {}
+        return saved
+
+    def save_undelivered(self, delivery, requests):
+        # the end of a backup is saved to the outbox along with when it ended
+        # and whether it succeeded, so that it can be reported later
+        hook = delivery['hook']
+        if not requests:
+            return 0
+        if delivery['name'] == 'end':
+            exception = delivery['args'][0]
+            result = 'failure' if exception else 'success'
+            entries = [
+                dict(time=delivery['sent'], result=result, request=r)
+                for r in requests
+            ]
+        elif delivery['name'] == 'resend':
+            entries = delivery['args'][0][-len(requests):]
+        else:
+            return 0
+        try:
+            self.get_status_store().add_undelivered(
+                self.config_name, hook.NAME, entries, HOOK_OUTBOX_SIZE
+            )
+        except Error as e:
+            warn("cannot save undelivered signals:", e)
+            return 0
+        log(f"saved {len(entries)} undelivered signals to {hook.NAME}.")
+        return len(entries)
+
+    def resend_undelivered(self):
+        # queue the signals saved from previous runs ahead of any new signals
+        # returns the number of requests queued
+        queued = 0
+        try:
+            store = self.get_status_store()
+            for hook in self.active_hooks:
+                entries = store.take_undelivered(self.config_name, hook.NAME)
+                if entries:
+                    self.signal(hook, 'resend', entries)
+                    queued += len(entries)
+        except Error as e:
+            warn("cannot read undelivered signals:", e)
+        return queued
 
     def __enter__(self):
         if not self.dry_run:
+            self.resend_undelivered()
             for hook in self.active_hooks:
-                try:
-                    hook.signal_start()
-                except Error as e:
-                    warn(e)
+                self.signal(hook, 'start')
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         if not self.dry_run:
             for hook in self.active_hooks:
-                try:
-                    hook.signal_end(exc_value)
-                except Error as e:
-                    warn(e)
+                self.signal(hook, 'end', exc_value)
+            self.wait()
+
+    def signal_resend(self, entries):
+        log(f'resending {len(entries)} undelivered signals to {self.NAME}.')
+        return [dict(entry['request']) for entry in entries]
 
     def signal_start(self):
         url = self.START_URL.format(url=self.url, uuid=self.uuid)
         log(f'signaling start of backups to {self.NAME}: {url}.')
-        try:
-            requests.get(url, timeout=self.timeout)
-        except requests.exceptions.RequestException as e:
-            raise Error(f'{self.NAME} connection error.', codicil=full_stop(e))
+        return [dict(method='get', url=url)]
+
+    def signal_progress(self, event):
+        return []
 
     def signal_end(self, exception):
         if exception:
@@ -110,10 +419,7 @@ class Hooks:
             url = self.SUCCESS_URL.format(url=self.url, uuid=self.uuid)
             result = 'success'
         log(f'signaling {result} of backups to {self.NAME}: {url}.')
-        try:
-            requests.get(url, timeout=self.timeout)
-        except requests.exceptions.RequestException as e:
-            raise Error('{self.NAME} connection error.', codicil=full_stop(e))
+        return [dict(method='get', url=url)]
 
 
 # Custom class {{{1
@@ -126,6 +432,7 @@ class Custom(Hooks):
         success = as_action,
         failure = as_action,
         finish = as_action,
+        progress = as_action,
         timeout = as_integer,
     )
 
@@ -142,7 +449,8 @@ class Custom(Hooks):
         self.placeholders = placeholders
         self.settings = settings
         self.borg = None
-        self.timeout = settings.get('timeout')
+        self.stats = None
+        self.timeout = settings.get('timeout', Hooks.timeout)
         if self.timeout:
             try:
                 self.timeout = int(self.timeout)
@@ -192,12 +500,14 @@ class Custom(Hooks):
             return data
 
     def report(self, name, placeholders):
+        # return the request that sends a message, if it is configured
         if not self.settings:
-            return
+            return []
 
         reporter = self.settings.get(name)
         if not reporter:
-            return
+            return []
+        placeholders = dict(placeholders, time=arrow.now())
 
         # process reporter
         method = 'get'
@@ -221,16 +531,26 @@ class Custom(Hooks):
             self.report_error((), 'invalid url.')
 
         log(f'signaling {name} of backups to {self.NAME}: {url} via {method}.')
-        try:
-            if method == 'get':
-                requests.get(url, params=params, timeout=self.timeout)
-            else:
-                requests.post(url, params=params, data=data, timeout=self.timeout)
-        except requests.exceptions.RequestException as e:
-            raise Error('{self.NAME} connection error.', codicil=full_stop(e))
+        if method == 'get':
+            return [dict(method=method, url=url, params=params)]
+        return [dict(method=method, url=url, params=params, data=data)]
 
     def signal_start(self):
-        self.report('start', self.placeholders)
+        return self.report('start', self.placeholders)
+
+    def signal_progress(self, event):
+        placeholders = self.placeholders.copy()
+        placeholders['progress'] = ProgressMonitor.render(event)
+        placeholders['elapsed'] = Quantity(event['elapsed'], 's')
+        placeholders['files'] = event.get('nfiles', Unavailable())
+        placeholders['size'] = Quantity(event.get('original_size', 0), 'B')
+        placeholders['rate'] = Quantity(event.get('rate') or 0, 'B/s')
+        placeholders['percent'] = event.get('percent', Unavailable())
+        eta = event.get('eta')
+        placeholders['remaining'] = (
+            Unavailable() if eta is None else Quantity(eta, 's')
+        )
+        return self.report('progress', placeholders)
 
     def signal_end(self, exception):
         if exception:
@@ -261,15 +581,24 @@ class Custom(Hooks):
         else:
             placeholders['status'] = '0'
         placeholders['success'] = truth(placeholders['status'] in '01')
+        stats = self.stats or BorgStats()
+        placeholders['stats'] = "\n".join(
+            f"{k}: {v}" for k, v in stats.render().items()
+        )
+        placeholders.update({name: Unavailable() for name in STATISTICS})
+        placeholders.update(stats.quantities())
 
-        for name in names:
-            self.report(name, placeholders)
+        return [
+            request
+            for name in names
+            for request in self.report(name, placeholders)
+        ]
 
 
 # HealthChecks class {{{1
 class HealthChecks(Hooks):
     NAME = 'healthchecks.io'
-    VALIDATOR = dict(url=as_url, uuid=as_string)
+    VALIDATOR = dict(url=as_url, uuid=as_string, timeout=as_integer)
     URL = 'https://hc-ping.com'
 
     def __init__(self, assimilate_settings):
@@ -278,7 +607,9 @@ class HealthChecks(Hooks):
         self.url = settings.get('url')
         if not self.url:
             self.url = self.URL
+        self.timeout = settings.get('timeout', self.timeout)
         self.borg = None
+        self.stats = None
 
     def is_active(self):
         return bool(self.uuid)
@@ -286,10 +617,13 @@ class HealthChecks(Hooks):
     def signal_start(self):
         url = f'{self.url}/{self.uuid}/start'
         log(f'signaling start of backups to {self.NAME}: {url}.')
-        try:
-            requests.post(url, timeout=self.timeout)
-        except requests.exceptions.RequestException as e:
-            raise Error('{self.NAME} connection error.', codicil=full_stop(e))
+        return [dict(method='post', url=url)]
+
+    def signal_progress(self, event):
+        # healthchecks.io records log events without affecting the check
+        url = f'{self.url}/{self.uuid}/log'
+        log(f'signaling progress of backups to {self.NAME}: {url}.')
+        return [dict(method='post', url=url, data=ProgressMonitor.render(event))]
 
     def signal_end(self, exception):
         if exception:
@@ -309,25 +643,34 @@ class HealthChecks(Hooks):
             if self.borg:
                 status = self.borg.status
                 payload = self.borg.stderr
+                if self.stats:
+                    lines = [payload.rstrip()] if payload else []
+                    lines += [f"{k}: {v}" for k, v in self.stats.render().items()]
+                    payload = "\n".join(lines)
             else:
                 status = 0
                 payload = ''
 
         url = f'{self.url}/{self.uuid}/{status}'
         log(f'signaling {result} of backups to {self.NAME}: {url}.')
-        try:
-            if payload:
-                requests.post(url, data=payload.encode('utf-8'), timeout=self.timeout)
-            else:
-                requests.post(url, timeout=self.timeout)
-        except requests.exceptions.RequestException as e:
-            raise Error('{self.NAME} connection error.', codicil=full_stop(e))
+        if payload:
+            return [dict(method='post', url=url, data=payload)]
+        return [dict(method='post', url=url)]
+
+    def signal_resend(self, entries):
+        # the time is added to the body, which healthchecks.io shows in the log
+        requests = super().signal_resend(entries)
+        for entry, request in zip(entries, requests):
+            note = f"{entry['result']} at {entry['time']}, reported late."
+            data = request.get('data')
+            request['data'] = f"{note}\n{data}" if data else note
+        return requests
 
 
 # CronHub class {{{1
 class CronHub(Hooks):
     NAME = 'cronhub.io'
-    VALIDATOR = dict(url=as_url, uuid=as_string)
+    VALIDATOR = dict(url=as_url, uuid=as_string, timeout=as_integer)
     START_URL = '{url}/start/{uuid}'
     SUCCESS_URL = '{url}/finish/{uuid}'
     FAIL_URL = '{url}/fail/{uuid}'
@@ -339,6 +682,7 @@ class CronHub(Hooks):
         self.url = settings.get('url')
         if not self.url:
             self.url = self.URL
+        self.timeout = settings.get('timeout', self.timeout)
 
     def is_active(self):
         return bool(self.uuid)
@@ -0,0 +1,306 @@
+# Index
+#
+# An index of the files contained in the archives of a config, kept in an
+# SQLite database in the data directory so that the find command can search
+# every archive without running Borg.  The index is updated incrementally: once
+# an archive is created its files are listed and added, and archives that are
+# no longer in the repository are removed.  Since an archive never changes, an
+# archive that has been added need never be listed again.
+#
+# Each distinct path is stored once and the files table refers to it, so the
+# index grows with the number of archives by little more than the size and
+# modification time of each file.  Directories are not included.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import json
+import sqlite3
+import arrow
+from inform import Error
+from .compare import to_microseconds
+from .utilities import to_path
+
+
+# Globals {{{1
+SCHEMA = """
+    create table if not exists archives (
+        id integer primary key,
+        archive_id text unique not null,
+        name text not null,
+        time real not null
+    );
+    create table if not exists paths (
+        id integer primary key,
+        path text unique not null,
+        name text not null
+    );
+    create index if not exists paths_by_name on paths (name);
+    create table if not exists files (
+        path integer not null,
+        archive integer not null,
+        type text not null,
+        size integer,
+        mtime integer,
+        primary key (path, archive)
+    ) without rowid;
+"""
+INDEX_FORMAT = "{type}{size}{mtime}{path}"
+    # the fields requested from borg list
+INSERT_BATCH = 10_000
+    # number of files staged before they are added to the index
+LOCK_TIMEOUT = 30  # seconds
+    # how long to wait for another process that is writing to the database
+
+
+# FileIndex class {{{1
+class FileIndex:
+    """Index of the files contained in the archives of a config
+
+    path (path):
+        The database.
+
+    The database is only created when an archive is added, so searching an
+    index that does not yet exist finds nothing.
+    """
+
+    def __init__(self, path):
+        self.path = to_path(path)
+        self.connection = None
+
+    # connect() {{{2
+    def connect(self, write=False):
+        if self.connection:
+            return self.connection
+        if not write and not self.path.exists():
+            return None
+        try:
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+            connection.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        self.connection = connection
+        return connection
+
+    # close() {{{2
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def __bool__(self):
+        return self.path.exists()
+
+    # get_archive_ids() {{{2
+    def get_archive_ids(self):
+        """Return the IDs of the archives in the index"""
+        try:
+            connection = self.connect()
+            if not connection:
+                return set()
+            rows = connection.execute("select archive_id from archives")
+            return set(row[0] for row in rows)
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # add_archive() {{{2
+    def add_archive(self, archive, lines):
+        """Add the files of an archive to the index
+
+        archive is a dictionary that contains the id, name and time of the
+        archive as given by Borg, and lines is the output of borg list run on
+        the archive with --json-lines and INDEX_FORMAT.  The archive is added
+        in a single transaction, so an archive whose listing is interrupted is
+        not added.  Returns the number of files added.
+        """
+        def stage(entries):
+            connection.executemany(
+                "insert into staged values (?, ?, ?, ?, ?)", entries
+            )
+            entries.clear()
+
+        count = 0
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                connection.execute("""
+                    create temp table if not exists staged (
+                        path text, name text, type text, size integer,
+                        mtime integer
+                    )
+                """)
+                connection.execute("delete from staged")
+                entries = []
+                for line in lines:
+                    entry = json.loads(line)
+                    kind = entry.get("type")
+                    if kind == "d":
+                        continue
+                    path = entry["path"]
+                    mtime = entry.get("mtime")
+                    entries.append((
+                        path, path.rpartition("/")[2], kind, entry.get("size"),
+                        to_microseconds(mtime) if mtime else None,
+                    ))
+                    count += 1
+                    if len(entries) >= INSERT_BATCH:
+                        stage(entries)
+                stage(entries)
+
+                connection.execute(
+                    """
+                        delete from files where archive in (
+                            select id from archives where archive_id = ?
+                        )
+                    """,
+                    (archive["id"],)
+                )
+                cursor = connection.execute(
+                    "insert or replace into archives values (null, ?, ?, ?)",
+                    (
+                        archive["id"], archive.get("name") or archive.get("archive"),
+                        to_microseconds(archive.get("time") or archive.get("start"))/1e6
+                    )
+                )
+                archive_rowid = cursor.lastrowid
+                connection.execute("""
+                    insert or ignore into paths (path, name)
+                    select path, name from staged
+                """)
+                connection.execute(
+                    """
+                        insert or replace into files
+                        select paths.id, ?, staged.type, staged.size, staged.mtime
+                        from staged join paths on paths.path = staged.path
+                    """,
+                    (archive_rowid,)
+                )
+                connection.execute("delete from staged")
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        return count
+
+    # remove_archives() {{{2
+    def remove_archives(self, archive_ids):
+        """Remove archives from the index, along with paths no longer used"""
+        archive_ids = list(archive_ids)
+        if not archive_ids:
+            return
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                for archive_id in archive_ids:
+                    row = connection.execute(
+                        "select id from archives where archive_id = ?",
+                        (archive_id,)
+                    ).fetchone()
+                    if row:
+                        connection.execute(
+                            "delete from files where archive = ?", (row[0],)
+                        )
+                        connection.execute(
+                            "delete from archives where id = ?", (row[0],)
+                        )
+                connection.execute("""
+                    delete from paths where not exists (
+                        select 1 from files where files.path = paths.id
+                    )
+                """)
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # lookup() {{{2
+    def lookup(self, path):
+        """Return what the archives in the index hold at a path
+
+        Returns a dictionary that maps the ID of each archive in the index to the
+        type, size and modification time of the file, or to None if the archive
+        does not hold it.  Directories are not in the index, so are not found.
+        """
+        try:
+            connection = self.connect()
+            if not connection:
+                return {}
+            found = {
+                row[0]: None
+                for row in connection.execute("select archive_id from archives")
+            }
+            rows = connection.execute(
+                """
+                    select archives.archive_id, files.type, files.size, files.mtime
+                    from paths
+                    join files on files.path = paths.id
+                    join archives on archives.id = files.archive
+                    where paths.path = ?
+                """,
+                (path,)
+            )
+            for archive_id, kind, size, mtime in rows:
+                found[archive_id] = dict(type=kind, size=size, mtime=mtime)
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        return found
+
+    # find() {{{2
+    def find(self, glob):
+        """Return the files whose paths match a glob, with their archives
+
+        If the glob does not contain a slash, it is matched against the name of
+        each file, otherwise it is matched against the path as stored in the
+        archive, either in its entirety or any trailing part of it.  The
+        files are returned as dictionaries ordered by path and then by the
+        time of the archive.  The modification times are converted to arrow
+        objects.
+        """
+        glob = glob.strip("/")
+        if "/" in glob:
+            where = "paths.path glob ? or paths.path glob ?"
+            values = (glob, "*/" + glob)
+        else:
+            where = "paths.name glob ?"
+            values = (glob,)
+        try:
+            connection = self.connect()
+            if not connection:
+                return []
+            rows = connection.execute(
+                f"""
+                    select
+                        paths.path, files.type, files.size, files.mtime,
+                        archives.archive_id, archives.name, archives.time
+                    from paths
+                    join files on files.path = paths.id
+                    join archives on archives.id = files.archive
+                    where {where}
+                    order by paths.path, archives.time
+                """,
+                values
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        return [
+            dict(
+                path = path,
+                type = kind,
+                size = size,
+                mtime = None if mtime is None else arrow.Arrow.fromtimestamp(mtime/1e6),
+                archive_id = archive_id,
+                archive = name,
+                time = arrow.Arrow.fromtimestamp(time),
+            )
+            for path, kind, size, mtime, archive_id, name, time in rows
+        ]
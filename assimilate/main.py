@@ -48,7 +48,8 @@ from . import __released__, __version__
 from .assimilate import ConfigQueue, Assimilate
 from .command import Command
 from .configs import read_settings
-from .hooks import Hooks
+from .connections import close_connections
+from .hooks import Hooks, close_session
 from .utilities import process_cmdline
 
 # Globals {{{1
@@ -106,6 +107,10 @@ def main():
                     "config": cmdline["--config"],
                         # config must be given in options as it is needed for
                         # overdue command, which is run early
+                    "name": cmdline["--name"],
+                    "relocated": cmdline["--relocated"],
+                        # name and relocated are needed by create, which
+                        # passes them on to the processes it runs early
                 }
             )
             if cmdline["--narrate"]:
@@ -139,6 +144,7 @@ def main():
                         exit_status = 2
                         settings.fail(e, cmd=' '.join(sys.argv))
                         e.report()
+                    settings.exit_status = exit_status
 
                 if inform.errors_accrued(reset=True):
                     exit_status = min(exit_status, 2)
@@ -157,4 +163,6 @@ def main():
             error(os_error(e))
         except KeyboardInterrupt:
             display("Terminated by user.")
+        close_connections()
+        close_session()
         terminate(max(worst_exit_status, exit_status or 0))
@@ -0,0 +1,202 @@
+# Mounts
+#
+# Keeps the archives mounted by the compare command so that later comparisons
+# against the same archive reuse them rather than mounting the archive again.
+# Each mount is recorded in the status database along with the time it was last
+# used.  The mounts are removed by a reaper, a detached process that is started
+# when an archive is mounted and that exits once no mounts remain.  It unmounts
+# those that have been idle for longer than their time-to-live.
+#
+# The mounts are made while holding the lock file of the config, and the reaper
+# takes the same lock file while it unmounts, so it never unmounts an archive
+# that is in use.  Assimilate commands that require exclusive use of the
+# repository unmount the archives of their config before running, so a mount
+# never holds Borg's repository lock while another command is running.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import os
+import re
+import subprocess
+import sys
+import time
+import arrow
+import nestedtext as nt
+from inform import Error, narrate, os_error, warn
+from .preferences import (
+    DATA_DIR, MOUNT_CACHE_DIR, MOUNT_REAPER_PID_FILE, MOUNT_REAPER_RETRY
+)
+from .shlib import Run, to_path
+from .status import StatusStore
+
+
+# lock_holder() {{{1
+def lock_holder(lock_file):
+    """Return the ID of the process that holds a lock file, or None if not held
+
+    A lock file that cannot be read is taken to be held.
+    """
+    try:
+        pid = int(nt.load(lock_file, dict).get('pid', 0))
+        if pid <= 0:
+            return -1
+        os.kill(pid, 0)     # does not actually kill the process
+        return pid
+    except FileNotFoundError:
+        return None
+    except ProcessLookupError:
+        return None         # process no longer exists
+    except PermissionError:
+        return pid          # process exists but belongs to another user
+    except (OSError, ValueError, nt.NestedTextError):
+        return -1
+
+
+# get_mount_point() {{{1
+def get_mount_point(config, archive):
+    """The directory in which an archive is mounted for reuse"""
+    if archive.startswith("aid:"):
+        name = archive[4:20]
+    else:
+        name = re.sub(r"[^\w.-]", "_", archive)
+    return to_path(DATA_DIR, MOUNT_CACHE_DIR, config, name)
+
+
+# unmount() {{{1
+def unmount(mount, store):
+    """Unmount an archive and forget it; the lock file must be held
+
+    Returns True if the archive was unmounted.
+    """
+    mount_point = to_path(mount['mount_point'])
+    if os.path.ismount(mount_point):
+        narrate("unmounting:", mount_point)
+        try:
+            Run([mount['borg'], 'umount', mount_point], modes='sOEW')
+        except Error as e:
+            warn(
+                "could not unmount cached archive.", culprit=mount_point,
+                codicil=e.stderr or None
+            )
+            return False
+    try:
+        mount_point.rmdir()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        warn(os_error(e))
+    store.remove_mount(mount_point)
+    return True
+
+
+# release_mounts() {{{1
+def release_mounts(store, config):
+    """Unmount all of the archives of a config; its lock file must be held"""
+    for mount in store.get_mounts(config=config):
+        unmount(mount, store)
+
+
+# acquire_lock() {{{1
+def acquire_lock(lock_file):
+    """Take a lock file on behalf of the reaper; returns True if successful"""
+    if lock_holder(lock_file) is not None:
+        return False
+    try:
+        lock_file.unlink()  # remove a stale lock file
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(lock_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False  # lost a race for the lock
+    contents = dict(
+        cmdline = "mount reaper",
+        started = str(arrow.now()),
+        pid = os.getpid(),
+    )
+    os.write(fd, nt.dumps(contents).encode("utf-8"))
+    os.close(fd)
+    return True
+
+
+# reap() {{{1
+def reap(store):
+    """Unmount the archives that have been idle for too long
+
+    Returns the number of seconds until the next archive expires, or None if
+    no archives remain mounted.
+    """
+    delay = None
+    for mount in store.get_mounts():
+        expires = mount['last_used'].timestamp() + mount['ttl']
+        wait = expires - arrow.now().timestamp()
+        if wait <= 0 or not os.path.ismount(mount['mount_point']):
+            lock_file = to_path(mount['lock_file'])
+            if acquire_lock(lock_file):
+                try:
+                    if unmount(mount, store):
+                        continue
+                finally:
+                    lock_file.unlink()
+            # the config is in use or the archive is busy, try again later
+            wait = MOUNT_REAPER_RETRY
+        delay = wait if delay is None else min(delay, wait)
+    return delay
+
+
+# start_reaper() {{{1
+def start_reaper():
+    """Start the reaper if it is not already running"""
+    pid_file = to_path(DATA_DIR, MOUNT_CACHE_DIR, MOUNT_REAPER_PID_FILE)
+    if lock_holder(pid_file) not in (None, -1):
+        return
+    try:
+        subprocess.Popen(
+            [sys.executable, "-m", "assimilate.mounts"],
+            stdin = subprocess.DEVNULL,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.DEVNULL,
+            start_new_session = True,
+                # detach so the reaper survives the command and the terminal
+        )
+    except OSError as e:
+        warn("could not start mount reaper:", os_error(e))
+
+
+# reaper() {{{1
+def reaper():
+    """Unmount the idle archives until none remain"""
+    pid_file = to_path(DATA_DIR, MOUNT_CACHE_DIR, MOUNT_REAPER_PID_FILE)
+    if lock_holder(pid_file) not in (None, -1):
+        return  # another reaper is running
+    nt.dump(dict(pid=os.getpid()), pid_file)
+    store = StatusStore(DATA_DIR)
+    try:
+        while True:
+            delay = reap(store)
+            store.close()
+            if delay is None:
+                break
+            time.sleep(max(delay, 1))
+    finally:
+        if lock_holder(pid_file) == os.getpid():
+            pid_file.unlink()
+
+
+if __name__ == "__main__":
+    reaper()
@@ -16,6 +16,10 @@ Options:
     -N, --nt             Output summary in NestedText format
     -p, --no-passes      Do not show hosts that are not overdue
     -M, --message <msg>  Status message template for each repository
+    -s, --serve          Run continuously, maintaining the status of the
+                         repositories for use by other overdue commands
+    -d, --direct         Query the repositories directly rather than using
+                         a running overdue server
 
 The program requires a special configuration file, which defaults to
 overdue.conf.nt.  It should be placed in the configuration directory, typically
@@ -23,6 +27,13 @@ overdue.conf.nt.  It should be placed in the configuration directory, typically
 
     https://assimilate.readthedocs.io/en/stable/monitoring.html#overdue
 
+When run with ––serve, overdue does not report but instead runs until killed,
+refreshing each remote host on its own schedule and re-examining local
+repositories when their sentinel files change.  It keeps the results in a state
+file in the data directory.  While the server is running, other overdue
+commands that use the same configuration report from the state file rather than
+querying the repositories themselves.
+
 The message given by ––message may contain the following keys in braces:
     description: replaced by the description field from the config file, a string.
     max_age: replaced by the max_age field from the config file, a quantity.
@@ -58,9 +69,12 @@ include formatting directives.  For example:
 
 
 # IMPORTS {{{1
+import json
 import os
 import pwd
 import socket
+import threading
+import time
 import arrow
 from collections import defaultdict
 from inform import (
@@ -74,6 +88,7 @@ from inform import (
     display,
     error,
     get_prog_name,
+    narrate,
     os_error,
     plural,
     truth,
@@ -81,12 +96,19 @@ from inform import (
 )
 import nestedtext as nt
 from voluptuous import Schema
+from .connections import ssh_options
 from .configs import (
     add_setting, add_parents_of_non_identifier_keys,
-    as_color, as_emails, as_path, as_abs_path, as_string, as_name
+    as_color, as_emails, as_integer, as_path, as_abs_path, as_string, as_name
+)
+from .preferences import (
+    DATA_DIR, DEFAULT_AGE_BAR_WIDTH, DEFAULT_OVERDUE_CONCURRENCY,
+    DEFAULT_OVERDUE_REFRESH, DEFAULT_OVERDUE_TIMEOUT, OVERDUE_POLL_INTERVAL,
+    OVERDUE_STATE_FILE, OVERDUE_STATE_INTERVAL, STATUS_FILE
+)
+from .utilities import (
+    output, when, Quantity, InvalidNumber, Cmd, Run, to_path
 )
-from .preferences import DATA_DIR, DEFAULT_AGE_BAR_WIDTH
-from .utilities import output, read_latest, when, Quantity, InvalidNumber, Run, to_path
 
 # GLOBALS {{{1
 username = pwd.getpwuid(os.getuid()).pw_name
@@ -129,10 +151,17 @@ def as_seconds(arg, units=None):
     arg = as_string(arg)
     return Quantity(arg, units or 'h').scale('seconds')
 
+# as_timeout {{{2
+def as_timeout(arg):
+    return as_seconds(arg, 's')
+
 # SCHEMA {{{1
 validate_settings = Schema(
     dict(
         max_age = as_seconds,
+        timeout = as_timeout,
+        refresh = as_timeout,
+        concurrency = as_integer,
         sentinel_root = as_abs_path,
         message = as_string,
         current_color = as_color,
@@ -144,6 +173,8 @@ validate_settings = Schema(
                 sentinel_dir = as_path,
                 host = as_string,
                 max_age = as_seconds,
+                timeout = as_timeout,
+                refresh = as_timeout,
                 notify = as_emails,
                 command = as_string,
             )
@@ -162,8 +193,12 @@ def get_local_data(description, config, path, max_age):
         if not path:
             path = to_path(DATA_DIR)
         locked = (path /  f"{config}.lock").exists()
+        # imported here as it is only needed for local configs
+        from .status import StatusStore
+        status_store = StatusStore(path)
         path = path / f"{config}.latest.nt"
-        latest = read_latest(path)
+        latest = status_store.get_latest(config, path)
+        status_store.close()
         mtime = latest.get('create last run')
         if not mtime:
             raise Error('create time is not available.', culprit=path)
@@ -179,23 +214,85 @@ def get_local_data(description, config, path, max_age):
         mtime = arrow.get(path.stat().st_mtime)
         locked = path.parent.glob('lock.*')
 
-    delta = now - mtime
-    age = Quantity(24 * 60 * 60 * delta.days + delta.seconds, 'seconds')
-    overdue = truth(age > max_age)
+    age, overdue = get_age(mtime, max_age)
     locked = truth(locked)
     yield dict(
         description=description, path=path, mtime=mtime,
         age=age, max_age=max_age, overdue=overdue, locked=locked
     )
 
-# get_remote_data {{{2
-def get_remote_data(name, host, config, cmd):
+# get_age {{{2
+def get_age(mtime, max_age):
+    delta = now - mtime
+    age = Quantity(24 * 60 * 60 * delta.days + delta.seconds, 'seconds')
+    return age, truth(age > max_age)
+
+# get_local_paths {{{2
+# The files that reflect the state of a local repository.
+def get_local_paths(config, path):
+    if path:
+        path = to_path(*path)
+    if config:
+        if not path:
+            path = to_path(DATA_DIR)
+        return [
+            path / f"{config}.latest.nt",
+            path / f"{config}.lock",
+            path / STATUS_FILE,
+        ]
+    # the sentinel and lock files are replaced rather than modified, which
+    # changes the modification time of the directory that contains them
+    return [path] if path else []
+
+# get_signature {{{2
+def get_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return signature
+
+# query_remote {{{2
+def query_remote(host, config, cmd, timeout):
+    # Runs in a worker thread so that hosts are queried concurrently, and so
+    # must not produce output.  Returns the output of the remote command.
     cmd = cmd or "assimilate overdue"
-    display(f"\n{name}:")
     config = ['--config', config] if config else []
+    ssh = Cmd(
+        ['ssh'] + ssh_options() + [host] + config + cmd.split() + ['--nt', '--local'],
+        'sOEw1'
+    )
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        ssh.kill()
+
+    timer = threading.Timer(timeout, expire)
+    ssh.run()
+    timer.start()
     try:
-        ssh = Run(['ssh', host] + config + cmd.split() + ['--nt', '--local'], 'sOEW1')
-        for repo_data in nt.loads(ssh.stdout, top=list):
+        ssh.wait()
+    except Error:
+        if expired.is_set():
+            raise Error(f"no response after {timeout:0.0ps}.")
+        raise
+    finally:
+        timer.cancel()
+    return ssh.stdout
+
+# get_remote_data {{{2
+def get_remote_data(name, host, query):
+    display(f"\n{name}:")
+    yield from parse_remote_data(host, query)
+
+# parse_remote_data {{{2
+def parse_remote_data(host, query):
+    try:
+        for repo_data in nt.loads(query.result(), top=list):
             if 'description' not in repo_data:
                 repo_data['description'] = repo_data.get('host', '')
             if 'mtime' in repo_data:
@@ -215,7 +312,213 @@ def get_remote_data(name, host, config, cmd):
             repo_data['locked'] = truth(repo_data.get('locked') == 'yes')
             yield repo_data
     except Error as e:
-        e.report(culprit=host)
+        e.reraise(culprit=host)
+
+# STATE {{{1
+# The overdue server keeps the status of each repository in a state file.  Only
+# the facts gathered from the repositories are saved; the age of each backup is
+# computed when the state file is read.
+
+# get_state_path {{{2
+# a server started with --local has its own state file, so it can run alongside
+# one that covers all repositories
+def get_state_path(settings, local):
+    scope = "local" if local else "all"
+    return to_path(
+        DATA_DIR,
+        OVERDUE_STATE_FILE.format(config_name=settings.config_name, scope=scope)
+    )
+
+# get_settings_key {{{2
+# used to detect a server that was started with different overdue settings
+def get_settings_key(od_settings):
+    return json.dumps(od_settings, default=str, sort_keys=True)
+
+# to_state {{{2
+def to_state(repos_data):
+    try:
+        entries = []
+        for repo_data in repos_data:
+            entry = {
+                k: str(v) for k, v in repo_data.items()
+                if k not in ("age", "overdue", "updated", "age_bar")
+            }
+            entry['mtime'] = repo_data['mtime'].isoformat()
+            entry['max_age'] = float(repo_data['max_age'])
+            entry['locked'] = bool(repo_data['locked'])
+            entries.append(entry)
+        return dict(repos=entries)
+    except OSError as e:
+        return dict(error=os_error(e))
+    except Error as e:
+        return dict(error=str(e))
+
+# from_state {{{2
+def from_state(entry):
+    if 'error' in entry:
+        raise Error(entry['error'])
+    for repo_data in entry['repos']:
+        repo_data['mtime'] = arrow.get(repo_data['mtime'])
+        repo_data['max_age'] = Quantity(repo_data['max_age'], 'seconds')
+        repo_data['locked'] = truth(repo_data['locked'])
+        repo_data['age'], repo_data['overdue'] = get_age(
+            repo_data['mtime'], repo_data['max_age']
+        )
+        yield repo_data
+
+# get_server_state {{{2
+# Returns the contents of the state file if the server that wrote it is still
+# running, otherwise None.
+def get_server_state(path):
+    try:
+        state = json.loads(path.read_text())
+        os.kill(state['pid'], 0)
+    except ProcessLookupError:
+        narrate("overdue server is no longer running.", culprit=path)
+        return None
+    except PermissionError:
+        pass  # server is running under another account
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return state
+
+# read_state {{{2
+# Returns the status of the repositories as maintained by a running overdue
+# server, or None if there is no such server or it uses different settings.
+# State that has not been rewritten in several intervals is from a server that
+# is not making progress, and is ignored unless fresh is false.
+def read_state(path, od_settings, fresh=True):
+    state = get_server_state(path)
+    if not state:
+        return None
+    if state.get('settings') != get_settings_key(od_settings):
+        narrate("overdue server uses different settings.", culprit=path)
+        return None
+    if fresh:
+        try:
+            age = (arrow.now() - arrow.get(state['updated'])).total_seconds()
+        except (KeyError, TypeError, arrow.parser.ParserError):
+            return None
+        if age > 3*OVERDUE_STATE_INTERVAL:
+            narrate("overdue server state is stale.", culprit=path)
+            return None
+    return state
+
+# write_state {{{2
+def write_state(path, od_settings, local, repositories):
+    state = dict(
+        pid = os.getpid(),
+        updated = now.isoformat(),
+        local = local,
+        settings = get_settings_key(od_settings),
+        repositories = repositories,
+    )
+    # write to a temporary file and rename so readers never see a partial file
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        tmp_path.write_text(json.dumps(state))
+        tmp_path.replace(path)
+    except OSError as e:
+        error(os_error(e))
+
+# SERVER {{{1
+def serve(cmdline, settings, od_settings):
+    global now
+    default_max_age = od_settings.get("max_age", as_seconds('28h'))
+    default_timeout = od_settings.get(
+        "timeout", as_timeout(DEFAULT_OVERDUE_TIMEOUT)
+    )
+    default_refresh = od_settings.get(
+        "refresh", as_timeout(DEFAULT_OVERDUE_REFRESH)
+    )
+    concurrency = od_settings.get("concurrency", DEFAULT_OVERDUE_CONCURRENCY)
+    repositories = od_settings.get("repositories")
+    root = od_settings.get("sentinel_root")
+    local = cmdline["--local"]
+
+    # refuse to start if another server maintains the same state file, even
+    # if its settings differ, as the two would overwrite each other's state
+    state_path = get_state_path(settings, local)
+    state = get_server_state(state_path)
+    if state and state['pid'] != os.getpid():
+        raise Error(
+            "overdue server is already running.",
+            culprit = state['pid'],
+            codicil = (
+                f"State file: {state_path!s}",
+                "Terminate it before starting another."
+            )
+        )
+
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    table = {}          # the status of each repository
+    signatures = {}     # the state of the files that underlie local repositories
+    next_refresh = {}   # when each remote host is next queried
+    queries = {}        # the outstanding queries of remote hosts
+    written = None      # when the state file was last written
+    display(f"serving status of {plural(repositories):# repositor/y/ies}.")
+    try:
+        while True:
+            now = arrow.now()
+            changed = False
+            for description, params in repositories.items():
+                host = params.get('host')
+                if host and local:
+                    table[description] = dict(repos=[])
+                elif host:
+                    query = queries.get(description)
+                    if query and query.done():
+                        del queries[description]
+                        narrate("refreshed:", description)
+                        table[description] = to_state(
+                            parse_remote_data(host, query)
+                        )
+                        refresh = params.get('refresh') or default_refresh
+                        next_refresh[description] = time.monotonic() + refresh
+                        changed = True
+                    elif not query and time.monotonic() >= next_refresh.get(description, 0):
+                        queries[description] = executor.submit(
+                            query_remote,
+                            host,
+                            params.get('config'),
+                            params.get('command'),
+                            params.get('timeout') or default_timeout,
+                        )
+                else:
+                    config = params.get('config')
+                    path = cull([root, params.get('sentinel_dir')])
+                    signature = get_signature(get_local_paths(config, path))
+                    if signature != signatures.get(description):
+                        narrate("refreshed:", description)
+                        signatures[description] = signature
+                        max_age = params.get('max_age') or default_max_age
+                        table[description] = to_state(
+                            get_local_data(description, config, path, max_age)
+                        )
+                        changed = True
+
+            # the state is not saved until every repository has reported,
+            # and is rewritten periodically to show that the server is alive
+            if written is not None and not changed:
+                changed = time.monotonic() - written >= OVERDUE_STATE_INTERVAL
+            if changed and table.keys() == repositories.keys():
+                write_state(state_path, od_settings, local, table)
+                written = time.monotonic()
+            time.sleep(OVERDUE_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        display("terminating overdue server.")
+    finally:
+        for query in queries.values():
+            query.cancel()
+        executor.shutdown(wait=False)
+        try:
+            state_path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            error(os_error(e))
+    return 0
 
 # MAIN {{{1
 def overdue(cmdline, args, settings, options):
@@ -224,7 +527,13 @@ def overdue(cmdline, args, settings, options):
     od_settings = settings.overdue
     if not od_settings:
         raise Error("no ‘overdue’ settings found.", culprit=settings.config_name)
+    if cmdline["--serve"]:
+        return serve(cmdline, settings, od_settings)
     default_max_age = od_settings.get("max_age", as_seconds('28h'))
+    default_timeout = od_settings.get(
+        "timeout", as_timeout(DEFAULT_OVERDUE_TIMEOUT)
+    )
+    concurrency = od_settings.get("concurrency", DEFAULT_OVERDUE_CONCURRENCY)
     repositories = od_settings.get("repositories")
     root = od_settings.get("sentinel_root")
     message = od_settings.get("message", terse_status_message)
@@ -260,6 +569,32 @@ def overdue(cmdline, args, settings, options):
         else:
             raise Error('must specify notify setting to send mail.')
 
+    # use the status maintained by the overdue server if one is running
+    # a server that covers all repositories also serves --local
+    state = None
+    if not cmdline["--direct"]:
+        state = read_state(get_state_path(settings, False), od_settings)
+        if not state and cmdline["--local"]:
+            state = read_state(get_state_path(settings, True), od_settings)
+    if state:
+        narrate("using status from overdue server.")
+
+    # start querying remote hosts
+    # the hosts are queried concurrently, but reported on in order
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+    queries = {}
+    if not cmdline["--local"] and not state:
+        for description, params in repositories.items():
+            if params.get('host'):
+                queries[description] = executor.submit(
+                    query_remote,
+                    params['host'],
+                    params.get('config'),
+                    params.get('command'),
+                    params.get('timeout') or default_timeout,
+                )
+
     # check age of repositories
     for description, params in repositories.items():
         config = params.get('config')
@@ -267,19 +602,28 @@ def overdue(cmdline, args, settings, options):
         max_age = params.get('max_age') or default_max_age
         notify = params.get('notify') or default_notify or []
         host = params.get('host')
-        command = params.get('command')
 
         failed = False
         try:
             if host:
                 ignoring = ("max_age", "sentinel_dir")
-                if not cmdline["--local"]:
-                    repos_data = get_remote_data(description, host, config, command)
+                if cmdline["--local"]:
+                    repos_data = []
+                elif state:
+                    display(f"\n{description}:")
+                    repos_data = from_state(state['repositories'][description])
+                else:
+                    repos_data = get_remote_data(
+                        description, host, queries[description]
+                    )
             else:
-                ignoring = ("command",)
-                repos_data = get_local_data(
-                    description, config, cull([root, sentinel_dir]), max_age
-                )
+                ignoring = ("command", "timeout", "refresh")
+                if state:
+                    repos_data = from_state(state['repositories'][description])
+                else:
+                    repos_data = get_local_data(
+                        description, config, cull([root, sentinel_dir]), max_age
+                    )
             ignored = set(ignoring) & params.keys()
             if ignored:
                 culprit = (
@@ -340,6 +684,8 @@ def overdue(cmdline, args, settings, options):
                     error_message.format(msg),
                 )
 
+    executor.shutdown()
+
     if cmdline["--mail"]:
         for recipient, msgs in overdue_by_recipient.items():
             subject = f"{plural(msgs):backup/ is/s are} overdue"
@@ -43,8 +43,17 @@ else:
 SHARED_SETTINGS_FILE = "shared.conf.nt"
 OVERDUE_FILE = "overdue.conf.nt"
 LOG_FILE = "{config_name}.log"
+EVENT_LOG_FILE = "{config_name}.events.jsonl"
 LOCK_FILE = "{config_name}.lock"
 DATE_FILE = "{config_name}.latest.nt"
+ARCHIVES_FILE = "{config_name}.archives.json"
+OVERDUE_STATE_FILE = "{config_name}.overdue.{scope}.json"
+SETTINGS_CACHE_FILE = "{config_name}.settings.json"
+STATUS_FILE = "status.db"
+INDEX_FILE = "{config_name}.index.db"
+VERSIONS_FILE = "{config_name}.versions.db"
+MOUNT_CACHE_DIR = "mounts"
+MOUNT_REAPER_PID_FILE = "reaper.pid"
 
 # Miscellaneous settings {{{2
 INCLUDE_SETTING = "include"
@@ -52,7 +61,37 @@ DEFAULT_ENCODING = "utf-8"
 DEFAULT_COMMAND = "create"
 DEFAULT_ENCRYPTION = "none"
 DEFAULT_AGE_BAR_WIDTH = 20
+DEFAULT_OVERDUE_TIMEOUT = 60  # seconds
+DEFAULT_OVERDUE_CONCURRENCY = 16
+DEFAULT_OVERDUE_REFRESH = 600  # seconds
+DEFAULT_VERSIONS_JOBS = 4
+OVERDUE_POLL_INTERVAL = 2  # seconds
+OVERDUE_STATE_INTERVAL = 60  # seconds
+    # how often the overdue server rewrites its state file when nothing has
+    # changed; state not rewritten in several intervals is ignored
+SSH_CONTROL_PERSIST = "10m"
+    # how long a shared SSH connection remains open after its last use if it is
+    # not closed explicitly
 DEFAULT_TIME_FORMAT = 'YYYY-MM-DD h:mm A'
+PROGRESS_LOG_INTERVAL = 60  # seconds
+    # how often progress is written when the output is not a terminal
+PROGRESS_REPORT_INTERVAL = 300  # seconds
+    # how often progress is published to the monitoring services
+DEFAULT_HOOK_TIMEOUT = 10  # seconds
+    # how long to wait for a monitoring service to respond to a single request
+HOOK_RETRIES = 4
+    # how many times a signal is resent to a monitoring service that failed
+HOOK_RETRY_DELAY = 1  # seconds
+    # the delay before the first retry, it doubles with each retry
+HOOK_MAX_RETRY_DELAY = 15  # seconds
+HOOK_BUDGET = 60  # seconds
+    # how long a signal may take to be delivered, including retries
+MOUNT_REAPER_RETRY = 60  # seconds
+    # how long to wait before trying again to unmount an archive that is in use
+HOOK_OUTBOX_SIZE = 100
+    # how many undelivered signals are kept for each service of each config,
+    # the oldest are discarded first
+DEFAULT_LIST_SORT_MEMORY = 100_000_000  # bytes
 
 # Initial contents of files {{{2
 # Shared settings {{{3
@@ -0,0 +1,215 @@
+# Progress
+#
+# Renders the progress reported by Borg.  When given --log-json and --progress,
+# Borg writes its progress and its log messages to stderr as lines of JSON.
+# These are consumed as they are produced and rendered as a single status line
+# that gives the amount of data processed, the rate at which it is being
+# processed, and when it can be estimated, the time remaining.  The same
+# information is passed to an optional publisher, which is used to report the
+# progress of backups to the monitoring services.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import json
+import shutil
+import sys
+import time
+import arrow
+from .preferences import PROGRESS_LOG_INTERVAL
+from .utilities import Quantity, when
+
+
+# ProgressMonitor class {{{1
+class ProgressMonitor:
+    """Consumes the JSON output of Borg and reports its progress
+
+    command (str):
+        The Borg command being run.
+    expected_size (int):
+        The size of the files backed up by the previous archive, used to
+        estimate how much of a backup remains.
+    echo (bool):
+        Output the log messages from Borg as they arrive, otherwise they are
+        only collected.
+    publish (callable):
+        Called with each progress event, a dictionary.
+    stream (file):
+        Where the progress is written.
+
+    The monitor is passed to Assimilate.run_borg() as show_progress.  It
+    returns the last progress event, and the log messages are available as
+    text from the messages attribute once Borg terminates.
+    """
+
+    def __init__(
+        self, command, expected_size=None, echo=False, publish=None,
+        stream=sys.stderr
+    ):
+        self.command = command
+        self.expected_size = expected_size
+        self.echo = echo
+        self.publish = publish
+        self.stream = stream
+        self.is_tty = stream.isatty()
+        self.messages = []
+        self.event = None
+        self.shown = ""
+        self.last_logged = 0
+        self.started = None
+        self.operation = None
+
+    # __call__() {{{2
+    def __call__(self, lines):
+        self.started = time.monotonic()
+        for line in lines:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                self.add_message(line.decode("utf8", errors="replace").rstrip())
+                continue
+            kind = msg.get("type")
+            if kind == "log_message":
+                self.add_message(msg.get("message", ""))
+            elif kind == "file_status":
+                self.add_message(f"{msg.get('status')} {msg.get('path')}")
+            elif kind == "archive_progress":
+                self.archive_progress(msg)
+            elif kind == "progress_percent":
+                self.progress_percent(msg)
+            elif kind == "progress_message":
+                self.progress_message(msg)
+        self.clear()
+        return self.event
+
+    # add_message() {{{2
+    def add_message(self, message):
+        self.messages.append(message)
+        if self.echo:
+            self.clear()
+            print(message, file=self.stream)
+            self.draw(self.shown)
+
+    # archive_progress() {{{2
+    def archive_progress(self, msg):
+        if msg.get("finished"):
+            return self.update(dict(finished=True))
+        elapsed = time.monotonic() - self.started
+        original_size = msg.get("original_size", 0)
+        nfiles = msg.get("nfiles", 0)
+        event = dict(
+            nfiles = nfiles,
+            original_size = original_size,
+            deduplicated_size = msg.get("deduplicated_size"),
+            path = msg.get("path", ""),
+            rate = original_size/elapsed if elapsed else None,
+            files_rate = nfiles/elapsed if elapsed else None,
+        )
+        if self.expected_size and event["rate"]:
+            # the size of the last archive is used as an estimate of the size
+            # of this one, so stop short of claiming that it is complete
+            fraction = min(original_size/self.expected_size, 0.99)
+            remaining = max(self.expected_size - original_size, 0)
+            event.update(percent=100*fraction, eta=remaining/event["rate"])
+        self.update(event)
+
+    # progress_percent() {{{2
+    def progress_percent(self, msg):
+        if msg.get("finished"):
+            return self.update(dict(finished=True))
+        operation = msg.get("msgid"), msg.get("operation")
+        if operation != self.operation:
+            # a new operation has started, measure its rate from here
+            self.operation = operation
+            self.operation_started = time.monotonic()
+        current = msg.get("current") or 0
+        total = msg.get("total") or 0
+        event = dict(message=msg.get("message", ""), current=current, total=total)
+        if total:
+            event["percent"] = 100*current/total
+        elapsed = time.monotonic() - self.operation_started
+        if current and total and elapsed:
+            event["eta"] = elapsed*(total - current)/current
+        self.update(event)
+
+    # progress_message() {{{2
+    def progress_message(self, msg):
+        if msg.get("finished"):
+            return self.update(dict(finished=True))
+        message = msg.get("message", "")
+        if message and not self.is_tty:
+            print(message, file=self.stream)
+        self.update(dict(message=message))
+
+    # update() {{{2
+    def update(self, event):
+        event.update(
+            command = self.command,
+            elapsed = time.monotonic() - self.started,
+            finished = event.get("finished", False),
+        )
+        self.event = event
+        if self.publish:
+            self.publish(event)
+        if event["finished"]:
+            return
+        text = self.render(event)
+        if self.is_tty:
+            self.draw(text)
+        elif time.monotonic() - self.last_logged >= PROGRESS_LOG_INTERVAL:
+            if "nfiles" in event or "percent" in event:
+                print(text, file=self.stream)
+                self.last_logged = time.monotonic()
+
+    # render() {{{2
+    @staticmethod
+    def render(event):
+        """Return a description of a progress event suitable for people"""
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            fields = []
+            if "nfiles" in event:
+                fields.append(f"{event['nfiles']} files")
+                fields.append(str(Quantity(event["original_size"], "B")))
+                if event.get("files_rate") is not None:
+                    fields.append(f"{event['files_rate']:.0f} files/s")
+                if event.get("rate") is not None:
+                    fields.append(str(Quantity(event["rate"], "B/s")))
+                if event.get("percent") is not None:
+                    fields.append(f"{event['percent']:.0f}%")
+            elif event.get("message"):
+                # borg includes the percentage in its message
+                fields.append(event["message"])
+            if event.get("eta") is not None:
+                eta = arrow.now().shift(seconds=event["eta"])
+                fields.append(f"{when(eta)} remaining")
+        return ", ".join(fields)
+
+    # draw() {{{2
+    def draw(self, text):
+        if not self.is_tty or not text:
+            return
+        width = shutil.get_terminal_size().columns - 1
+        self.stream.write(f"\r{text[:width]}\x1b[K")
+        self.stream.flush()
+        self.shown = text
+
+    # clear() {{{2
+    def clear(self):
+        if self.is_tty and self.shown:
+            self.stream.write("\r\x1b[K")
+            self.stream.flush()
+            self.shown = ""
@@ -0,0 +1,136 @@
+# Sorting
+#
+# Sorts listings that are too large to hold in memory.  Entries are accumulated
+# in memory until a budget is exceeded, at which point they are sorted and
+# spilled to a temporary file as a run.  Once all entries have been added, the
+# runs are merged to produce the final ordering.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import heapq
+import json
+import tempfile
+from inform import Error, narrate, os_error
+
+
+# Globals {{{1
+ENTRY_OVERHEAD = 128
+    # approximate number of bytes needed to hold an entry in memory beyond
+    # the length of its text
+
+
+# ExternalSort class {{{1
+class ExternalSort:
+    """Sort JSON lines using a bounded amount of memory
+
+    key (str):
+        Name of the field to sort on.  If None, entries are kept in the order
+        they were added, which is only useful when reverse is true.
+    reverse (bool):
+        Reverse the order of the entries.  The result is the exact reverse of
+        the ascending order, including entries that have the same key.
+    max_memory (int):
+        Approximate number of bytes that may be used to hold entries in memory.
+    temp_dir (path):
+        Directory that holds the temporary files used for spilled runs.
+
+    Use add() to add the entries, then iterate through the sorter to get the
+    decoded entries in order.  Should be used as a context manager so that
+    the temporary files are closed.  Ties are broken by the order in which
+    entries were added, so the sort is stable.
+    """
+
+    def __init__(self, key, reverse=False, max_memory=100_000_000, temp_dir=None):
+        self.key = key
+        self.reverse = reverse
+        self.max_memory = max_memory
+        self.temp_dir = temp_dir
+        self.buffer = []
+        self.buffer_size = 0
+        self.runs = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+    # sort_key() {{{2
+    def sort_key(self, values, seq):
+        if self.key is None:
+            return (seq,)
+        try:
+            return (values[self.key], seq)
+        except KeyError:
+            raise Error('unknown key.', culprit=self.key)
+
+    # add() {{{2
+    def add(self, line, values):
+        # line is the text of the entry as bytes, values is the decoded entry
+        self.buffer.append((self.sort_key(values, self.count), line))
+        self.count += 1
+        self.buffer_size += len(line) + ENTRY_OVERHEAD
+        if self.buffer_size > self.max_memory:
+            self.spill()
+
+    # spill() {{{2
+    def spill(self):
+        # sort the entries held in memory and write them to a temporary file
+        self.buffer.sort(key=lambda entry: entry[0], reverse=self.reverse)
+        try:
+            run = tempfile.TemporaryFile(dir=self.temp_dir, prefix='sort.')
+            for key, line in self.buffer:
+                run.write(b'%d\t' % key[-1])
+                run.write(line if line.endswith(b'\n') else line + b'\n')
+            run.seek(0)
+        except OSError as e:
+            raise Error(os_error(e))
+        narrate(f"spilled {len(self.buffer)} entries to temporary file.")
+        self.runs.append(run)
+        self.buffer = []
+        self.buffer_size = 0
+
+    # read_run() {{{2
+    def read_run(self, run):
+        for record in run:
+            seq, _, line = record.partition(b'\t')
+            values = json.loads(line)
+            yield self.sort_key(values, int(seq)), values
+
+    # read_buffer() {{{2
+    def read_buffer(self):
+        self.buffer.sort(key=lambda entry: entry[0], reverse=self.reverse)
+        for key, line in self.buffer:
+            yield key, json.loads(line)
+
+    # __iter__() {{{2
+    def __iter__(self):
+        if not self.runs:
+            for key, values in self.read_buffer():
+                yield values
+            return
+
+        # merge the spilled runs along with what remains in memory
+        # keys are unique as they include the sequence number, so the values
+        # are never compared
+        runs = [self.read_run(run) for run in self.runs] + [self.read_buffer()]
+        for key, values in heapq.merge(*runs, reverse=self.reverse):
+            yield values
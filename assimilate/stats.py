@@ -0,0 +1,154 @@
+# Stats
+#
+# The statistics reported by Borg.  Borg reports the statistics of the archive
+# it creates in the JSON it writes to stdout when given --json, and reports the
+# outcome of compacting the repository in the log messages it writes to stderr,
+# which are in JSON when given --log-json.  Both are converted to a BorgStats
+# object, which is recorded in the history, passed to the monitoring hooks, and
+# used when reporting throughput.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import json
+from inform import Error
+from .utilities import Quantity, QuantiPhyError
+
+
+# Globals {{{1
+STATISTICS = dict(
+    # name: (description, units, type)
+    duration = ("duration", "s", float),
+    nfiles = ("number of files", None, int),
+    original_size = ("original size", "B", int),
+    compressed_size = ("compressed size", "B", int),
+    deduplicated_size = ("deduplicated size", "B", int),
+    unique_chunks = ("unique chunks", None, int),
+    source_size = ("source data size", "B", int),
+    repo_size = ("repository size", "B", int),
+    compaction_saved = ("compaction saved", "B", int),
+)
+
+ARCHIVE_STATISTICS = """
+    duration nfiles original_size compressed_size deduplicated_size
+""".split()
+    # the statistics of an archive, as reported by borg create
+
+COMPACT_MESSAGES = dict(
+    # Borg gives these sizes only in its log messages, formatted for people
+    # prefix: name
+    source_size = "Source data size was ",
+    repo_size = "Repository size is ",
+    compaction_saved = "Compaction saved ",
+)
+
+
+# BorgStats class {{{1
+class BorgStats:
+    """Statistics reported by Borg
+
+    Each of the names in STATISTICS is an attribute, which is None if Borg did
+    not report it.  Sizes are in bytes and the duration is in seconds.
+    """
+
+    def __init__(self, **kwargs):
+        for name, (desc, units, kind) in STATISTICS.items():
+            value = kwargs.pop(name, None)
+            setattr(self, name, None if value is None else kind(value))
+        if kwargs:
+            raise Error(f"unknown statistic: {', '.join(kwargs)}.")
+
+    # from_create_json() {{{2
+    @classmethod
+    def from_create_json(cls, text):
+        """Statistics from the output of borg create --json"""
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise Error("could not read statistics from Borg.", codicil=str(e))
+        archive = data.get("archive", {})
+        stats = {
+            k: v for k, v in archive.get("stats", {}).items()
+            if k in STATISTICS
+        }
+        stats["duration"] = archive.get("duration")
+        cache_stats = data.get("cache", {}).get("stats", {})
+        stats["unique_chunks"] = cache_stats.get("total_unique_chunks")
+        return cls(**stats)
+
+    # from_compact_message() {{{2
+    def from_compact_message(self, message):
+        """Extract any statistics from a log message given by borg compact"""
+        for name, prefix in COMPACT_MESSAGES.items():
+            if message.startswith(prefix):
+                size = message[len(prefix):].split(" in ")[0].rstrip(".")
+                try:
+                    setattr(self, name, int(Quantity(size, ignore_sf=False)))
+                except QuantiPhyError:
+                    pass
+                return True
+        return False
+
+    # from_dict() {{{2
+    @classmethod
+    def from_dict(cls, stats):
+        """Statistics as recorded in the history"""
+        return cls(**{k: v for k, v in stats.items() if k in STATISTICS})
+
+    # as_dict() {{{2
+    def as_dict(self):
+        """The statistics that were reported, suitable for converting to JSON"""
+        return {
+            name: getattr(self, name)
+            for name in STATISTICS
+            if getattr(self, name) is not None
+        }
+
+    # throughput {{{2
+    @property
+    def throughput(self):
+        """Rate at which the files were backed up in bytes per second"""
+        if self.original_size is not None and self.duration:
+            return self.original_size/self.duration
+
+    # quantities() {{{2
+    def quantities(self):
+        """Return the reported statistics as quantities, keyed by name"""
+        return {
+            name: Quantity(value, STATISTICS[name][1] or "")
+            for name, value in self.as_dict().items()
+        }
+
+    # render() {{{2
+    def render(self, names=None):
+        """Return the statistics as text suitable for people, keyed by description"""
+        rendered = {}
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            for name in names or STATISTICS:
+                value = getattr(self, name)
+                if value is None:
+                    continue
+                desc, units, kind = STATISTICS[name]
+                rendered[desc] = str(Quantity(value, units) if units else value)
+        return rendered
+
+    def __bool__(self):
+        return bool(self.as_dict())
+
+    def __repr__(self):
+        args = ", ".join(f"{k}={v!r}" for k, v in self.as_dict().items())
+        return f"{self.__class__.__name__}({args})"
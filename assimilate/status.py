@@ -0,0 +1,392 @@
+# Status
+#
+# Keeps a history of the runs of the commands that maintain the repositories
+# (create, prune, compact, and check) in an SQLite database in the data
+# directory.  Each run is recorded with its start and end times, its exit
+# status, whether it succeeded, and, when available, the size of the repository
+# and the statistics reported by Borg.  The time of the last successful run of
+# each command is derived from the history, which replaces reading the
+# per-config date files.  The date files are still written so that they can be
+# used to monitor configs from other accounts, and are used as a fallback for
+# configs that have no history.
+#
+# The database also holds the outbox, the signals to the monitoring services
+# that could not be delivered and are to be resent later, and the archives that
+# remain mounted so that they can be reused.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import json
+import sqlite3
+import arrow
+from inform import Error, narrate
+from .preferences import STATUS_FILE
+from .stats import BorgStats
+from .utilities import Quantity, read_latest, to_path
+
+
+# Globals {{{1
+SCHEMA = """
+    create table if not exists runs (
+        config text not null,
+        command text not null,
+        started real not null,
+        ended real not null,
+        status integer,
+        succeeded integer not null,
+        repo_size real,
+        stats text
+    );
+    create index if not exists runs_by_config on runs (config, command, ended);
+    create table if not exists outbox (
+        id integer primary key,
+        config text not null,
+        service text not null,
+        time real not null,
+        result text,
+        request text not null
+    );
+    create table if not exists mounts (
+        mount_point text primary key,
+        config text not null,
+        archive text not null,
+        lock_file text not null,
+        borg text not null,
+        ttl real not null,
+        last_used real not null
+    );
+"""
+LOCK_TIMEOUT = 30  # seconds
+    # how long to wait for another process that is writing to the database
+
+
+# StatusStore class {{{1
+class StatusStore:
+    """History of the runs of the commands that maintain the repositories
+
+    data_dir (path):
+        Directory that contains the database.
+
+    The database is only created when a run is added, so reading from a store
+    that does not yet exist returns no runs.
+    """
+
+    def __init__(self, data_dir):
+        self.path = to_path(data_dir, STATUS_FILE)
+        self.connection = None
+        self.writable = False
+
+    # connect() {{{2
+    def connect(self, write=False):
+        if self.connection:
+            if self.writable or not write:
+                return self.connection
+            self.close()
+        if not write and not self.path.exists():
+            return None
+        try:
+            if write:
+                connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+                connection.executescript(SCHEMA)
+            else:
+                # the database may belong to another account
+                connection = sqlite3.connect(
+                    f"{self.path.as_uri()}?mode=ro", uri=True,
+                    timeout=LOCK_TIMEOUT
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        connection.row_factory = sqlite3.Row
+        self.connection = connection
+        self.writable = write
+        return connection
+
+    # close() {{{2
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    # add_run() {{{2
+    def add_run(
+        self, config, command, started, ended, status, succeeded,
+        repo_size=None, stats=None
+    ):
+        """Record a run of a command
+
+        started and ended are arrow objects, repo_size is in bytes, and stats
+        is a dictionary that can be converted to JSON, as returned by
+        BorgStats.as_dict().
+        """
+        try:
+            connection = self.connect(write=True)
+            with connection:  # commits the run as a single transaction
+                connection.execute(
+                    "insert into runs values (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        config, command,
+                        started.timestamp(), ended.timestamp(),
+                        status, bool(succeeded),
+                        None if repo_size is None else float(repo_size),
+                        None if stats is None else json.dumps(stats),
+                    )
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # add_undelivered() {{{2
+    def add_undelivered(self, config, service, entries, limit):
+        """Save signals to a monitoring service that could not be delivered
+
+        Each entry is a dictionary that contains the time the signal was sent
+        as an arrow object, the result it reports, and the request, which must
+        be convertible to JSON.  Only the most recent limit entries are kept
+        for each service and config.
+        """
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                connection.executemany(
+                    "insert into outbox values (null, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            config, service, e['time'].timestamp(),
+                            e['result'], json.dumps(e['request'])
+                        )
+                        for e in entries
+                    ]
+                )
+                connection.execute(
+                    """
+                        delete from outbox where config = ? and service = ?
+                        and id not in (
+                            select id from outbox
+                            where config = ? and service = ?
+                            order by time desc, id desc limit ?
+                        )
+                    """,
+                    (config, service, config, service, int(limit))
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # take_undelivered() {{{2
+    def take_undelivered(self, config=None, service=None):
+        """Remove and return the undelivered signals, oldest first
+
+        The signals are removed so that they are only resent by one process;
+        those that still cannot be delivered should be added back.
+        """
+        conditions = []
+        values = []
+        for column, value in [("config", config), ("service", service)]:
+            if value:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = (" where " + " and ".join(conditions)) if conditions else ""
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                # lock the database so the signals are only taken once
+                connection.execute("begin immediate")
+                rows = connection.execute(
+                    f"select * from outbox{where} order by time, id", values
+                ).fetchall()
+                connection.execute(f"delete from outbox{where}", values)
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        return [
+            dict(
+                config = row['config'],
+                service = row['service'],
+                time = arrow.Arrow.fromtimestamp(row['time']),
+                result = row['result'],
+                request = json.loads(row['request']),
+            )
+            for row in rows
+        ]
+
+    # add_mount() {{{2
+    def add_mount(self, config, archive, mount_point, lock_file, borg, ttl):
+        """Record an archive that is to remain mounted until idle for ttl seconds
+
+        lock_file is the lock file of the config, which must be held while the
+        archive is unmounted, and borg is the executable used to unmount it.
+        """
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                connection.execute(
+                    "insert or replace into mounts values (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        str(mount_point), config, archive, str(lock_file),
+                        str(borg), float(ttl), arrow.now().timestamp()
+                    )
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # touch_mount() {{{2
+    def touch_mount(self, mount_point):
+        """Note that a mounted archive has just been used"""
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                connection.execute(
+                    "update mounts set last_used = ? where mount_point = ?",
+                    (arrow.now().timestamp(), str(mount_point))
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # remove_mount() {{{2
+    def remove_mount(self, mount_point):
+        """Forget a mounted archive once it has been unmounted"""
+        try:
+            connection = self.connect(write=True)
+            with connection:
+                connection.execute(
+                    "delete from mounts where mount_point = ?", (str(mount_point),)
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # get_mounts() {{{2
+    def get_mounts(self, config=None, archive=None):
+        """Return the archives that remain mounted, least recently used first
+
+        The time of last use is converted to an arrow object.
+        """
+        conditions = []
+        values = []
+        for column, value in [("config", config), ("archive", archive)]:
+            if value:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = (" where " + " and ".join(conditions)) if conditions else ""
+        try:
+            connection = self.connect()
+            if not connection:
+                return []
+            rows = connection.execute(
+                f"select * from mounts{where} order by last_used", values
+            ).fetchall()
+        except sqlite3.Error as e:
+            if "no such table" in str(e):
+                return []  # database was created by an earlier version
+            raise Error(e, culprit=self.path)
+        mounts = []
+        for row in rows:
+            mount = dict(row)
+            mount['last_used'] = arrow.Arrow.fromtimestamp(mount['last_used'])
+            mounts.append(mount)
+        return mounts
+
+    # get_runs() {{{2
+    def get_runs(self, config=None, command=None, since=None, limit=None):
+        """Return the recorded runs, most recent first
+
+        Each run is returned as a dictionary.  The start and end times are
+        converted to arrow objects, the repository size to a quantity, and the
+        statistics to a BorgStats object.
+        """
+        conditions = []
+        values = []
+        for column, value in [("config", config), ("command", command)]:
+            if value:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if since:
+            conditions.append("ended >= ?")
+            values.append(since.timestamp())
+        query = "select * from runs"
+        if conditions:
+            query += " where " + " and ".join(conditions)
+        query += " order by ended desc"
+        if limit:
+            query += f" limit {int(limit)}"
+
+        try:
+            connection = self.connect()
+            if not connection:
+                return []
+            rows = connection.execute(query, values).fetchall()
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        return [self.convert(row) for row in rows]
+
+    # get_latest() {{{2
+    def get_latest(self, config, date_file=None):
+        """Return the time of the last successful run of each command
+
+        The result takes the same form as the contents of the date file.  The
+        date file is read first and any value also found in the history is
+        replaced by the one from the history, so entries the history does not
+        hold, such as the statistics, are kept.
+        """
+        latest = {}
+        date_file_error = None
+        if date_file:
+            try:
+                latest = read_latest(date_file)
+            except OSError as e:
+                # the history may be all that is needed
+                date_file_error = e
+        history = {}
+        try:
+            connection = self.connect()
+            if connection:
+                rows = connection.execute(
+                    """
+                        select command, max(ended) from runs
+                        where config = ? and succeeded
+                        group by command
+                    """,
+                    (config,)
+                ).fetchall()
+                for command, ended in rows:
+                    history[f"{command} last run"] = arrow.Arrow.fromtimestamp(ended)
+                row = connection.execute(
+                    """
+                        select repo_size from runs
+                        where config = ? and succeeded and repo_size is not null
+                        order by ended desc limit 1
+                    """,
+                    (config,)
+                ).fetchone()
+                if row:
+                    history['repository size'] = Quantity(row[0], "B")
+        except sqlite3.Error as e:
+            narrate(e, culprit=self.path)
+        if date_file_error and not history:
+            raise date_file_error
+        latest.update(history)
+        return latest
+
+    # convert() {{{2
+    @staticmethod
+    def convert(row):
+        run = dict(row)
+        run['started'] = arrow.Arrow.fromtimestamp(run['started'])
+        run['ended'] = arrow.Arrow.fromtimestamp(run['ended'])
+        run['succeeded'] = bool(run['succeeded'])
+        if run['repo_size'] is not None:
+            run['repo_size'] = Quantity(run['repo_size'], "B")
+        if run['stats'] is not None:
+            run['stats'] = BorgStats.from_dict(json.loads(run['stats']))
+        return run
@@ -22,6 +22,7 @@ import pwd
 import os
 import socket
 import sys
+from datetime import datetime
 import nestedtext as nt
 from docopt import docopt, DocoptExit
 from inform import (
@@ -192,7 +193,7 @@ def when(time, relative_to=None, as_past=None, as_future=None):
 
 
 # update_latest {{{1
-def update_latest(commands, path, options, repo_size=None):
+def update_latest(commands, path, options, repo_size=None, stats=None):
     if 'dry-run' in options:
         return
     if is_str(commands):
@@ -213,10 +214,16 @@ def update_latest(commands, path, options, repo_size=None):
     for command in commands:
         latest[f"{command} last run"] = now
     if repo_size:
-        latest['repository size'] = repo_size
+        with Quantity.prefs(form="si", spacer=" ", prec=2):
+            latest['repository size'] = str(Quantity(repo_size, "B"))
     elif 'repository size' in latest:
         if repo_size is False:
             del latest['repository size']
+    for command in commands:
+        if stats:
+            latest[f"{command} stats"] = stats
+        else:
+            latest.pop(f"{command} stats", None)
 
     try:
         nt.dump(latest, path, sort_keys=True)
@@ -225,6 +232,15 @@ def update_latest(commands, path, options, repo_size=None):
     except OSError as e:
         warn(os_error(e))
 
+# to_arrow {{{1
+def to_arrow(timestamp):
+    # Borg and Assimilate use a fixed ISO format for their time stamps, which
+    # the standard library parses much faster than arrow.get().
+    try:
+        return arrow.Arrow.fromdatetime(datetime.fromisoformat(timestamp))
+    except (TypeError, ValueError):
+        return arrow.get(timestamp)
+
 # read_latest {{{1
 def read_latest(path):
     try:
@@ -232,7 +248,7 @@ def read_latest(path):
         for k, v in latest.items():
             if "last run" in k:
                 try:
-                    latest[k] = arrow.get(v)
+                    latest[k] = to_arrow(v)
                 except arrow.parser.ParserError:
                     warn(f"{k}: date not given in iso format.", culprit=path)
         return latest
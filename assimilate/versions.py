@@ -0,0 +1,240 @@
+# Versions
+#
+# Finds the versions of a file held in a sequence of archives.  Each archive is
+# queried for the metadata of the file using borg list, and the archives that
+# hold the same version are grouped.  Consecutive archives whose copies have the
+# same type, size and modification time hold the same version.  If only the
+# modification times differ, Borg is asked for the hashes of the contents, and
+# those that match are also taken to be the same version.
+#
+# Archives never change, so what is found in each archive is cached in an SQLite
+# database in the data directory, including that the file is not present.  Only
+# the archives that have not been queried before need be listed.
+
+# License {{{1
+# Copyright (C) 2018-2026 Kenneth S. Kundert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+
+# Imports {{{1
+import json
+import sqlite3
+from inform import Error
+from .compare import HASH_ALGORITHM, to_microseconds
+from .utilities import to_path
+
+
+# Globals {{{1
+SCHEMA = """
+    create table if not exists versions (
+        archive_id text not null,
+        path text not null,
+        type text,
+        size integer,
+        mtime integer,
+        hash text,
+        primary key (archive_id, path)
+    ) without rowid;
+"""
+    # a row with a null type records that the archive does not hold the path
+VERSION_FORMAT = "{type}{size}{mtime}{path}"
+    # the fields requested from borg list
+LOCK_TIMEOUT = 30  # seconds
+    # how long to wait for another process that is writing to the database
+
+
+# read_version() {{{1
+def read_version(path, lines):
+    """Return the metadata of a file from the output of borg list
+
+    lines is the output of borg list run with --json-lines and VERSION_FORMAT.
+    Returns None if the file is not present.
+    """
+    found = None
+    for line in lines:
+        entry = json.loads(line)
+        if entry["path"] == path:
+            mtime = entry.get("mtime")
+            found = dict(
+                type = entry.get("type"),
+                size = entry.get("size"),
+                mtime = to_microseconds(mtime) if mtime else None,
+            )
+    return found
+
+
+# read_hash() {{{1
+def read_hash(path, lines):
+    """Return the hash of a file from the output of borg list run with HASH_FORMAT"""
+    found = None
+    for line in lines:
+        entry = json.loads(line)
+        if entry["path"] == path:
+            found = entry.get(HASH_ALGORITHM)
+    return found
+
+
+# group_versions() {{{1
+def group_versions(archives, found):
+    """Group consecutive archives that hold the same version of a file
+
+    archives are the descriptions of the archives given by Borg, oldest first,
+    and found maps the ID of each archive to the metadata of the file it holds,
+    or to None if it does not hold the file.  Returns a list of versions, each a
+    dictionary that holds the metadata and the archives that contain it.  The
+    metadata is None for the archives that do not hold the file.
+    """
+    versions = []
+    for archive in archives:
+        metadata = found.get(archive["id"])
+        key = metadata and (metadata["type"], metadata["size"], metadata["mtime"])
+        if versions and versions[-1]["key"] == key:
+            versions[-1]["archives"].append(archive)
+            if metadata and metadata.get("hash"):
+                # the hash need only be known for one of the archives
+                versions[-1]["metadata"] = metadata
+        else:
+            versions.append(dict(key=key, metadata=metadata, archives=[archive]))
+    return versions
+
+
+# needs_hash() {{{1
+def needs_hash(versions):
+    """Return the versions whose hashes are needed to merge those that are alike
+
+    Adjacent versions of a regular file that differ only in their modification
+    times may hold the same contents.  Those without a hash are returned.
+    """
+    wanted = []
+    for prev, this in zip(versions, versions[1:]):
+        if is_touched(prev, this):
+            wanted.extend(
+                v for v in (prev, this)
+                if not v["metadata"].get("hash") and v not in wanted
+            )
+    return wanted
+
+
+# is_touched() {{{1
+def is_touched(prev, this):
+    """Two versions of a regular file differ only in their modification times"""
+    a, b = prev["metadata"], this["metadata"]
+    return bool(
+        a and b and a["type"] == b["type"] == "-" and a["size"] == b["size"]
+    )
+
+
+# merge_versions() {{{1
+def merge_versions(versions):
+    """Merge adjacent versions whose contents have the same hash
+
+    The merged version takes the metadata of the most recent of them.
+    """
+    merged = []
+    for version in versions:
+        if merged and is_touched(merged[-1], version):
+            prev_hash = merged[-1]["metadata"].get("hash")
+            if prev_hash and prev_hash == version["metadata"].get("hash"):
+                version = dict(
+                    version, archives=merged[-1]["archives"] + version["archives"]
+                )
+                merged[-1] = version
+                continue
+        merged.append(version)
+    return merged
+
+
+# VersionCache class {{{1
+class VersionCache:
+    """What has been found in each archive for the paths queried
+
+    path (path):
+        The database.
+    """
+
+    def __init__(self, path):
+        self.path = to_path(path)
+        self.connection = None
+
+    # connect() {{{2
+    def connect(self):
+        if self.connection:
+            return self.connection
+        try:
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+            connection.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        self.connection = connection
+        return connection
+
+    # close() {{{2
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    # get() {{{2
+    def get(self, path):
+        """Return what has been found for a path, keyed by archive ID"""
+        try:
+            rows = self.connect().execute(
+                """
+                    select archive_id, type, size, mtime, hash
+                    from versions where path = ?
+                """,
+                (path,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+        return {
+            archive_id: (
+                None if kind is None
+                else dict(type=kind, size=size, mtime=mtime, hash=hash)
+            )
+            for archive_id, kind, size, mtime, hash in rows
+        }
+
+    # add() {{{2
+    def add(self, path, archive_id, metadata):
+        """Record what was found for a path in an archive; None if not present"""
+        metadata = metadata or {}
+        try:
+            with self.connect() as connection:
+                connection.execute(
+                    "insert or replace into versions values (?, ?, ?, ?, ?, ?)",
+                    (
+                        archive_id, path, metadata.get("type"),
+                        metadata.get("size"), metadata.get("mtime"),
+                        metadata.get("hash"),
+                    )
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
+
+    # forget() {{{2
+    def forget(self, available):
+        """Discard what was found in archives that are no longer available"""
+        try:
+            with self.connect() as connection:
+                cached = set(
+                    row[0] for row in
+                    connection.execute("select distinct archive_id from versions")
+                )
+                connection.executemany(
+                    "delete from versions where archive_id = ?",
+                    [(archive_id,) for archive_id in cached - set(available)]
+                )
+        except sqlite3.Error as e:
+            raise Error(e, culprit=self.path)
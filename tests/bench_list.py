@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark the list formatter.
+
+Usage:
+    bench_list.py [options] [<format>...]
+
+Options:
+    -n, --entries <N>   number of entries [default: 1000000]
+    -c, --color         color the output as if writing to a terminal
+
+Compares the loop used by the list command to format and write the entries
+given by Borg against the loop it replaced, which is copied below unchanged.
+The entries are decoded from JSON before the loops are timed, as that cost is
+the same for both.  Output is written to /dev/null.  The formats may be any of those predefined by
+the list command or any of the extra formats given below; all are run by
+default.
+"""
+
+import arrow
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from docopt import docopt
+from inform import Color, Error, full_stop, log, truth
+from quantiphy import Quantity
+from assimilate.command import (
+    LIST_FORMATS, LIST_OUTPUT_BATCH, compile_list_format
+)
+
+FORMATS = dict(
+    LIST_FORMATS,
+    mdate = "{mTime:YYYY-MM-DD HH:mm} {path}{Type}",
+    ago = "{mAgo:>16} {path}{Type}",
+    health = "{healthy} {Size:7.2b} {path}{extra}",
+)
+
+def make_entries(count):
+    # the fields Borg gives for each entry with --json-lines, along with size
+    # and mtime; sizes are log-normally distributed so roughly a quarter are
+    # distinct, as is typical of real trees
+    rng = random.Random(0)
+    modes = ['-rw-r--r--', '-rw-r--r--', '-rw-r--r--', 'drwxr-xr-x', 'lrwxrwxrwx']
+    for i in range(count):
+        mode = modes[i % len(modes)]
+        yield dict(
+            type = mode[0],
+            mode = mode,
+            user = 'user',
+            group = 'user',
+            uid = 1000,
+            gid = 1000,
+            path = f"home/user/d{i % 97}/f{i:07d}",
+            healthy = True,
+            target = 'elsewhere' if mode[0] == 'l' else '',
+            flags = 0,
+            size = int(rng.lognormvariate(9, 3)),
+            mtime = f"2024-11-{1 + i % 28:02d}T12:{i % 60:02d}:00.000000",
+        )
+
+def colors(color):
+    if color:
+        return Color("green", enable=True), Color("red", enable=True)
+    return None, None
+
+def baseline(template, lines, color):
+    # the loop used by the list command before the format was compiled
+    path = ''
+    recursive = False
+    no_color = lambda x: x
+    if not color:
+        healthy_color = broken_color = no_color
+    else:
+        healthy_color, broken_color = colors(color)
+
+    total_size = 0
+    for values in lines:
+        # this loop can be quite slow. the biggest issue is arrow. parsing
+        # time is slow. also output() can be slow, so use print() instead.
+        if path:
+            if not values['path'].startswith(path):
+                continue  # skip files not on the path
+            if not recursive:
+                if '/' in values['path'][len(path)+1:]:
+                    continue  # skip files is subdirs of specified path
+        if 'healthy' in values:
+            colorize = healthy_color if values['healthy'] else broken_color
+            values['healthy'] = truth(values['healthy'], formatter='healthy/broken')
+        else:
+            colorize = no_color
+        type = values['mode'][0]
+        values['Type'] = ''
+        values['extra'] = ''
+        if type == 'd':
+            values['Type'] = '/'  # directory
+        elif type == 'l':
+            values['Type'] = '@'  # directory
+            values['extra'] = ' —> ' + values['target']
+        elif type == 'h':
+            values['extra'] = ' links to ' + values['target']
+        elif type == 'p':
+            values['Type'] = '|'
+        elif type != '-':
+            log('UNKNOWN TYPE:', type, values['path'])
+        if 'mtime' in values and 'mTime' in template:
+            values['mTime'] = arrow.get(values['mtime'])
+        if 'mtime' in values and 'mAgo' in template:
+            values['mAgo'] = arrow.get(values['mtime']).humanize()
+        if 'ctime' in values and 'cTime' in template:
+            values['cTime'] = arrow.get(values['ctime'])
+        if 'ctime' in values and 'cAgo' in template:
+            values['cAgo'] = arrow.get(values['ctime']).humanize()
+        if 'atime' in values and 'aTime' in template:
+            values['aTime'] = arrow.get(values['atime'])
+        if 'atime' in values and 'aAgo' in template:
+            values['aAgo'] = arrow.get(values['atime']).humanize()
+        if 'size' in values:
+            total_size += values['size']
+            if 'Size' in template:
+                values['Size'] = Quantity(values['size'], "B")
+        if 'csize' in values and '{cSize' in template:
+            values['cSize'] = Quantity(values['csize'], "B")
+        if 'dsize' in values and '{dSize' in template:
+            values['dSize'] = Quantity(values['dsize'], "B")
+        if 'dcsize' in values and '{dcSize' in template:
+            values['dcSize'] = Quantity(values['dcsize'], "B")
+        try:
+            # use print rather than output because it is faster
+            print(colorize(template.format(**values)))
+        except ValueError as e:
+            raise Error(
+                full_stop(e),
+                'Likely due to a bad format specification in list_formats:',
+                codicil=template
+            )
+        except KeyError as e:
+            raise Error('Unknown key in:', culprit=e, codicil=template)
+
+    if total_size:
+        total_size = Quantity(total_size, 'B')
+        print(f"Total size = {total_size:0.2b}")
+
+def compiled(template, entries, color):
+    # the loop used by the list command when the output is not sorted
+    render = compile_list_format(template, *colors(color))
+    lines = []
+    total_size = 0
+    for values in entries:
+        lines.append(render(values))
+        total_size += values.get('size', 0)
+        if len(lines) >= LIST_OUTPUT_BATCH:
+            lines.append('')
+            sys.stdout.write('\n'.join(lines))
+            lines.clear()
+    lines.append('')
+    sys.stdout.write('\n'.join(lines))
+
+    if total_size:
+        total_size = Quantity(total_size, 'B')
+        print(f"Total size = {total_size:0.2b}")
+
+def timed(func, *args):
+    with open(os.devnull, 'w') as out, redirect_stdout(out):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+def check(template, count, color):
+    # both loops must produce the same output
+    results = []
+    for func in (baseline, compiled):
+        out = StringIO()
+        with redirect_stdout(out):
+            func(template, list(make_entries(count)), color)
+        results.append(out.getvalue())
+    if results[0] != results[1]:
+        raise AssertionError(f"output differs for {template}")
+
+def main():
+    cmdline = docopt(__doc__)
+    count = int(cmdline['--entries'])
+    names = cmdline['<format>'] or FORMATS
+    color = cmdline['--color']
+
+    print(f"{'format':>8} {'baseline':>9} {'compiled':>9} {'speedup':>8}")
+    for name in names:
+        template = FORMATS[name]
+        check(template, 2000, color)
+        before = timed(baseline, template, list(make_entries(count)), color)
+        after = timed(compiled, template, list(make_entries(count)), color)
+        print(f"{name:>8} {before:8.2f}s {after:8.2f}s {before/after:7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the time needed to start assimilate.
+
+Usage:
+    bench_startup.py [options]
+
+Options:
+    -n, --runs <N>      number of runs [default: 10]
+    -c, --check         only check that no deferred module is imported
+
+Imports assimilate.main in a fresh interpreter using 'python -X importtime' and
+reports the median cumulative import time of assimilate and of its heaviest
+dependencies.  Modules that are expected to be imported only when needed are
+listed below; if any of them are imported at startup, they are reported and the
+exit status is 1.  This allows the benchmark to be used to guard against
+regressions.
+"""
+
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from docopt import docopt
+
+# modules of interest
+MODULES = """
+    assimilate.main assimilate.assimilate assimilate.command assimilate.configs
+    assimilate.hooks assimilate.overdue arrow quantiphy voluptuous nestedtext
+    ntlog inform requests
+""".split()
+
+# modules that must not be imported at startup
+DEFERRED = """
+    requests concurrent.futures assimilate.sorting
+""".split()
+
+def import_times():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import assimilate.main"],
+        capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line.split("|")
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            pass  # header
+    return times
+
+def main():
+    cmdline = docopt(__doc__)
+    runs = 1 if cmdline['--check'] else int(cmdline['--runs'])
+
+    samples = defaultdict(list)
+    for i in range(runs):
+        for name, time in import_times().items():
+            samples[name].append(time)
+
+    if not cmdline['--check']:
+        print(f"{'module':>22} {'import time':>12}")
+        for name in MODULES:
+            if name in samples:
+                median = statistics.median(samples[name])
+                print(f"{name:>22} {median/1000:9.1f} ms")
+            else:
+                print(f"{name:>22} {'—':>12}")
+
+    deferred = [name for name in DEFERRED if name in samples]
+    if deferred:
+        print("imported at startup:", ", ".join(deferred))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# DESCRIPTION {{{1
+# Tests for the selection of archives by date, age, and index.  Run using:
+#     pytest test_archive_index.py
+
+# IMPORTS {{{1
+from assimilate.command import ArchiveIndex, age_option, count_option
+from inform import Error
+import arrow
+import pytest
+
+
+# UTILITIES {{{1
+# five archives a day apart, given out of order and without a time zone, so
+# they are taken to be in local time
+DAYS = [3, 1, 4, 0, 2]
+NEWEST = arrow.now().floor('second').shift(hours=-1)
+
+def make_archive(days_old):
+    time = NEWEST.shift(days=-days_old)
+    return dict(
+        id = f"{days_old:02d}" + 62*'a',
+        archive = f"a{days_old}",
+        time = time.naive.isoformat(timespec='microseconds'),
+    )
+
+@pytest.fixture
+def index():
+    return ArchiveIndex([make_archive(d) for d in DAYS])
+
+def names(index, start, stop):
+    return [a['archive'] for a in index.archives[start:stop]]
+
+
+# TESTS {{{1
+# ordering {{{2
+def test_ordered_oldest_first(index):
+    assert len(index) == 5
+    assert names(index, 0, 5) == ['a4', 'a3', 'a2', 'a1', 'a0']
+    assert list(index.times) == sorted(index.times)
+
+def test_time_zones():
+    # times with and without a time zone are placed on the same time line
+    naive = make_archive(1)
+    aware = dict(naive, time=arrow.get(naive['time'], tzinfo='local').isoformat())
+    assert ArchiveIndex([naive]).times[0] == ArchiveIndex([aware]).times[0]
+
+# first_not_older {{{2
+def test_first_not_older(index):
+    assert index.first_not_older(NEWEST.shift(days=-10)) == 0
+    assert index.first_not_older(NEWEST.shift(days=-4)) == 0
+    assert index.first_not_older(NEWEST.shift(days=-3, hours=-1)) == 1
+    assert index.first_not_older(NEWEST.shift(days=-3)) == 1
+    assert index.first_not_older(NEWEST.shift(minutes=-1)) == 4
+    assert index.first_not_older(NEWEST.shift(minutes=1)) == 5
+
+# by_index {{{2
+def test_by_index(index):
+    assert index.by_index(0)['archive'] == 'a0'
+    assert index.by_index(4)['archive'] == 'a4'
+    assert index.by_index(-1)['archive'] == 'a4'
+    with pytest.raises(IndexError):
+        index.by_index(5)
+
+# select by date or age {{{2
+@pytest.mark.parametrize(
+    "options, expected", [
+        ({}, ['a4', 'a3', 'a2', 'a1', 'a0']),
+        ({'--older': '2.5d'}, ['a4', 'a3']),
+        ({'--older': '10d'}, []),
+        ({'--newer': '2.5d'}, ['a2', 'a1', 'a0']),
+        ({'--newer': '10d'}, ['a4', 'a3', 'a2', 'a1', 'a0']),
+        ({'--oldest': '1.5d'}, ['a4', 'a3']),
+        ({'--oldest': '1d'}, ['a4', 'a3']),
+        ({'--newest': '1.5d'}, ['a1', 'a0']),
+        ({'--newest': '0d'}, ['a0']),
+        ({'--first': '2'}, ['a4', 'a3']),
+        ({'--last': '2'}, ['a1', 'a0']),
+        ({'--last': '9'}, ['a4', 'a3', 'a2', 'a1', 'a0']),
+        ({'--older': '1.5d', '--last': '2'}, ['a3', 'a2']),
+        ({'--newer': '3.5d', '--first': '2'}, ['a3', 'a2']),
+        ({'--oldest': '2.5d', '--last': '1'}, ['a2']),
+    ]
+)
+def test_select(index, options, expected):
+    assert names(index, *index.select(options)) == expected
+
+def test_select_by_date(index):
+    date = NEWEST.shift(days=-2, hours=-12).format('YYYY-MM-DD HH:mm:ss')
+    assert names(index, *index.select({'--older': date})) == ['a4', 'a3']
+    assert names(index, *index.select({'--newer': date})) == ['a2', 'a1', 'a0']
+
+def test_select_by_age_ignores_counts(index):
+    assert index.select_by_age({'--older': '1.5d', '--last': '1'}) == (0, 3)
+
+def test_select_empty():
+    assert ArchiveIndex([]).select({'--older': '1d', '--last': '2'}) == (0, 0)
+
+# options {{{2
+def test_incompatible_options(index):
+    with pytest.raises(Error) as exception:
+        index.select({'--older': '1d', '--newer': '1d'})
+    assert str(exception.value) == "incompatible options: --older, --newer."
+    with pytest.raises(Error) as exception:
+        index.select({'--first': '1', '--last': '1'})
+    assert str(exception.value) == "incompatible options: --first, --last."
+
+@pytest.mark.parametrize("value", ['0', '-1', 'two'])
+def test_bad_count(value):
+    with pytest.raises(Error) as exception:
+        count_option({'--last': value})
+    assert exception.value.get_culprit() == ('--last',)
+
+def test_bad_count_before_incompatible():
+    # each count is checked before the counts are found to be incompatible
+    with pytest.raises(Error) as exception:
+        count_option({'--first': 'nutz', '--last': '1'})
+    assert exception.value.get_culprit() == ('--first',)
+
+def test_options():
+    assert age_option({'--older': None, '--newest': '1w'}) == ('--newest', '1w')
+    assert age_option({}) == (None, None)
+    assert count_option({'--first': '3'}) == ('--first', 3)
+    assert count_option({'--first': None}) == (None, None)
@@ -0,0 +1,101 @@
+# DESCRIPTION {{{1
+# Tests for the summary by directory given by the diff command.  Run using:
+#     pytest test_churn.py
+
+# IMPORTS {{{1
+from assimilate.command import DirectoryChurn
+import pytest
+
+
+# UTILITIES {{{1
+def added(path, size):
+    return dict(path=path, changes=[dict(type='added', size=size)])
+
+def removed(path, size):
+    return dict(path=path, changes=[dict(type='removed', size=size)])
+
+def modified(path, plus, minus):
+    return dict(
+        path = path,
+        changes = [dict(type='modified', added=plus, removed=minus)],
+    )
+
+DIFFS = [
+    added('home/u/a/x', 100),
+    added('home/u/a/b/y', 200),
+    removed('home/u/a/b/c/z', 50),
+    modified('home/u/d/w', 10, 5),
+    added('home/u/v', 1),
+]
+
+def churn(root, depth, max_dirs=1000, diffs=DIFFS):
+    churn = DirectoryChurn(root, depth, max_dirs)
+    for diff in diffs:
+        churn.add(diff)
+    return churn
+
+
+# TESTS {{{1
+# truncate() {{{2
+@pytest.mark.parametrize(
+    "root, depth, directory, expected", [
+        ('home/u', 1, 'home/u/a/b/c', 'home/u/a'),
+        ('home/u', 2, 'home/u/a/b/c', 'home/u/a/b'),
+        ('home/u', 2, 'home/u/a', 'home/u/a'),
+        ('home/u', 0, 'home/u/a/b', 'home/u'),
+        ('home/u/', 1, 'home/u/a/b', 'home/u/a'),
+        ('', 1, 'home/u/a', 'home'),
+        ('', 0, 'home/u/a', ''),
+    ]
+)
+def test_truncate(root, depth, directory, expected):
+    assert DirectoryChurn(root, depth).truncate(directory) == expected
+
+# add() {{{2
+def test_add():
+    summary = churn('home/u', 1)
+    assert summary.dirs == {
+        'home/u/a': [300, 50, 0, 3],
+        'home/u/d': [0, 0, 15, 1],
+        'home/u': [1, 0, 0, 1],
+    }
+    assert not summary.reduced
+
+def test_deeper():
+    summary = churn('home/u', 3)
+    assert summary.dirs['home/u/a/b/c'] == [0, 50, 0, 1]
+    assert summary.dirs['home/u/a/b'] == [200, 0, 0, 1]
+
+def test_unknown_change():
+    # changes other than content are counted as changed files with no size
+    summary = churn('', 1, diffs=[dict(path='etc/hosts', changes=[dict(type='mode')])])
+    assert summary.dirs == {'etc': [0, 0, 0, 1]}
+
+# combine() {{{2
+def test_combine():
+    # exceeding max_dirs reduces the depth, totals are preserved
+    summary = churn('home/u', 3, max_dirs=3)
+    assert summary.reduced
+    assert summary.depth == 1
+    assert summary.dirs == churn('home/u', 1).dirs
+
+def test_combine_to_root():
+    summary = churn('home/u', 2, max_dirs=1)
+    assert summary.depth == 0
+    assert summary.dirs == {'home/u': [301, 50, 15, 5]}
+
+# render() {{{2
+def test_render():
+    lines = churn('', 0).render()
+    assert lines[0].split() == ['added', 'removed', 'modified', 'files', 'directory']
+    assert lines[1].split() == ['301', 'B', '50', 'B', '15', 'B', '5', '.']
+    assert lines[2].split() == ['301', 'B', '50', 'B', '15', 'B', '5', 'total']
+
+def test_render_sorted_with_totals():
+    lines = churn('home/u', 1).render()
+    assert [l.split()[-1] for l in lines[1:]] == [
+        'home/u', 'home/u/a', 'home/u/d', 'total'
+    ]
+    # directories without a kind of change show a dash
+    assert lines[3].split()[:2] == ['-', '-']
+    assert lines[-1].split()[-2] == '5'
@@ -0,0 +1,176 @@
+# DESCRIPTION {{{1
+# Tests for comparing local files to an archive without mounting it.  Run using:
+#     pytest test_compare.py
+
+# IMPORTS {{{1
+from assimilate.compare import (
+    Comparison, HASH_ALGORITHM, HASH_POOL_THRESHOLD, batches, hash_file,
+    to_microseconds
+)
+from datetime import datetime, timezone
+import json
+import os
+import stat
+import pytest
+
+
+# UTILITIES {{{1
+ARCHIVE_ROOT = "home/u/proj"
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "proj"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "main.py").write_text("print('hello')\n")
+    (root / "README").write_text("read me\n")
+    (root / "link").symlink_to("README")
+    return root
+
+def listing(root):
+    # the output of borg list --json-lines as if the archive held root as it is
+    lines = []
+    for path in [root] + sorted(root.rglob("*")):
+        st = path.lstat()
+        rel = path.relative_to(root).as_posix()
+        entry = dict(
+            type = stat.filemode(st.st_mode)[0],
+            path = f"{ARCHIVE_ROOT}/{rel}" if path != root else ARCHIVE_ROOT,
+        )
+        if entry['type'] == '-':
+            entry['size'] = st.st_size
+            mtime = datetime.fromtimestamp(st.st_mtime_ns // 1000 / 1e6)
+            entry['mtime'] = mtime.isoformat(timespec='microseconds')
+        elif entry['type'] == 'l':
+            entry['target'] = os.readlink(path)
+        lines.append(json.dumps(entry))
+    return lines
+
+def hashes(root, paths):
+    # the output of borg list with HASH_FORMAT
+    return [
+        json.dumps({
+            'path': f"{ARCHIVE_ROOT}/{rel}",
+            HASH_ALGORITHM: hash_file(root / rel),
+        })
+        for rel in paths
+    ]
+
+def compare(root, lines):
+    comparison = Comparison(root, ARCHIVE_ROOT + "/")
+    comparison.read_archive(lines)
+    comparison.compare()
+    return comparison
+
+
+# TESTS {{{1
+# to_microseconds() {{{2
+def test_to_microseconds():
+    assert to_microseconds("1970-01-01T00:00:00+00:00") == 0
+    assert to_microseconds("1970-01-01T00:00:01.000001+00:00") == 1_000_001
+    assert to_microseconds("2024-11-20T12:30:00.123456+01:00") == (
+        to_microseconds("2024-11-20T11:30:00.123456+00:00")
+    )
+
+def test_to_microseconds_local():
+    # times without a time zone are in local time
+    when = datetime(2024, 11, 20, 12, 30, 0, 123456)
+    expected = int(when.timestamp()) * 1_000_000 + 123456
+    assert to_microseconds(when.isoformat()) == expected
+
+def test_to_microseconds_exact():
+    # no precision is lost to floating point
+    when = datetime(2038, 1, 19, 3, 14, 7, 999999, tzinfo=timezone.utc)
+    assert to_microseconds(when.isoformat()) == 2**31 * 1_000_000 - 1
+
+# batches() {{{2
+def test_batches():
+    assert list(batches(list(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batches([], 2)) == []
+
+# paths {{{2
+def test_paths(tree):
+    comparison = Comparison(tree, ARCHIVE_ROOT + "/")
+    assert comparison.archive_path("") == ARCHIVE_ROOT
+    assert comparison.archive_path("src/main.py") == f"{ARCHIVE_ROOT}/src/main.py"
+    assert comparison.local_path("src/main.py") == str(tree / "src" / "main.py")
+    assert comparison.relative(ARCHIVE_ROOT) == ""
+    assert comparison.relative(f"{ARCHIVE_ROOT}/README") == "README"
+    assert comparison.relative(f"{ARCHIVE_ROOT}2/README") is None
+
+# compare() {{{2
+def test_unchanged(tree):
+    lines = listing(tree)
+    comparison = compare(tree, lines)
+    assert comparison.differences == []
+    assert comparison.suspects == []
+    assert comparison.num_files == len(lines) == 5
+
+def test_ignores_siblings(tree):
+    sibling = json.dumps(dict(type='-', path=f"{ARCHIVE_ROOT}2/x", size=1))
+    comparison = compare(tree, listing(tree) + [sibling])
+    assert comparison.differences == []
+
+def test_differences(tree):
+    lines = listing(tree)
+    (tree / "new").write_text("new\n")
+    (tree / "README").write_text("read me again\n")
+    (tree / "src" / "main.py").unlink()
+    (tree / "link").unlink()
+    (tree / "link").symlink_to("src")
+    comparison = compare(tree, lines)
+    assert sorted(comparison.differences) == [
+        ("added", "new"),
+        ("changed link", "link"),
+        ("modified", "README"),
+        ("removed", "src/main.py"),
+    ]
+
+def test_changed_type(tree):
+    lines = listing(tree)
+    (tree / "README").unlink()
+    (tree / "README").mkdir()
+    comparison = compare(tree, lines)
+    assert comparison.differences == [("changed type", "README")]
+
+def test_missing_root(tmp_path):
+    comparison = Comparison(tmp_path / "gone", ARCHIVE_ROOT)
+    comparison.read_archive([json.dumps(dict(type='d', path=ARCHIVE_ROOT))])
+    assert comparison.compare() == [("removed", "")]
+
+# confirm() {{{2
+def test_touched_is_suspect(tree):
+    # a file whose time alone differs is confirmed by comparing hashes
+    lines = listing(tree)
+    readme = tree / "README"
+    os.utime(readme, ns=(0, readme.stat().st_mtime_ns + 10_000_000))
+    comparison = compare(tree, lines)
+    assert comparison.differences == []
+    assert comparison.suspects == ["README"]
+    comparison.read_hashes(hashes(tree, comparison.suspects))
+    assert comparison.confirm() == []
+
+def test_same_size_edit_is_found(tree):
+    lines = listing(tree)
+    readme = tree / "README"
+    mtime = readme.stat().st_mtime_ns
+    readme.write_text("READ ME\n")
+    os.utime(readme, ns=(0, mtime + 10_000_000))
+    comparison = compare(tree, lines)
+    assert comparison.suspects == ["README"]
+    archive_hashes = [
+        json.dumps({'path': f"{ARCHIVE_ROOT}/README", HASH_ALGORITHM: 64*'0'})
+    ]
+    comparison.read_hashes(archive_hashes)
+    assert comparison.confirm() == [("modified", "README")]
+
+def test_confirm_in_pool(tmp_path):
+    # enough suspects to be hashed in a pool of processes
+    names = [f"f{i}" for i in range(HASH_POOL_THRESHOLD + 2)]
+    for name in names:
+        (tmp_path / name).write_text(name)
+    comparison = Comparison(tmp_path, ARCHIVE_ROOT)
+    comparison.suspects = names
+    archived = hashes(tmp_path, names)
+    archived[0] = json.dumps({'path': f"{ARCHIVE_ROOT}/f0", HASH_ALGORITHM: None})
+    comparison.read_hashes(archived)
+    assert comparison.confirm(jobs=2) == [("modified", "f0")]
@@ -0,0 +1,132 @@
+# DESCRIPTION {{{1
+# Tests for the index of the files contained in the archives.  Run using:
+#     pytest test_index.py
+
+# IMPORTS {{{1
+from assimilate.index import FileIndex
+import arrow
+import json
+import pytest
+
+
+# UTILITIES {{{1
+def archive(n):
+    return dict(
+        id = f"{n:02d}" + 62*'a',
+        name = f"home-{n}",
+        time = f"2026-01-{10+n:02d}T02:00:00.000000",
+    )
+
+def entry(path, size=10, kind='-', mtime="2026-01-01T12:00:00.000000"):
+    return json.dumps(dict(type=kind, path=path, size=size, mtime=mtime))
+
+FIRST = [
+    entry('home/u', kind='d', size=0),
+    entry('home/u/notes.txt', 10),
+    entry('home/u/src/main.py', 20),
+    entry('home/u/src/util.py', 30),
+]
+SECOND = [
+    entry('home/u/notes.txt', 15),
+    entry('home/u/src/main.py', 20),
+    entry('home/u/docs/notes.txt', 40),
+]
+
+@pytest.fixture
+def index(tmp_path):
+    index = FileIndex(tmp_path / 'home.index.db')
+    index.add_archive(archive(1), FIRST)
+    index.add_archive(archive(2), SECOND)
+    yield index
+    index.close()
+
+def paths(found):
+    return [(f['path'], f['archive']) for f in found]
+
+
+# TESTS {{{1
+# empty index {{{2
+def test_empty(tmp_path):
+    index = FileIndex(tmp_path / 'home.index.db')
+    assert not index
+    assert index.get_archive_ids() == set()
+    assert index.find('*') == []
+    assert index.lookup('home/u/notes.txt') == {}
+    assert not index
+
+# add_archive() {{{2
+def test_add_archive(tmp_path):
+    index = FileIndex(tmp_path / 'home.index.db')
+    assert index.add_archive(archive(1), FIRST) == 3  # directories are skipped
+    assert index
+    assert index.get_archive_ids() == {archive(1)['id']}
+
+def test_add_archive_again(index):
+    # adding an archive again replaces its files
+    index.add_archive(archive(1), FIRST[:2])
+    assert paths(index.find('*.py')) == [('home/u/src/main.py', 'home-2')]
+
+def test_interrupted_listing(index):
+    def lines():
+        yield entry('home/u/new.txt')
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        index.add_archive(archive(3), lines())
+    assert archive(3)['id'] not in index.get_archive_ids()
+    assert index.find('new.txt') == []
+
+# find() {{{2
+def test_find_by_name(index):
+    assert paths(index.find('notes.txt')) == [
+        ('home/u/docs/notes.txt', 'home-2'),
+        ('home/u/notes.txt', 'home-1'),
+        ('home/u/notes.txt', 'home-2'),
+    ]
+    assert paths(index.find('*.py')) == [
+        ('home/u/src/main.py', 'home-1'),
+        ('home/u/src/main.py', 'home-2'),
+        ('home/u/src/util.py', 'home-1'),
+    ]
+    assert index.find('u') == []  # directories are not indexed
+
+def test_find_by_path(index):
+    # a glob with a slash matches the whole path or any trailing part of it
+    assert paths(index.find('u/notes.txt')) == [
+        ('home/u/notes.txt', 'home-1'), ('home/u/notes.txt', 'home-2')
+    ]
+    assert paths(index.find('/home/u/notes.txt')) == paths(index.find('u/notes.txt'))
+    assert paths(index.find('src/*')) == paths(index.find('*.py'))
+    assert index.find('ome/u/notes.txt') == []
+
+def test_find_values(index):
+    found = index.find('util.py')
+    assert len(found) == 1
+    found = found[0]
+    assert found['type'] == '-'
+    assert found['size'] == 30
+    assert found['archive_id'] == archive(1)['id']
+    assert found['mtime'] == arrow.get("2026-01-01T12:00:00", tzinfo='local')
+    assert found['time'] == arrow.get("2026-01-11T02:00:00", tzinfo='local')
+
+# lookup() {{{2
+def test_lookup(index):
+    found = index.lookup('home/u/notes.txt')
+    assert found[archive(1)['id']]['size'] == 10
+    assert found[archive(2)['id']]['size'] == 15
+    found = index.lookup('home/u/src/util.py')
+    assert found[archive(1)['id']]['size'] == 30
+    assert found[archive(2)['id']] is None
+
+# remove_archives() {{{2
+def test_remove_archives(index):
+    index.remove_archives([archive(1)['id'], 'unknown'])
+    assert index.get_archive_ids() == {archive(2)['id']}
+    assert index.find('util.py') == []
+    assert paths(index.find('notes.txt')) == [
+        ('home/u/docs/notes.txt', 'home-2'), ('home/u/notes.txt', 'home-2')
+    ]
+    # paths that are no longer used are removed
+    connection = index.connect()
+    count, = connection.execute("select count(*) from paths").fetchone()
+    assert count == 3
+    index.remove_archives([])
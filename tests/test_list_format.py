@@ -0,0 +1,154 @@
+# DESCRIPTION {{{1
+# Tests for the compiled list formats used by the list command.  Run using:
+#     pytest test_list_format.py
+
+# IMPORTS {{{1
+from assimilate.command import SizeCache, compile_list_format, get_field_names
+from assimilate.utilities import to_arrow
+from inform import Error
+from quantiphy import Quantity
+import pytest
+
+
+# UTILITIES {{{1
+def entry(**kwargs):
+    values = dict(
+        path = "home/u/notes.txt",
+        mode = "-rw-r--r--",
+        target = "",
+        size = 1234567,
+        mtime = "2024-11-20T12:30:00.000000",
+        healthy = True,
+    )
+    values.update(kwargs)
+    return values
+
+
+# TESTS {{{1
+# field names {{{2
+def test_field_names():
+    assert get_field_names("{path}") == {'path'}
+    assert get_field_names("{mTime:YYYY} {Size:7.2b} {path}") == {
+        'mTime', 'Size', 'path'
+    }
+    # fields nested in format specifications and indexed fields
+    assert get_field_names("{mTime:{w}} {a.b} {c[0]}") == {'mTime', 'w', 'a', 'c'}
+
+def test_bad_template():
+    with pytest.raises(Error):
+        compile_list_format("{path")
+
+# plain fields {{{2
+def test_plain_fields():
+    render = compile_list_format("{path} {size}")
+    assert render(entry()) == "home/u/notes.txt 1234567"
+
+# types {{{2
+@pytest.mark.parametrize(
+    "mode, target, expected", [
+        ("-rw-r--r--", "", "home/u/x"),
+        ("drwxr-xr-x", "", "home/u/x/"),
+        ("lrwxrwxrwx", "y", "home/u/x@ —> y"),
+        ("hrw-r--r--", "home/u/y", "home/u/x links to home/u/y"),
+        ("prw-r--r--", "", "home/u/x|"),
+    ]
+)
+def test_type(mode, target, expected):
+    render = compile_list_format("{path}{Type}{extra}")
+    assert render(entry(path="home/u/x", mode=mode, target=target)) == expected
+
+# derived fields {{{2
+def test_only_referenced_fields_are_derived():
+    render = compile_list_format("{path}")
+    values = entry()
+    render(values)
+    assert not {'Type', 'extra', 'mTime', 'mAgo', 'Size'} & values.keys()
+
+def test_time():
+    render = compile_list_format("{mTime:YYYY-MM-DD HH:mm} {path}")
+    values = entry()
+    expected = to_arrow(values['mtime']).format("YYYY-MM-DD HH:mm")
+    assert render(values) == f"{expected} home/u/notes.txt"
+
+def test_missing_time():
+    # a time that Borg did not report is left for format_map to complain about
+    render = compile_list_format("{cTime} {path}")
+    with pytest.raises(KeyError):
+        render(entry())
+
+def test_ago():
+    render = compile_list_format("{mAgo}")
+    values = entry()
+    assert render(values) == to_arrow(values['mtime']).humanize()
+
+def test_size():
+    render = compile_list_format("{Size:7.2b} {path}")
+    expected = f"{Quantity(1234567, 'B'):7.2b}"
+    assert render(entry()) == f"{expected} home/u/notes.txt"
+    assert render(entry()) == f"{expected} home/u/notes.txt"
+
+def test_sizes_are_shared():
+    # entries of the same size share the formatted size
+    sizes = SizeCache()
+    assert sizes[1234567] is sizes[1234567]
+    assert f"{sizes[1234567]:7.2b}" == f"{Quantity(1234567, 'B'):7.2b}"
+
+# templates {{{2
+def test_literals_and_conversions():
+    render = compile_list_format("{{{path!r}}} '{size:>11,}' \\ \"")
+    assert render(entry()) == "{'home/u/notes.txt'} '  1,234,567' \\ \""
+
+def test_quoted_spec():
+    render = compile_list_format("{mTime:YYYY 'at' HH:mm} {path}")
+    values = entry()
+    expected = to_arrow(values['mtime']).format("YYYY 'at' HH:mm")
+    assert render(values) == f"{expected} home/u/notes.txt"
+
+@pytest.mark.parametrize(
+    "template, expected", [
+        ("{path:{width}}|", "home/u/notes.txt    |"),
+        ("{mTime.year} {path}", "2024 home/u/notes.txt"),
+        ("{path[0]}{Type}", "h"),
+    ]
+)
+def test_format_map(template, expected):
+    # templates that cannot be given as an f-string
+    render = compile_list_format(template)
+    assert render(entry(width=20)) == expected
+
+def test_unknown_key():
+    with pytest.raises(KeyError):
+        compile_list_format("{owner}")(entry())
+    with pytest.raises(KeyError):
+        compile_list_format("{owner.name}")(entry())
+
+def test_bad_spec():
+    with pytest.raises(ValueError):
+        compile_list_format("{size:q}")(entry())
+
+# health {{{2
+def test_health():
+    render = compile_list_format(
+        "{healthy} {path}",
+        healthy_color = lambda text: f"<ok>{text}",
+        broken_color = lambda text: f"<bad>{text}",
+    )
+    assert render(entry()) == "<ok>healthy home/u/notes.txt"
+    assert render(entry(healthy=False)) == "<bad>broken home/u/notes.txt"
+
+def test_health_not_referenced():
+    # lines are colored by health even if the template does not show it
+    render = compile_list_format(
+        "{path}",
+        healthy_color = lambda text: f"<ok>{text}",
+        broken_color = lambda text: f"<bad>{text}",
+    )
+    assert render(entry()) == "<ok>home/u/notes.txt"
+    assert render(entry(healthy=False)) == "<bad>home/u/notes.txt"
+    values = entry()
+    del values['healthy']
+    assert render(values) == "home/u/notes.txt"
+
+def test_no_color():
+    render = compile_list_format("{healthy} {path}")
+    assert render(entry(healthy=False)) == "broken home/u/notes.txt"
@@ -0,0 +1,93 @@
+# DESCRIPTION {{{1
+# Tests for the external sort used by the list command.  Run using:
+#     pytest test_sorting.py
+
+# IMPORTS {{{1
+from assimilate.sorting import ExternalSort, ENTRY_OVERHEAD
+from inform import Error
+import json
+import pytest
+
+
+# UTILITIES {{{1
+def sort(entries, key, reverse=False, max_memory=100_000_000, tmp_path=None):
+    sorter = ExternalSort(
+        key, reverse=reverse, max_memory=max_memory, temp_dir=tmp_path
+    )
+    with sorter:
+        for entry in entries:
+            sorter.add(json.dumps(entry).encode() + b'\n', entry)
+        return list(sorter), len(sorter.runs)
+
+def make_entries(sizes):
+    # entries that share sizes are told apart by their path
+    return [dict(path=f"f{i:03d}", size=size) for i, size in enumerate(sizes)]
+
+SIZES = [5, 3, 9, 3, 1, 5, 7, 3, 9, 0, 5, 2]
+
+
+# TESTS {{{1
+# in memory {{{2
+def test_in_memory(tmp_path):
+    entries = make_entries(SIZES)
+    result, runs = sort(entries, 'size', tmp_path=tmp_path)
+    assert runs == 0
+    assert result == sorted(entries, key=lambda e: e['size'])
+
+# spill {{{2
+def test_spill(tmp_path):
+    # a tiny memory budget forces every entry or two into its own run
+    entries = make_entries(SIZES)
+    result, runs = sort(entries, 'size', max_memory=ENTRY_OVERHEAD, tmp_path=tmp_path)
+    assert runs > 1
+    assert result == sorted(entries, key=lambda e: e['size'])
+
+# k-way merge {{{2
+@pytest.mark.parametrize('max_memory', [1, 300, 600, 1000, 100_000])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_merge(tmp_path, max_memory, reverse):
+    sizes = [(i * 7919) % 101 for i in range(200)]
+    entries = make_entries(sizes)
+    result, runs = sort(
+        entries, 'size', reverse=reverse, max_memory=max_memory, tmp_path=tmp_path
+    )
+    expected = sorted(entries, key=lambda e: e['size'])
+    if reverse:
+        expected.reverse()
+    assert result == expected
+
+# stability and ties {{{2
+@pytest.mark.parametrize('max_memory', [1, 400, 100_000])
+def test_ties_are_stable(tmp_path, max_memory):
+    # entries with the same key keep the order in which they were added
+    entries = make_entries(SIZES)
+    result, runs = sort(entries, 'size', max_memory=max_memory, tmp_path=tmp_path)
+    for size in set(SIZES):
+        paths = [e['path'] for e in result if e['size'] == size]
+        assert paths == sorted(paths)
+
+@pytest.mark.parametrize('max_memory', [1, 400, 100_000])
+def test_reverse_ties(tmp_path, max_memory):
+    # reversing gives the exact reverse of the ascending order, ties included
+    entries = make_entries(SIZES)
+    ascending, _ = sort(entries, 'size', max_memory=max_memory, tmp_path=tmp_path)
+    descending, _ = sort(
+        entries, 'size', reverse=True, max_memory=max_memory, tmp_path=tmp_path
+    )
+    assert descending == ascending[::-1]
+
+@pytest.mark.parametrize('max_memory', [1, 100_000])
+def test_no_key(tmp_path, max_memory):
+    entries = make_entries(SIZES)
+    result, _ = sort(entries, None, max_memory=max_memory, tmp_path=tmp_path)
+    assert result == entries
+    result, _ = sort(
+        entries, None, reverse=True, max_memory=max_memory, tmp_path=tmp_path
+    )
+    assert result == entries[::-1]
+
+# unknown key {{{2
+def test_unknown_key(tmp_path):
+    with pytest.raises(Error) as exception:
+        sort(make_entries(SIZES), 'owner', tmp_path=tmp_path)
+    assert str(exception.value) == 'owner: unknown key.'
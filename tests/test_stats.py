@@ -0,0 +1,87 @@
+# DESCRIPTION {{{1
+# Tests for the statistics reported by Borg.  Run using:
+#     pytest test_stats.py
+
+# IMPORTS {{{1
+from assimilate.stats import BorgStats, STATISTICS
+from inform import Error
+import json
+import pytest
+
+
+# UTILITIES {{{1
+CREATE_JSON = dict(
+    archive = dict(
+        name = "home-2026-01-10",
+        duration = 12.5,
+        stats = dict(
+            nfiles = 1024,
+            original_size = 50_000_000,
+            compressed_size = 20_000_000,
+            deduplicated_size = 1_000_000,
+        ),
+    ),
+    cache = dict(stats=dict(total_chunks=5000, total_unique_chunks=4000)),
+)
+
+
+# TESTS {{{1
+# from_dict() and as_dict() {{{2
+def test_round_trip():
+    stats = BorgStats(
+        duration=12.5, nfiles=1024, original_size=50_000_000, repo_size=10**9
+    )
+    recorded = json.loads(json.dumps(stats.as_dict()))
+    assert BorgStats.from_dict(recorded).as_dict() == stats.as_dict()
+
+def test_as_dict_omits_unreported():
+    stats = BorgStats(nfiles=3)
+    assert stats.as_dict() == {'nfiles': 3}
+    assert stats
+    assert not BorgStats()
+
+def test_from_dict_converts_and_ignores_unknown():
+    # values are converted to the type of the statistic and names that are not
+    # statistics, perhaps recorded by a later version, are ignored
+    stats = BorgStats.from_dict(dict(nfiles='12', duration='1.5', future=1))
+    assert stats.as_dict() == {'duration': 1.5, 'nfiles': 12}
+    assert set(stats.as_dict()) <= set(STATISTICS)
+
+def test_unknown_statistic():
+    with pytest.raises(Error):
+        BorgStats(future=1)
+
+# from_create_json() {{{2
+def test_from_create_json():
+    stats = BorgStats.from_create_json(json.dumps(CREATE_JSON))
+    assert stats.as_dict() == dict(
+        duration = 12.5,
+        nfiles = 1024,
+        original_size = 50_000_000,
+        compressed_size = 20_000_000,
+        deduplicated_size = 1_000_000,
+        unique_chunks = 4000,
+    )
+    assert stats.throughput == 4_000_000
+
+def test_from_bad_create_json():
+    with pytest.raises(Error):
+        BorgStats.from_create_json("not json")
+
+# from_compact_message() {{{2
+def test_from_compact_message():
+    stats = BorgStats()
+    assert stats.from_compact_message("Repository size is 1.50 GB")
+    assert stats.from_compact_message("Compaction saved 12.3 MB.")
+    assert not stats.from_compact_message("Starting compaction")
+    assert stats.as_dict() == dict(
+        repo_size = 1_500_000_000, compaction_saved = 12_300_000
+    )
+
+# render() {{{2
+def test_render():
+    stats = BorgStats(nfiles=1024, original_size=50_000_000)
+    assert stats.render() == {
+        'number of files': '1024', 'original size': '50 MB'
+    }
+    assert stats.render(['nfiles']) == {'number of files': '1024'}
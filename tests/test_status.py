@@ -0,0 +1,172 @@
+# DESCRIPTION {{{1
+# Tests for the status database that holds the history of the runs, the
+# undelivered monitoring signals, and the archives left mounted.  Run using:
+#     pytest test_status.py
+
+# IMPORTS {{{1
+from assimilate.stats import BorgStats
+from assimilate.status import StatusStore
+import arrow
+import nestedtext as nt
+import pytest
+
+
+# UTILITIES {{{1
+START = arrow.get("2026-01-10T02:00:00", tzinfo='local')
+
+@pytest.fixture
+def store(tmp_path):
+    store = StatusStore(tmp_path)
+    yield store
+    store.close()
+
+def add_run(store, config, command, hour, succeeded=True, **kwargs):
+    started = START.shift(hours=hour)
+    store.add_run(
+        config, command, started, started.shift(minutes=10),
+        0 if succeeded else 2, succeeded, **kwargs
+    )
+
+
+# TESTS {{{1
+# runs {{{2
+def test_empty_store(store):
+    assert store.get_runs() == []
+    assert store.get_mounts() == []
+    assert not store.path.exists()
+
+def test_runs(store):
+    add_run(store, 'home', 'create', 0)
+    add_run(store, 'home', 'prune', 1)
+    add_run(store, 'home', 'create', 2, succeeded=False)
+    add_run(store, 'work', 'create', 3)
+
+    runs = store.get_runs()
+    assert [(r['config'], r['command']) for r in runs] == [
+        ('work', 'create'), ('home', 'create'), ('home', 'prune'),
+        ('home', 'create'),
+    ]
+    assert [r['succeeded'] for r in runs] == [True, False, True, True]
+    assert runs[-1]['started'] == START
+    assert runs[-1]['ended'] == START.shift(minutes=10)
+
+    runs = store.get_runs(config='home', command='create')
+    assert [r['status'] for r in runs] == [2, 0]
+    assert len(store.get_runs(config='home', limit=2)) == 2
+    assert len(store.get_runs(since=START.shift(hours=1, minutes=10))) == 3
+
+def test_run_stats(store):
+    stats = BorgStats(nfiles=10, original_size=2048, duration=1.5)
+    add_run(store, 'home', 'create', 0, repo_size=1e9, stats=stats.as_dict())
+    add_run(store, 'home', 'check', 1)
+    check, create = store.get_runs()
+    assert check['stats'] is None
+    assert check['repo_size'] is None
+    assert create['repo_size'] == 1e9
+    assert create['repo_size'].units == 'B'
+    assert create['stats'].as_dict() == stats.as_dict()
+
+# latest {{{2
+def test_latest_from_history(store):
+    add_run(store, 'home', 'create', 0, repo_size=1e9)
+    add_run(store, 'home', 'create', 2, succeeded=False)
+    add_run(store, 'home', 'prune', 1)
+    add_run(store, 'work', 'create', 3)
+    latest = store.get_latest('home')
+    assert latest['create last run'] == START.shift(minutes=10)
+    assert latest['prune last run'] == START.shift(hours=1, minutes=10)
+    assert latest['repository size'] == 1e9
+
+def test_latest_merges_date_file(store, tmp_path):
+    date_file = tmp_path / 'home.latest.nt'
+    nt.dump(
+        {
+            'create last run': START.shift(days=-1).isoformat(),
+            'check last run': START.shift(days=-2).isoformat(),
+            'create stats': {'nfiles': '10'},
+        },
+        date_file
+    )
+    # the date file is used alone when there is no history
+    latest = store.get_latest('home', date_file)
+    assert latest['create last run'] == START.shift(days=-1)
+
+    # the history overrides the date file, which supplies what it lacks
+    add_run(store, 'home', 'create', 0)
+    latest = store.get_latest('home', date_file)
+    assert latest['create last run'] == START.shift(minutes=10)
+    assert latest['check last run'] == START.shift(days=-2)
+    assert latest['create stats'] == {'nfiles': '10'}
+
+def test_latest_without_date_file(store, tmp_path):
+    date_file = tmp_path / 'home.latest.nt'
+    with pytest.raises(OSError):
+        store.get_latest('home', date_file)
+    add_run(store, 'home', 'create', 0)
+    assert store.get_latest('home', date_file) == {
+        'create last run': START.shift(minutes=10)
+    }
+
+# outbox {{{2
+def test_outbox(store):
+    def entry(minutes, url):
+        return dict(
+            time = START.shift(minutes=minutes), result = 'success',
+            request = dict(method='get', url=url),
+        )
+    store.add_undelivered('home', 'custom', [entry(2, 'b'), entry(1, 'a')], 10)
+    store.add_undelivered('home', 'healthchecks', [entry(3, 'c')], 10)
+    store.add_undelivered('work', 'custom', [entry(4, 'd')], 10)
+
+    taken = store.take_undelivered('home', 'custom')
+    assert [e['request']['url'] for e in taken] == ['a', 'b']
+    assert taken[0]['time'] == START.shift(minutes=1)
+    assert taken[0]['result'] == 'success'
+    assert taken[0]['config'] == 'home'
+    assert taken[0]['service'] == 'custom'
+
+    # taken signals are removed
+    assert store.take_undelivered('home', 'custom') == []
+    taken = store.take_undelivered()
+    assert [e['request']['url'] for e in taken] == ['c', 'd']
+    assert store.take_undelivered() == []
+
+def test_outbox_limit(store):
+    entries = [
+        dict(time=START.shift(minutes=i), result=None, request=dict(n=i))
+        for i in range(5)
+    ]
+    store.add_undelivered('home', 'custom', entries, 3)
+    store.add_undelivered('home', 'other', entries[:1], 3)
+    taken = store.take_undelivered('home', 'custom')
+    assert [e['request']['n'] for e in taken] == [2, 3, 4]
+    assert len(store.take_undelivered('home', 'other')) == 1
+
+# mounts {{{2
+def test_mounts(store, tmp_path):
+    for name in ('a', 'b'):
+        store.add_mount(
+            'home', f"aid:{name}", tmp_path / name, tmp_path / 'home.lock',
+            'borg', 600
+        )
+    store.add_mount(
+        'work', 'aid:c', tmp_path / 'c', tmp_path / 'work.lock', 'borg', 60
+    )
+    mounts = store.get_mounts()
+    assert [m['archive'] for m in mounts] == ['aid:a', 'aid:b', 'aid:c']
+    mount = mounts[0]
+    assert mount['mount_point'] == str(tmp_path / 'a')
+    assert mount['lock_file'] == str(tmp_path / 'home.lock')
+    assert mount['ttl'] == 600
+    assert isinstance(mount['last_used'], arrow.Arrow)
+
+    assert len(store.get_mounts(config='home')) == 2
+    assert len(store.get_mounts(archive='aid:c')) == 1
+
+    # using a mount makes it the most recently used
+    store.touch_mount(tmp_path / 'a')
+    mounts = store.get_mounts(config='home')
+    assert [m['archive'] for m in mounts] == ['aid:b', 'aid:a']
+
+    store.remove_mount(tmp_path / 'a')
+    assert [m['archive'] for m in store.get_mounts()] == ['aid:b', 'aid:c']
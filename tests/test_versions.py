@@ -0,0 +1,143 @@
+# DESCRIPTION {{{1
+# Tests for finding the versions of a file held in the archives.  Run using:
+#     pytest test_versions.py
+
+# IMPORTS {{{1
+from assimilate.compare import HASH_ALGORITHM, to_microseconds
+from assimilate.versions import (
+    VersionCache, group_versions, merge_versions, needs_hash, read_hash,
+    read_version,
+)
+import json
+import pytest
+
+
+# UTILITIES {{{1
+ARCHIVES = [dict(id=f"{n:02d}" + 62*'a', name=f"home-{n}") for n in range(6)]
+
+def meta(size=10, mtime=1, kind='-', hash=None):
+    metadata = dict(type=kind, size=size, mtime=mtime)
+    if hash:
+        metadata['hash'] = hash
+    return metadata
+
+def found(*metadata):
+    return {a['id']: m for a, m in zip(ARCHIVES, metadata)}
+
+def names(version):
+    return [a['name'] for a in version['archives']]
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = VersionCache(tmp_path / 'home.versions.db')
+    yield cache
+    cache.close()
+
+
+# TESTS {{{1
+# read_version() and read_hash() {{{2
+def test_read_version():
+    lines = [
+        json.dumps(dict(type='d', path='home/u', size=0)),
+        json.dumps(dict(
+            type='-', path='home/u/notes.txt', size=10,
+            mtime='2026-01-01T12:00:00.000000',
+        )),
+    ]
+    assert read_version('home/u/notes.txt', lines) == dict(
+        type='-', size=10, mtime=to_microseconds('2026-01-01T12:00:00.000000')
+    )
+    assert read_version('home/u/other.txt', lines) is None
+
+def test_read_hash():
+    lines = [json.dumps({'path': 'home/u/notes.txt', HASH_ALGORITHM: 'abc'})]
+    assert read_hash('home/u/notes.txt', lines) == 'abc'
+    assert read_hash('home/u/other.txt', lines) is None
+
+# group_versions() {{{2
+def test_group_versions():
+    versions = group_versions(
+        ARCHIVES, found(None, meta(), meta(), meta(20), None, meta(20))
+    )
+    assert [names(v) for v in versions] == [
+        ['home-0'], ['home-1', 'home-2'], ['home-3'], ['home-4'], ['home-5'],
+    ]
+    assert [v['metadata'] and v['metadata']['size'] for v in versions] == [
+        None, 10, 20, None, 20
+    ]
+
+def test_group_versions_keeps_hash():
+    # the hash known for any archive of a version is kept
+    versions = group_versions(ARCHIVES[:3], found(meta(), meta(hash='h'), meta()))
+    assert len(versions) == 1
+    assert versions[0]['metadata']['hash'] == 'h'
+
+def test_group_versions_unqueried():
+    # archives that are not in found are taken not to hold the file
+    versions = group_versions(ARCHIVES[:2], {})
+    assert len(versions) == 1
+    assert versions[0]['metadata'] is None
+
+# needs_hash() {{{2
+def test_needs_hash():
+    versions = group_versions(
+        ARCHIVES,
+        found(meta(mtime=1), meta(mtime=2), meta(20, 3), meta(20, 4, hash='h'),
+              meta(kind='l', mtime=5), meta(kind='l', mtime=6))
+    )
+    wanted = needs_hash(versions)
+    assert [names(v) for v in wanted] == [['home-0'], ['home-1'], ['home-2']]
+
+def test_needs_no_hash():
+    versions = group_versions(ARCHIVES[:3], found(meta(), None, meta(mtime=2)))
+    assert needs_hash(versions) == []
+
+# merge_versions() {{{2
+def test_merge_versions():
+    versions = group_versions(
+        ARCHIVES[:4],
+        found(meta(mtime=1, hash='a'), meta(mtime=2, hash='a'),
+              meta(mtime=3, hash='b'), meta(mtime=4, hash='b'))
+    )
+    merged = merge_versions(versions)
+    assert [names(v) for v in merged] == [
+        ['home-0', 'home-1'], ['home-2', 'home-3']
+    ]
+    # the merged version takes the metadata of the most recent
+    assert [v['metadata']['mtime'] for v in merged] == [2, 4]
+
+def test_merge_versions_needs_hashes():
+    versions = group_versions(
+        ARCHIVES[:3], found(meta(mtime=1), meta(mtime=2), meta(mtime=3, hash='a'))
+    )
+    assert merge_versions(versions) == versions
+
+# VersionCache {{{2
+def test_cache(cache):
+    path = 'home/u/notes.txt'
+    assert cache.get(path) == {}
+    cache.add(path, ARCHIVES[0]['id'], meta(hash='h'))
+    cache.add(path, ARCHIVES[1]['id'], None)
+    cache.add('home/u/other.txt', ARCHIVES[1]['id'], meta(20))
+    assert cache.get(path) == {
+        ARCHIVES[0]['id']: meta(hash='h'),
+        ARCHIVES[1]['id']: None,
+    }
+
+    # adding again replaces what was found
+    cache.add(path, ARCHIVES[1]['id'], meta(30))
+    assert cache.get(path)[ARCHIVES[1]['id']] == dict(meta(30), hash=None)
+
+def test_cache_forget(cache):
+    for archive in ARCHIVES[:3]:
+        cache.add('home/u/notes.txt', archive['id'], meta())
+    cache.forget([ARCHIVES[1]['id'], 'unknown'])
+    assert list(cache.get('home/u/notes.txt')) == [ARCHIVES[1]['id']]
+
+def test_cache_persists(tmp_path):
+    cache = VersionCache(tmp_path / 'home.versions.db')
+    cache.add('home/u/notes.txt', ARCHIVES[0]['id'], None)
+    cache.close()
+    cache = VersionCache(tmp_path / 'home.versions.db')
+    assert cache.get('home/u/notes.txt') == {ARCHIVES[0]['id']: None}
+    cache.close()